@@ -1,8 +1,9 @@
 import time
-import requests
 import logging
 
 from google.oauth2 import service_account
+from lens_client.lens_client import LensClient
+from auth.token_cache import TokenCache, token_expiry, EXPIRY_SKEW_SECONDS
 
 # If modifying these scopes, delete the file token.json.
 SCOPES = ["https://www.googleapis.com/auth/spreadsheets",
@@ -10,39 +11,134 @@ SCOPES = ["https://www.googleapis.com/auth/spreadsheets",
 
 logger = logging.getLogger(__name__)
 
+# sentinel and segment headers are added per request by the client
+AUTH_HEADERS = {
+    "DNT": "1",
+    "Sec-GPC": "1",
+    "Priority": "u=0"
+}
+
+# exchanges a refresh token for a new token pair, same outcome shape as Authenticate
+REFRESH_MUTATION = """mutation RefreshAuthentication($input: RefreshAuthenticationInput!) {
+  refreshAuthentication(input: $input) {
+    didSucceed
+    error
+    outcome {
+      accessToken
+      refreshToken
+      __typename
+    }
+    __typename
+  }
+}"""
+
 
 class Authenticate:
-    def __init__(self, email: str, password: str, mfaAudience: bool = False, segmentID: str = ""):
+    def __init__(self, email: str, password: str, mfaAudience: bool = False, segmentID: str = "", client: LensClient = None, token_cache: TokenCache = None):
         self.email = email
         self.password = password
         self.mfaAudience = mfaAudience
         self.segmentID = segmentID
+        self.token_cache = token_cache
+        # the authenticated LensClient is the session handed to FetchCSV
+        self.client = client if client is not None else LensClient(segmentID)
+        self.client.reauthenticate = self.reauthenticate_async
 
     def login(self):
-        LOGIN_URL = "https://lens.m1.com/graphql"
-
-        # Dynamic Timestamp for the sentinel header
-        current_time_ms = str(int(time.time() * 1000))
-
-        HEADERS = {
-            "Host": "lens.m1.com",
-            "Accept": "*/*",
-            "Accept-Language": "en-US,en;q=0.5",
-            "Referer": "https://dashboard.m1.com/",
-            "content-type": "application/json",
-            "x-client-sentinel": current_time_ms,
-            "x-segment-id": self.segmentID,
-            "x-apollo-operation-name": "Authenticate",
-            "Origin": "https://dashboard.m1.com",
-            "Connection": "keep-alive",
-            "Sec-Fetch-Dest": "empty",
-            "Sec-Fetch-Mode": "cors",
-            "Sec-Fetch-Site": "same-site",
-            "DNT": "1",
-            "Sec-GPC": "1",
-            "Priority": "u=0"
-        }
+        return self.client.run(self.login_async())
+
+    async def login_async(self):
+        """
+        Reuses a cached access token while it is valid, then tries the cached
+        refresh token, and only runs a full credential login as a last resort
+
+        :return: authenticated LensClient or None if every option failed
+        """
+        if self.token_cache is not None:
+            cached = self.token_cache.load(self.email)
+            if TokenCache.is_valid(cached):
+                logger.info("Reusing cached M1 access token.")
+                self.client.access_token = cached["access_token"]
+                self.client.refresh_token = cached.get("refresh_token", "")
+                return self.client
+            if cached and cached.get("refresh_token"):
+                session = await self.refresh_async(cached["refresh_token"])
+                if session:
+                    return session
+        return await self.credential_login_async()
+
+    def ensure_fresh(self):
+        return self.client.run(self.ensure_fresh_async())
 
+    async def ensure_fresh_async(self):
+        """
+        Renews the client's access token when it is about to expire, for
+        long-running processes that keep one client between cycles
+
+        :return: authenticated LensClient or None if renewal failed
+        """
+        expires_at = token_expiry(self.client.access_token) if self.client.access_token else 0
+        if expires_at is None or expires_at - EXPIRY_SKEW_SECONDS > time.time():
+            return self.client
+        if self.client.refresh_token:
+            session = await self.refresh_async(self.client.refresh_token)
+            if session:
+                return session
+        return await self.credential_login_async()
+
+    async def reauthenticate_async(self):
+        """
+        Called by the client when the server rejects the access token
+
+        :return: True if a new access token was obtained
+        """
+        logger.warning("M1 rejected the access token. Re-authenticating.")
+        if self.token_cache is not None:
+            self.token_cache.clear(self.email)
+        session = None
+        if self.client.refresh_token:
+            session = await self.refresh_async(self.client.refresh_token)
+        if not session:
+            session = await self.credential_login_async()
+        return bool(session and session.access_token)
+
+    def _store_tokens(self, data, operation):
+        outcome = ((data.get("data") or {}).get(operation) or {}).get("outcome") or {}
+        self.client.access_token = outcome.get("accessToken", "")
+        self.client.refresh_token = outcome.get("refreshToken", "")
+        if self.token_cache is not None and self.client.access_token:
+            self.token_cache.save(self.email, self.client.access_token, self.client.refresh_token)
+        return self.client
+
+    async def refresh_async(self, refresh_token: str):
+        """
+        Exchanges a refresh token for a new access token
+
+        :return: authenticated LensClient or None if the refresh failed
+        """
+        try:
+            data = await self.client.graphql(
+                "RefreshAuthentication",
+                REFRESH_MUTATION,
+                {"input": {"refreshToken": refresh_token}},
+                authenticated=False,
+                extra_headers=AUTH_HEADERS,
+                persisted=False,
+            )
+            result = (data.get("data") or {}).get("refreshAuthentication") or {}
+            if "errors" in data or not result.get("didSucceed"):
+                logger.info("Refresh token was not accepted. Falling back to credential login.")
+                return None
+            session = self._store_tokens(data, "refreshAuthentication")
+            if not session.access_token:
+                return None
+            logger.info("Refreshed M1 access token.")
+            return session
+        except Exception:
+            logger.exception("Failed to refresh M1 access token.")
+            return None
+
+    async def credential_login_async(self):
         qry = """mutation Authenticate($input: AuthenticateInput!) {
   authenticate(input: $input) {
     didSucceed
@@ -64,25 +160,19 @@ class Authenticate:
   }
     }"""
 
-        payload = {
-            "operationName": "Authenticate",
-            "query": qry,
-            "variables": {
-                "input": {
-                    "mfaAudience": self.mfaAudience,  # FIXED: Sends raw boolean false, not "false"
-                    "password": self.password,
-                    "username": self.email,
-                }
-            },
+        variables = {
+            "input": {
+                "mfaAudience": self.mfaAudience,  # FIXED: Sends raw boolean false, not "false"
+                "password": self.password,
+                "username": self.email,
+            }
         }
 
-        session = requests.Session()
-        response = session.post(LOGIN_URL, json=payload, headers=HEADERS)
         try:
-            data = response.json()
-            session.access_token = data.get("data", {}).get("authenticate", {}).get("outcome", {}).get("accessToken", "")
-            session.refresh_token = data.get("data", {}).get("authenticate", {}).get("outcome", {}).get("refreshToken", "")
-            return session
+            data = await self.client.graphql(
+                "Authenticate", qry, variables, authenticated=False, extra_headers=AUTH_HEADERS, persisted=False
+            )
+            return self._store_tokens(data, "authenticate")
         except Exception:
             logger.exception("Failed to authenticate.")
             return None
@@ -0,0 +1,104 @@
+"""
+On-disk cache of M1 access and refresh tokens.
+
+Tokens are stored per login (keyed by a hash of the email, never the email
+itself) in a JSON file that is only readable by the current user, so the
+next run can skip the credential login.
+"""
+
+import os
+import json
+import time
+import base64
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+# used when the access token carries no readable expiry
+DEFAULT_TOKEN_TTL_SECONDS = 15 * 60
+# treat tokens this close to expiry as already expired
+EXPIRY_SKEW_SECONDS = 60
+
+
+def token_expiry(token: str):
+    """
+    Reads the exp claim of a JWT without verifying it
+
+    :param token: access token
+    :return: expiry as a unix timestamp, or None if the token is not a readable JWT
+    """
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        exp = json.loads(base64.urlsafe_b64decode(payload)).get("exp")
+        return float(exp) if exp is not None else None
+    except Exception:
+        return None
+
+
+class TokenCache:
+    def __init__(self, path: str):
+        self.path = path
+
+    @staticmethod
+    def _key(email: str):
+        return hashlib.sha256((email or "").strip().lower().encode("utf-8")).hexdigest()
+
+    def _read(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as token_file:
+                return json.load(token_file)
+        except Exception:
+            logger.warning("Token cache %s is unreadable. Ignoring it.", self.path)
+            return {}
+
+    def _write(self, data):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        # create the file owner-only before any token is written to it
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as token_file:
+            json.dump(data, token_file)
+        os.chmod(tmp_path, 0o600)
+        os.replace(tmp_path, self.path)
+
+    def load(self, email: str):
+        """
+        :return: dict with access_token, refresh_token and expires_at, or None
+        """
+        return self._read().get(self._key(email))
+
+    def save(self, email: str, access_token: str, refresh_token: str):
+        if not access_token:
+            return
+        expires_at = token_expiry(access_token) or time.time() + DEFAULT_TOKEN_TTL_SECONDS
+        data = self._read()
+        data[self._key(email)] = {
+            "access_token": access_token,
+            "refresh_token": refresh_token,
+            "expires_at": expires_at,
+        }
+        try:
+            self._write(data)
+        except OSError:
+            logger.exception("Could not write token cache %s.", self.path)
+
+    def clear(self, email: str):
+        data = self._read()
+        if data.pop(self._key(email), None) is not None:
+            try:
+                self._write(data)
+            except OSError:
+                logger.exception("Could not write token cache %s.", self.path)
+
+    @staticmethod
+    def is_valid(entry):
+        """
+        :param entry: cache entry returned by load
+        :return: True if the cached access token has not expired yet
+        """
+        return bool(entry and entry.get("access_token")) and \
+            entry.get("expires_at", 0) - EXPIRY_SKEW_SECONDS > time.time()
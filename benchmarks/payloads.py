@@ -0,0 +1,132 @@
+"""
+Synthetic lens.m1.com responses for the offline benchmarks.
+
+Pages are shaped like the AccountTaxLots and InvestmentsTablePagination
+responses FetchCSV pages through, hold the fields the datasets select and
+are generated from a fixed seed, so every run sees the same bytes.
+"""
+
+import json
+import base64
+import random
+from datetime import date, timedelta
+
+# page sizes FetchCSV requests
+TAX_LOTS_PAGE_SIZE = 2000
+HOLDINGS_PAGE_SIZE = 100
+SYMBOL_COUNT = 500
+SEED = 1
+
+FIRST_ACQUISITION = date(2015, 1, 2)
+HISTORY_DAYS = 3650
+
+
+def _symbols(rng, count: int = SYMBOL_COUNT):
+    letters = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+    symbols = {}
+    while len(symbols) < count:
+        symbols["".join(rng.choice(letters) for _ in range(rng.randint(2, 4)))] = None
+    return [(symbol, f"{rng.randrange(10 ** 8):08d}{rng.randrange(10)}") for symbol in symbols]
+
+
+def _lot_id(index: int):
+    # M1 ids are opaque base64 strings
+    return base64.b64encode(f"TaxLot:{index:010d}".encode()).decode()
+
+
+def tax_lot_node(rng, index: int, symbols, closed: bool = True):
+    """
+    :return: one AccountTaxLots node with every selected field
+    """
+    symbol, cusip = rng.choice(symbols)
+    acquired = FIRST_ACQUISITION + timedelta(days=rng.randrange(HISTORY_DAYS))
+    quantity = round(rng.uniform(0.001, 50), 6)
+    cost_basis = round(quantity * rng.uniform(5, 500), 2)
+    node = {
+        "symbol": symbol,
+        "cusip": cusip,
+        "acquisitionDate": acquired.isoformat(),
+        "quantity": quantity,
+        "costBasis": cost_basis,
+        "shortLongTermHolding": "LONG" if rng.random() < 0.6 else "SHORT",
+        "unrealizedGainLoss": None,
+        "closeDate": None,
+        "shortTermRealizedGainLoss": None,
+        "longTermRealizedGainLoss": None,
+        "washSaleIndicator": rng.random() < 0.02,
+        "id": _lot_id(index),
+    }
+    gain = round(cost_basis * rng.uniform(-0.4, 0.8), 2)
+    if closed:
+        closed_on = acquired + timedelta(days=rng.randrange(1, 1500))
+        node["closeDate"] = closed_on.isoformat()
+        term = "longTermRealizedGainLoss" if closed_on > acquired + timedelta(days=365) else "shortTermRealizedGainLoss"
+        node[term] = gain
+    else:
+        node["unrealizedGainLoss"] = gain
+    return node
+
+
+def holding_node(rng, index: int, symbols):
+    """
+    :return: one InvestmentsTablePagination position node with every selected field
+    """
+    symbol, _ = symbols[index % len(symbols)]
+    if index >= len(symbols):
+        # one position per symbol, larger portfolios get share class style suffixes
+        symbol = f"{symbol}.{index // len(symbols)}"
+    quantity = round(rng.uniform(0.001, 500), 6)
+    average_price = round(rng.uniform(5, 500), 2)
+    cost = round(quantity * average_price, 2)
+    value = round(cost * rng.uniform(0.6, 1.8), 2)
+    return {
+        "positionSecurity": {"symbol": symbol, "descriptor": f"{symbol} Holdings Inc"},
+        "quantity": quantity,
+        "cost": {"averageSharePrice": average_price, "cost": cost},
+        "value": {"value": value},
+        "unrealizedGain": {"gain": round(value - cost, 2), "gainPercent": round((value - cost) / cost * 100, 2)},
+        "marginability": {"maintenanceEquityRequirementPercent": rng.choice([25, 30, 50, 100, None])},
+    }
+
+
+def _pages(nodes_of_page, count: int, page_size: int, wrap):
+    pages = []
+    for start in range(0, count, page_size):
+        end = min(start + page_size, count)
+        connection = {
+            "pageInfo": {"hasNextPage": end < count, "endCursor": base64.b64encode(str(end).encode()).decode()},
+            "edges": [{"node": node} for node in nodes_of_page(start, end)],
+        }
+        pages.append(json.dumps(wrap(connection), separators=(",", ":")).encode())
+    return pages
+
+
+def tax_lot_pages(count: int, closed: bool = True, page_size: int = TAX_LOTS_PAGE_SIZE, seed: int = SEED):
+    """
+    :param count: number of lots
+    :param closed: closed lots (with close dates and realized gains) or open lots
+    :return: list of response bodies (bytes), one per page
+    """
+    rng = random.Random(seed)
+    symbols = _symbols(rng)
+    return _pages(
+        lambda start, end: [tax_lot_node(rng, index, symbols, closed) for index in range(start, end)],
+        count,
+        page_size,
+        lambda connection: {"data": {"node": {"taxLots": connection}}},
+    )
+
+
+def holding_pages(count: int, page_size: int = HOLDINGS_PAGE_SIZE, seed: int = SEED):
+    """
+    :param count: number of positions
+    :return: list of response bodies (bytes), one per page
+    """
+    rng = random.Random(seed)
+    symbols = _symbols(rng)
+    return _pages(
+        lambda start, end: [holding_node(rng, index, symbols) for index in range(start, end)],
+        count,
+        page_size,
+        lambda connection: {"data": {"account": {"balance": {"investments": {"positions": connection}}}}},
+    )
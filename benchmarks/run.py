@@ -0,0 +1,276 @@
+"""
+Offline micro-benchmarks of the fetch, flatten and publish hot paths.
+
+Every step runs on synthetic AccountTaxLots and InvestmentsTablePagination
+pages (benchmarks.payloads), nothing is sent to M1 or Google. Each step is
+timed over a few runs and then run once more under tracemalloc for its peak
+allocation. The results are written as a JSON baseline, and comparing a run
+against an older baseline shows which steps got slower or use more memory.
+
+Run from the repository root:
+
+    python -m benchmarks.run --label baseline
+    python -m benchmarks.run --sizes 1000 10000 --compare benchmarks/baselines/baseline.json
+
+Without --label or --output every run gets its own timestamped file, and a
+run never writes over the file it is compared against.
+"""
+
+import os
+import gc
+import sys
+import json
+import time
+import logging
+import argparse
+import platform
+import tempfile
+import tracemalloc
+from datetime import datetime, timezone
+from importlib import metadata
+from statistics import mean
+
+from benchmarks.payloads import tax_lot_pages, holding_pages
+from fetch_csv.fetch_csv import TAX_LOTS_DATASET, HOLDINGS_DATASET
+from fetch_csv.query_builder import apply_dtypes
+from generateCSV.generateCSV import GenerateCSV, read_output
+from lens_client import lens_client
+from lens_client.lens_client import decode_json
+from spreadsheets.spreadsheetManager import spreadsheetManager
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+DEFAULT_SIZES = [1_000, 10_000, 100_000, 1_000_000]
+# a step this much slower, or allocating this much more, than the baseline is reported
+DEFAULT_THRESHOLD = 1.2
+PACKAGES = ["numpy", "pandas", "pyarrow", "msgspec", "orjson", "gspread"]
+
+
+class PayloadWorksheet:
+    """Stands in for a gspread Worksheet and keeps the values it was sent."""
+
+    id = 0
+
+    def __init__(self, title: str):
+        self.title = title
+        self.values = None
+
+    def clear(self):
+        self.values = None
+
+    def update(self, values, *args, **kwargs):
+        self.values = values
+
+
+def sheet_manager():
+    """
+    :return: spreadsheetManager whose worksheets are PayloadWorksheets, so
+        create_*_sheet builds the full payload without Google credentials
+    """
+    manager = spreadsheetManager.__new__(spreadsheetManager)
+    manager.SpreadSheetID = "benchmark"
+    manager.CSVFolderPath = tempfile.gettempdir()
+    manager.snapshots = None
+    manager.worksheets = {}
+    manager.pending_format_requests = []
+    manager.holdings_data = None
+    manager.get_worksheet = PayloadWorksheet
+    return manager
+
+
+def measure(step, setup=None, repeat: int = 3):
+    """
+    :param step: callable taking the setup result, the part that is measured
+    :param setup: callable preparing a fresh input for every run, not measured
+    :param repeat: number of timed runs
+    :return: dict of the best and mean seconds and the peak bytes allocated by one run
+    """
+    timings = []
+    for _ in range(repeat):
+        argument = setup() if setup else None
+        gc.collect()
+        start = time.perf_counter()
+        result = step(argument)
+        timings.append(time.perf_counter() - start)
+        del result, argument
+
+    argument = setup() if setup else None
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = step(argument)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result, argument
+    return {"seconds": min(timings), "mean_seconds": mean(timings), "peak_bytes": peak}
+
+
+def page_nodes(dataset, response):
+    # same edge unwrapping as FetchCSV._iter_pages_async
+    connection = dataset.get_connection(response) or {}
+    return [edge["node"] for edge in connection.get("edges") or [] if edge.get("node")]
+
+
+def flatten(dataset, responses):
+    builder = dataset.builder()
+    for response in responses:
+        builder.extend(page_nodes(dataset, response))
+    return builder
+
+
+def bench_dataset(dataset, pages, publish, workdir: str, repeat: int):
+    """
+    Runs every step on one dataset's pages
+
+    :param publish: callable taking (manager, frame) and building the sheet payload
+    :return: dict of step name mapped to its measurement
+    """
+    decoder = dataset.decoder or decode_json
+    results = {}
+    results["decode"] = measure(lambda _: [decoder(page) for page in pages], repeat=repeat)
+    results["decode_stdlib"] = measure(lambda _: [json.loads(page) for page in pages], repeat=repeat)
+
+    responses = [decoder(page) for page in pages]
+    results["flatten"] = measure(lambda _: flatten(dataset, responses), repeat=repeat)
+    builder = flatten(dataset, responses)
+    del responses
+    results["frame"] = measure(lambda _: builder.to_frame(), repeat=repeat)
+    frame = builder.to_frame()
+    del builder
+
+    path = os.path.join(workdir, f"{dataset.operation_name}.csv")
+    results["save_to_csv"] = measure(lambda _: GenerateCSV(frame).save_to_csv(path), repeat=repeat)
+    # exports read back from disk come untyped, like in read_local_dataset
+    untyped = read_output(path)
+    results["coerce"] = measure(lambda df: apply_dtypes(df, dataset.columns), setup=untyped.copy, repeat=repeat)
+    del untyped
+
+    results["sheet_payload"] = measure(lambda manager: publish(manager, frame), setup=sheet_manager, repeat=repeat)
+    return results
+
+
+def package_versions():
+    versions = {}
+    for package in PACKAGES:
+        try:
+            versions[package] = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            versions[package] = None
+    return versions
+
+
+def run(sizes, repeat: int = 3):
+    """
+    :param sizes: numbers of lots (and positions) to generate
+    :param repeat: timed runs per step
+    :return: dict of dataset name mapped to size mapped to step results
+    """
+    results = {"tax_lots": {}, "holdings": {}}
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in sizes:
+            print(f"tax lots, {size} lots...", file=sys.stderr)
+            results["tax_lots"][str(size)] = bench_dataset(
+                TAX_LOTS_DATASET,
+                tax_lot_pages(size),
+                lambda manager, frame: manager.create_tax_lots_sheet("closed", frame),
+                workdir,
+                repeat,
+            )
+            gc.collect()
+            print(f"holdings, {size} positions...", file=sys.stderr)
+            results["holdings"][str(size)] = bench_dataset(
+                HOLDINGS_DATASET,
+                holding_pages(size),
+                lambda manager, frame: manager.create_holdings_sheet(frame),
+                workdir,
+                repeat,
+            )
+            gc.collect()
+    return results
+
+
+def compare(current: dict, baseline: dict, threshold: float = DEFAULT_THRESHOLD):
+    """
+    :return: list of (dataset, size, step, metric, ratio) for every measurement
+        that grew past threshold times its baseline value
+    """
+    regressions = []
+    for dataset, sizes in current["results"].items():
+        for size, steps in sizes.items():
+            for step, result in steps.items():
+                previous = baseline.get("results", {}).get(dataset, {}).get(size, {}).get(step)
+                if previous is None:
+                    continue
+                for metric in ("seconds", "peak_bytes"):
+                    if previous[metric] and result[metric] / previous[metric] > threshold:
+                        regressions.append((dataset, size, step, metric, result[metric] / previous[metric]))
+    return regressions
+
+
+def format_report(current: dict, baseline: dict = None):
+    lines = [f"{'dataset':<10} {'size':>8} {'step':<14} {'seconds':>10} {'peak MB':>10}" + ("   vs baseline" if baseline else "")]
+    for dataset, sizes in current["results"].items():
+        for size, steps in sizes.items():
+            for step, result in steps.items():
+                line = f"{dataset:<10} {size:>8} {step:<14} {result['seconds']:>10.4f} {result['peak_bytes'] / 2 ** 20:>10.1f}"
+                previous = (baseline or {}).get("results", {}).get(dataset, {}).get(size, {}).get(step)
+                if previous:
+                    line += f"   time x{result['seconds'] / previous['seconds']:.2f}"
+                    if previous["peak_bytes"]:
+                        line += f", memory x{result['peak_bytes'] / previous['peak_bytes']:.2f}"
+                lines.append(line)
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmarks of the fetch, flatten and publish hot paths.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="numbers of lots to generate")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per step, the best one is kept")
+    parser.add_argument("--label", help="name of the result file in benchmarks/baselines, "
+                                         "run-<UTC timestamp> when omitted")
+    parser.add_argument("--output", help="result file path, overrides --label")
+    parser.add_argument("--compare", help="earlier result file to compare against")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="ratio to the earlier result above which a step is reported as a regression")
+    args = parser.parse_args(argv)
+
+    created = datetime.now(timezone.utc)
+    label = args.label or created.strftime("run-%Y%m%dT%H%M%SZ")
+    output = args.output or os.path.join(BASELINE_DIR, f"{label}.json")
+    baseline = None
+    if args.compare:
+        if os.path.abspath(output) == os.path.abspath(args.compare):
+            parser.error(f"refusing to write the results over the --compare file {args.compare}")
+        # read before running, so a missing or broken file fails fast
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    # the steps log every file and sheet they write
+    logging.basicConfig(level=logging.WARNING)
+    current = {
+        "label": label,
+        "created": created.isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "packages": package_versions(),
+        "decoder": "msgspec" if TAX_LOTS_DATASET.decoder else "orjson" if lens_client.orjson else "json",
+        "repeat": args.repeat,
+        "results": run(args.sizes, args.repeat),
+    }
+
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(current, f, indent=2)
+
+    print(format_report(current, baseline))
+    print(f"Results saved to {output}")
+    if baseline is None:
+        return 0
+    regressions = compare(current, baseline, args.threshold)
+    for dataset, size, step, metric, ratio in regressions:
+        print(f"REGRESSION {dataset} {size} {step}: {metric} x{ratio:.2f}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
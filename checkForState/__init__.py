@@ -1,3 +1,3 @@
-from .checkForState import check_for_state_file
+from .checkForState import check_for_state_file, update_state_file
 
-__all__ = ['check_for_state_file']
\ No newline at end of file
+__all__ = ['check_for_state_file', 'update_state_file']
\ No newline at end of file
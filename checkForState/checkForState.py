@@ -13,9 +13,35 @@ DEFAULT_STATE = {
     "ENABLE_GOOGLE_SHEETS_INTEGRATION": False,
     "CREATE_NEW_SPREADSHEET": False,
     "SPREADSHEET_NAME": "M1 Finance Management",
+    "SPREADSHEET_ID": "",
     "CREATE_CSV_FILES": True,
+    "OUTPUT_FORMAT": "csv",
+    "OUTPUT_COMPRESSION": "zstd",
     "GENERATE_TAX_LOTS_SHEETS": True,
     "USE_DATABASE": False,
+    "CONCURRENT_FETCH": False,
+    "FETCH_MAX_WORKERS": 3,
+    "HTTP_MAX_CONNECTIONS": 10,
+    "HTTP_KEEPALIVE_CONNECTIONS": 10,
+    "HTTP_TIMEOUT_SECONDS": 30,
+    "USE_HTTP2": False,
+    "USE_PERSISTED_QUERIES": False,
+    "STREAM_OUTPUTS": False,
+    "STREAM_SINK": "csv",
+    "INCREMENTAL_CLOSED_LOTS": False,
+    "INCREMENTAL_PAGE_SIZE": 200,
+    "CACHE_AUTH_TOKENS": True,
+    "RETRY_MAX_ATTEMPTS": 4,
+    "RETRY_BASE_DELAY_SECONDS": 0.5,
+    "RETRY_MAX_DELAY_SECONDS": 30,
+    "CIRCUIT_BREAKER_THRESHOLD": 5,
+    "CIRCUIT_BREAKER_RESET_SECONDS": 60,
+    "PUBLISH_PARTIAL_DATA": False,
+    "DELTA_SHEET_UPDATES": False,
+    "CACHE_SECURITY_METADATA": True,
+    "DAEMON_INTERVAL_MINUTES": 15,
+    "DAEMON_MARKET_HOURS_ONLY": True,
+    "DAEMON_TAX_LOTS_TIME": "02:00",
     "USE_LOGGING": True,
     "LOG_FILE_NAME": "app.log"
 }
@@ -27,3 +53,22 @@ def check_for_state_file(state_file_path=STATE_FILE):
         logger.info("%s created with default settings.", state_file_path)
     else:
         logger.info("%s already exists.", state_file_path)
+
+def update_state_file(state_file_path=STATE_FILE, updates=None):
+    '''
+    Writes values discovered at runtime (e.g. the spreadsheet ID) back into
+    state.json, keeping every other setting as it is
+    '''
+    if not updates:
+        return
+    try:
+        with open(state_file_path, "r") as state_file:
+            state = json.load(state_file)
+        state.update(updates)
+        tmp_path = state_file_path + ".tmp"
+        with open(tmp_path, "w") as state_file:
+            json.dump(state, state_file, indent=4)
+        os.replace(tmp_path, state_file_path)
+        logger.info("Saved %s to %s.", ", ".join(updates), state_file_path)
+    except Exception:
+        logger.exception("Could not update %s.", state_file_path)
@@ -1,17 +1,59 @@
 import pandas
 import logging
-from sqlalchemy import create_engine, Column, Integer, String, Float, Boolean
+from datetime import datetime, timezone
+from sqlalchemy import create_engine, event, Column, Integer, String, Float, Boolean
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import declarative_base, sessionmaker
 
 logger = logging.getLogger(__name__)
 
 DATABASE_URL = "sqlite:///asset_tracking.db"
+# log every SQL statement, only useful when debugging queries
+DATABASE_ECHO = False
+# applied to every new SQLite connection. WAL lets readers run while a batch
+# is written and NORMAL only syncs at checkpoints, which is safe in WAL mode
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "temp_store": "MEMORY",
+}
 
-#establish engine and base
-engine = create_engine(DATABASE_URL, echo=True)
+#engine is created on first use so importing the models costs nothing
+_engine = None
 
 base = declarative_base()
 
+
+def get_engine(url: str = None, echo: bool = None):
+    """
+    Returns the shared engine, creating it on first use
+
+    :param url: database URL, defaults to DATABASE_URL
+    :param echo: log SQL statements, defaults to DATABASE_ECHO
+    :return: sqlalchemy Engine
+    """
+    global _engine
+    if _engine is None:
+        _engine = create_engine(url or DATABASE_URL, echo=DATABASE_ECHO if echo is None else echo)
+        if _engine.dialect.name == "sqlite":
+            event.listen(_engine, "connect", _set_sqlite_pragmas)
+    return _engine
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for pragma, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {pragma}={value}")
+    cursor.close()
+
+
+def dispose_engine():
+    global _engine
+    if _engine is not None:
+        _engine.dispose()
+        _engine = None
+
+
 class Asset(base):
     __tablename__ = 'assets'
     ticker = Column(String, unique=True, nullable=False)
@@ -21,15 +63,73 @@ class Asset(base):
     total_value = Column(Float, nullable=False)
     last_value = Column(Float, nullable=False)
     last_updated = Column(String, nullable=False)
-    
+
     def __repr__(self):
         return f"<Asset(ticker={self.ticker}, name={self.name}, amount_held={self.amount_held}, total_value={self.total_value}, last_value={self.last_value}, last_updated={self.last_updated})>"
-    
+
+    @staticmethod
     def init_db():
         logger.info("Creating database and tables if they do not exist...")
-        base.metadata.create_all(engine)
+        base.metadata.create_all(get_engine())
         logger.info("Database setup complete.")
-        
+
+    @staticmethod
+    def upsert_assets(holdings_df, last_updated: str = None):
+        """_summary_
+        inserts or updates one asset per ticker from the holdings frame in a
+        single executemany, positions of the same ticker in several accounts
+        are added up
+
+        Args:
+            holdings_df (DataFrame): holdings as produced by FetchCSV
+            last_updated (str): ISO timestamp stored with every row, defaults to now
+
+        Returns:
+            int: number of assets written
+        """
+        if holdings_df is None or holdings_df.empty:
+            logger.warning("No holdings to store as assets.")
+            return 0
+        if last_updated is None:
+            last_updated = datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+        df = holdings_df.dropna(subset=["symbol"])
+        assets = df.groupby("symbol", sort=False, observed=True).agg(
+            name=("descriptor", "first"),
+            amount_held=("quantity", "sum"),
+            total_value=("current_value", "sum"),
+        )
+        # price per share of the last fetch
+        assets["last_value"] = (assets["total_value"] / assets["amount_held"]).where(assets["amount_held"] != 0, 0.0)
+        assets["name"] = assets["name"].fillna(pandas.Series(assets.index, index=assets.index))
+        rows = [
+            {
+                "ticker": ticker,
+                "name": str(name),
+                "amount_held": float(amount_held),
+                "total_value": float(total_value),
+                "last_value": float(last_value),
+                "last_updated": last_updated,
+            }
+            for ticker, name, amount_held, total_value, last_value in zip(
+                assets.index, assets["name"], assets["amount_held"], assets["total_value"], assets["last_value"]
+            )
+        ]
+
+        statement = sqlite_insert(Asset)
+        statement = statement.on_conflict_do_update(
+            index_elements=["ticker"],
+            set_={
+                column: statement.excluded[column]
+                for column in ("name", "amount_held", "total_value", "last_value", "last_updated")
+            },
+        )
+        with get_engine().begin() as conn:
+            conn.execute(statement, rows)
+        logger.info("Upserted %s assets.", len(rows))
+        return len(rows)
+
+    @staticmethod
     def insert_assets_from_csv(csv_file: str):
         """_summary_
         converts the holdings csv into a database entry to track assets
@@ -38,10 +138,8 @@ class Asset(base):
             csv_file (str): holdings CSV file path
         """
         try:
-            asset_df = pandas.read_csv(csv_file)
-            #clean
-            asset_df.to_sql('assets', con=engine, if_exists='append', index=False)
+            Asset.upsert_assets(pandas.read_csv(csv_file))
             logger.info("Asset data inserted successfully.")
         except Exception:
             logger.exception("Error inserting asset data.")
-        
+
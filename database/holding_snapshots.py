@@ -0,0 +1,149 @@
+"""
+Time series of holdings kept in the local database.
+
+Every run appends one row per position, stamped with the time of the run,
+so questions like "what was X worth over the last months" or "how did the
+portfolio value move day by day" can be answered without asking M1 again
+and without keeping dated CSV files around. Timestamps are stored in UTC.
+"""
+
+import logging
+from datetime import datetime, timezone
+import pandas
+from sqlalchemy import Column, Integer, String, Float, DateTime, Index, select, func, insert
+from database.database_setup import base, get_engine
+
+logger = logging.getLogger(__name__)
+
+# holdings frame columns copied into every snapshot row
+SNAPSHOT_VALUE_COLUMNS = ["quantity", "average_share_price", "total_cost", "current_value", "unrealized_gain"]
+
+
+class HoldingSnapshot(base):
+    __tablename__ = 'holding_snapshots'
+    id = Column(Integer, primary_key=True)
+    account_id = Column(String, nullable=False, default="")
+    symbol = Column(String, nullable=False)
+    snapshot_ts = Column(DateTime, nullable=False)
+    quantity = Column(Float)
+    average_share_price = Column(Float)
+    total_cost = Column(Float)
+    current_value = Column(Float)
+    unrealized_gain = Column(Float)
+
+    __table_args__ = (
+        # one row per position per run, and the lookup path of value_over_time
+        Index('ix_holding_snapshots_account_symbol_ts', 'account_id', 'symbol', 'snapshot_ts', unique=True),
+        Index('ix_holding_snapshots_ts', 'snapshot_ts'),
+    )
+
+    def __repr__(self):
+        return f"<HoldingSnapshot(account_id={self.account_id}, symbol={self.symbol}, snapshot_ts={self.snapshot_ts}, current_value={self.current_value})>"
+
+
+def init_db():
+    logger.info("Creating holdings snapshot table if it does not exist...")
+    base.metadata.create_all(get_engine(), tables=[HoldingSnapshot.__table__])
+
+
+def _float(value):
+    return None if pandas.isna(value) else float(value)
+
+
+def insert_holding_snapshots(holdings_df, snapshot_ts: datetime = None, account_id: str = ""):
+    """
+    Appends one snapshot row per position with a single bulk insert
+
+    :param holdings_df: holdings frame as produced by FetchCSV, with an
+        account_id column when several accounts were fetched
+    :param snapshot_ts: time of the snapshot, defaults to now
+    :param account_id: account used when the frame has no account_id column
+    :return: number of rows inserted
+    """
+    if holdings_df is None or holdings_df.empty:
+        logger.warning("No holdings to snapshot.")
+        return 0
+    if snapshot_ts is None:
+        snapshot_ts = datetime.now(timezone.utc)
+    # stored naive, always in UTC
+    snapshot_ts = snapshot_ts.astimezone(timezone.utc).replace(tzinfo=None)
+
+    df = holdings_df.dropna(subset=["symbol"])
+    accounts = df["account_id"].astype(str) if "account_id" in df.columns else [account_id] * len(df)
+    values = {
+        column: df[column].tolist() if column in df.columns else [None] * len(df)
+        for column in SNAPSHOT_VALUE_COLUMNS
+    }
+    rows = [
+        {
+            "account_id": account,
+            "symbol": symbol,
+            "snapshot_ts": snapshot_ts,
+            **{column: _float(values[column][i]) for column in SNAPSHOT_VALUE_COLUMNS},
+        }
+        for i, (account, symbol) in enumerate(zip(accounts, df["symbol"].astype(str)))
+    ]
+    with get_engine().begin() as conn:
+        conn.execute(insert(HoldingSnapshot), rows)
+    logger.info("Stored %s holdings snapshot rows for %s.", len(rows), snapshot_ts.isoformat(timespec="seconds"))
+    return len(rows)
+
+
+def value_over_time(symbol: str, account_id: str = None, start: datetime = None, end: datetime = None):
+    """
+    :param symbol: ticker to look up
+    :param account_id: limit to one account, all accounts when None
+    :param start: first snapshot time to include (UTC)
+    :param end: last snapshot time to include (UTC)
+    :return: DataFrame of snapshot_ts, account_id, quantity and current_value ordered by time
+    """
+    query = select(
+        HoldingSnapshot.snapshot_ts,
+        HoldingSnapshot.account_id,
+        HoldingSnapshot.quantity,
+        HoldingSnapshot.current_value,
+    ).where(HoldingSnapshot.symbol == symbol)
+    if account_id is not None:
+        query = query.where(HoldingSnapshot.account_id == account_id)
+    if start is not None:
+        query = query.where(HoldingSnapshot.snapshot_ts >= start)
+    if end is not None:
+        query = query.where(HoldingSnapshot.snapshot_ts <= end)
+    query = query.order_by(HoldingSnapshot.snapshot_ts, HoldingSnapshot.account_id)
+    with get_engine().connect() as conn:
+        return pandas.read_sql(query, conn, parse_dates=["snapshot_ts"])
+
+
+def portfolio_value_by_day(account_id: str = None, start: datetime = None, end: datetime = None):
+    """
+    Total portfolio value per day, taken from each account's last snapshot of
+    that day (UTC)
+
+    :param account_id: limit to one account, all accounts when None
+    :return: DataFrame of day and current_value ordered by day
+    """
+    day = func.date(HoldingSnapshot.snapshot_ts)
+    last_of_day = select(
+        HoldingSnapshot.account_id,
+        func.max(HoldingSnapshot.snapshot_ts).label("snapshot_ts"),
+    ).group_by(HoldingSnapshot.account_id, day)
+    if account_id is not None:
+        last_of_day = last_of_day.where(HoldingSnapshot.account_id == account_id)
+    if start is not None:
+        last_of_day = last_of_day.where(HoldingSnapshot.snapshot_ts >= start)
+    if end is not None:
+        last_of_day = last_of_day.where(HoldingSnapshot.snapshot_ts <= end)
+    last_of_day = last_of_day.subquery()
+
+    query = (
+        select(day.label("day"), func.sum(HoldingSnapshot.current_value).label("current_value"))
+        .join(
+            last_of_day,
+            (HoldingSnapshot.account_id == last_of_day.c.account_id)
+            & (HoldingSnapshot.snapshot_ts == last_of_day.c.snapshot_ts),
+        )
+        .group_by(day)
+        .order_by(day)
+    )
+    with get_engine().connect() as conn:
+        return pandas.read_sql(query, conn, parse_dates=["day"])
@@ -0,0 +1,247 @@
+"""
+Open and closed tax lots kept in the local database.
+
+Lots are keyed by the M1 lot id and loaded in bulk from the frames FetchCSV
+returns, so tax summaries come from indexed queries instead of filtering a
+multi-year CSV in pandas. Dates are stored as ISO "YYYY-MM-DD" strings,
+which sort and compare correctly and work with SQLite's date functions.
+"""
+
+import logging
+from datetime import date
+import pandas
+from sqlalchemy import Column, String, Float, Boolean, Index, select, delete, func, case
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from database.database_setup import base, get_engine
+
+logger = logging.getLogger(__name__)
+
+# lots held longer than one year are long term
+LONG_TERM_MODIFIER = "+1 year"
+DATE_COLUMNS = ["acquisitionDate", "closeDate"]
+FLOAT_COLUMNS = [
+    "quantity",
+    "costBasis",
+    "unrealizedGainLoss",
+    "shortTermRealizedGainLoss",
+    "longTermRealizedGainLoss",
+]
+STRING_COLUMNS = ["symbol", "cusip", "shortLongTermHolding"]
+# SQLite allows at most 32766 bound variables per statement
+DELETE_CHUNK_SIZE = 10000
+
+
+class TaxLotColumns:
+    id = Column(String, primary_key=True)
+    account_id = Column(String, nullable=False, default="")
+    symbol = Column(String, nullable=False)
+    cusip = Column(String)
+    acquisitionDate = Column(String)
+    quantity = Column(Float)
+    costBasis = Column(Float)
+    shortLongTermHolding = Column(String)
+    unrealizedGainLoss = Column(Float)
+    closeDate = Column(String)
+    shortTermRealizedGainLoss = Column(Float)
+    longTermRealizedGainLoss = Column(Float)
+    washSaleIndicator = Column(Boolean)
+
+    def __repr__(self):
+        return f"<{type(self).__name__}(id={self.id}, symbol={self.symbol}, acquisitionDate={self.acquisitionDate}, closeDate={self.closeDate}, quantity={self.quantity})>"
+
+
+class OpenTaxLot(TaxLotColumns, base):
+    __tablename__ = 'open_tax_lots'
+    __table_args__ = (
+        Index('ix_open_tax_lots_symbol_acquisition', 'symbol', 'acquisitionDate'),
+    )
+
+
+class ClosedTaxLot(TaxLotColumns, base):
+    __tablename__ = 'closed_tax_lots'
+    __table_args__ = (
+        Index('ix_closed_tax_lots_symbol_close', 'symbol', 'closeDate'),
+        Index('ix_closed_tax_lots_symbol_acquisition', 'symbol', 'acquisitionDate'),
+        # realized gains are summarized per year over every symbol
+        Index('ix_closed_tax_lots_close', 'closeDate'),
+    )
+
+
+TAX_LOT_MODELS = {"OPEN": OpenTaxLot, "CLOSED": ClosedTaxLot}
+
+
+def init_db():
+    logger.info("Creating tax lot tables if they do not exist...")
+    base.metadata.create_all(get_engine(), tables=[model.__table__ for model in TAX_LOT_MODELS.values()])
+
+
+def _iso_dates(series):
+    # M1 sends ISO dates, a time part is ignored so the calendar date is kept as sent
+    dates = pandas.to_datetime(series.astype(str).str[:10], errors="coerce", format="%Y-%m-%d").dt.strftime("%Y-%m-%d")
+    return dates.astype(object).where(dates.notna(), None)
+
+
+def _tax_lot_rows(df, account_id: str):
+    """
+    :return: list of row dicts ready for executemany, empty when the frame
+        has no lots (FetchCSV returns a frame without columns then)
+    """
+    if df is None or df.empty or not {"id", "symbol"}.issubset(df.columns):
+        return []
+    df = df.dropna(subset=["id", "symbol"])
+    columns = {"id": df["id"].astype(str)}
+    columns["account_id"] = df["account_id"].astype(str) if "account_id" in df.columns else pandas.Series(account_id, index=df.index)
+    for column in STRING_COLUMNS:
+        values = df[column] if column in df.columns else pandas.Series(None, index=df.index, dtype=object)
+        columns[column] = values.astype(object).where(values.notna(), None)
+    for column in DATE_COLUMNS:
+        columns[column] = _iso_dates(df[column]) if column in df.columns else pandas.Series(None, index=df.index, dtype=object)
+    for column in FLOAT_COLUMNS:
+        values = pandas.to_numeric(df[column], errors="coerce") if column in df.columns else pandas.Series(float("nan"), index=df.index)
+        columns[column] = values.astype(object).where(values.notna(), None)
+    wash = df["washSaleIndicator"] if "washSaleIndicator" in df.columns else pandas.Series(None, index=df.index, dtype=object)
+    columns["washSaleIndicator"] = wash.map(lambda value: None if pandas.isna(value) else str(value).lower() in ("true", "1"))
+    return pandas.DataFrame(columns).to_dict("records")
+
+
+def load_tax_lots(df, lot_type: str, account_id: str = "", account_ids=None):
+    """
+    Bulk loads one tax lot frame with a single INSERT ... ON CONFLICT executemany.
+    Open lots mirror the latest fetch, so open lots of the loaded accounts
+    that are no longer in the frame are removed. Closed lots are only ever
+    added or updated, so the incremental sync can load just the new ones.
+
+    :param df: frame as produced by FetchCSV._fetch_lot_type, with an
+        account_id column when several accounts were fetched
+    :param lot_type: "OPEN" or "CLOSED"
+    :param account_id: account used when the frame has no account_id column,
+        and whose open lots are purged when the frame holds no lots
+    :param account_ids: every account the frame was fetched for, their open
+        lots missing from the frame are purged even when an account has no
+        rows left (a consolidated frame leaves such accounts out)
+    :return: number of lots written
+    """
+    model = TAX_LOT_MODELS[lot_type.upper()]
+    if df is None:
+        return 0
+    # an empty frame still purges the account's open lots, it sold everything
+    rows = _tax_lot_rows(df, account_id)
+
+    statement = sqlite_insert(model)
+    statement = statement.on_conflict_do_update(
+        index_elements=["id"],
+        set_={column.name: statement.excluded[column.name] for column in model.__table__.columns if column.name != "id"},
+    )
+    with get_engine().begin() as conn:
+        if model is OpenTaxLot:
+            ids = {row["id"] for row in rows}
+            accounts = {str(account) for account in account_ids} if account_ids else {row["account_id"] for row in rows} or {account_id}
+            stale = conn.execute(
+                select(OpenTaxLot.id).where(OpenTaxLot.account_id.in_(accounts))
+            ).scalars().all()
+            stale = [lot_id for lot_id in stale if lot_id not in ids]
+            for start in range(0, len(stale), DELETE_CHUNK_SIZE):
+                conn.execute(delete(OpenTaxLot).where(OpenTaxLot.id.in_(stale[start:start + DELETE_CHUNK_SIZE])))
+        if rows:
+            conn.execute(statement, rows)
+    logger.info("Loaded %s %s tax lots into the database.", len(rows), lot_type.lower())
+    return len(rows)
+
+
+def _year_range(tax_year: int):
+    return f"{tax_year:04d}-01-01", f"{tax_year + 1:04d}-01-01"
+
+
+def realized_gains_by_year(tax_year: int = None, account_id: str = None, symbol: str = None):
+    """
+    Realized gains of closed lots summed per tax year (year of the close date)
+    and term
+
+    :param tax_year: limit to one year
+    :param account_id: limit to one account, all accounts when None
+    :param symbol: limit to one ticker
+    :return: DataFrame of tax_year, short_term, long_term, total and lots ordered by year
+    """
+    tax_year_column = func.substr(ClosedTaxLot.closeDate, 1, 4)
+    short_term = func.coalesce(func.sum(ClosedTaxLot.shortTermRealizedGainLoss), 0.0)
+    long_term = func.coalesce(func.sum(ClosedTaxLot.longTermRealizedGainLoss), 0.0)
+    query = select(
+        tax_year_column.label("tax_year"),
+        short_term.label("short_term"),
+        long_term.label("long_term"),
+        (short_term + long_term).label("total"),
+        func.count().label("lots"),
+    ).where(ClosedTaxLot.closeDate.is_not(None))
+    if tax_year is not None:
+        first_day, next_year = _year_range(tax_year)
+        query = query.where(ClosedTaxLot.closeDate >= first_day, ClosedTaxLot.closeDate < next_year)
+    if account_id is not None:
+        query = query.where(ClosedTaxLot.account_id == account_id)
+    if symbol is not None:
+        query = query.where(ClosedTaxLot.symbol == symbol)
+    query = query.group_by(tax_year_column).order_by(tax_year_column)
+    with get_engine().connect() as conn:
+        df = pandas.read_sql(query, conn)
+    df["tax_year"] = df["tax_year"].astype(int)
+    return df
+
+
+def open_lots_by_holding_period(as_of: date = None, term: str = None, account_id: str = None, symbol: str = None):
+    """
+    Open lots with how long they have been held and when they turn long term
+
+    :param as_of: date the holding period is measured to, defaults to today
+    :param term: "short" or "long" to only return lots of that term
+    :param account_id: limit to one account, all accounts when None
+    :param symbol: limit to one ticker
+    :return: DataFrame of the open lots with holding_days, long_term_date,
+        days_to_long_term and term, ordered by symbol and acquisition date
+    """
+    as_of = (as_of or date.today()).isoformat()
+    # sold on or after this date a lot counts as held for more than a year
+    long_term_date = func.date(OpenTaxLot.acquisitionDate, LONG_TERM_MODIFIER, "+1 day")
+    is_long = long_term_date <= as_of
+    query = select(
+        OpenTaxLot.id,
+        OpenTaxLot.account_id,
+        OpenTaxLot.symbol,
+        OpenTaxLot.acquisitionDate,
+        OpenTaxLot.quantity,
+        OpenTaxLot.costBasis,
+        OpenTaxLot.unrealizedGainLoss,
+        (func.julianday(as_of) - func.julianday(OpenTaxLot.acquisitionDate)).label("holding_days"),
+        long_term_date.label("long_term_date"),
+        func.max(func.julianday(long_term_date) - func.julianday(as_of), 0).label("days_to_long_term"),
+        case((is_long, "long"), else_="short").label("term"),
+    ).where(OpenTaxLot.acquisitionDate.is_not(None))
+    if term == "long":
+        query = query.where(is_long)
+    elif term == "short":
+        query = query.where(long_term_date > as_of)
+    if account_id is not None:
+        query = query.where(OpenTaxLot.account_id == account_id)
+    if symbol is not None:
+        query = query.where(OpenTaxLot.symbol == symbol)
+    query = query.order_by(OpenTaxLot.symbol, OpenTaxLot.acquisitionDate)
+    with get_engine().connect() as conn:
+        return pandas.read_sql(query, conn)
+
+
+def wash_sale_lots(tax_year: int = None, account_id: str = None, symbol: str = None):
+    """
+    :param tax_year: limit to lots closed in one year
+    :param account_id: limit to one account, all accounts when None
+    :param symbol: limit to one ticker
+    :return: DataFrame of closed lots M1 flagged as wash sales, ordered by symbol and close date
+    """
+    query = select(ClosedTaxLot).where(ClosedTaxLot.washSaleIndicator.is_(True))
+    if tax_year is not None:
+        first_day, next_year = _year_range(tax_year)
+        query = query.where(ClosedTaxLot.closeDate >= first_day, ClosedTaxLot.closeDate < next_year)
+    if account_id is not None:
+        query = query.where(ClosedTaxLot.account_id == account_id)
+    if symbol is not None:
+        query = query.where(ClosedTaxLot.symbol == symbol)
+    query = query.order_by(ClosedTaxLot.symbol, ClosedTaxLot.closeDate)
+    with get_engine().connect() as conn:
+        return pandas.read_sql(query, conn)
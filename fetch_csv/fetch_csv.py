@@ -1,37 +1,151 @@
-import time
+import asyncio
 import pandas as pd
-import requests
-import json
+import httpx
 import logging
+from fetch_csv.query_builder import Column, GraphQLDataset, CATEGORY, FLOAT, DATETIME, BOOLEAN
+from lens_client.lens_client import GraphQLResponseError
 
 logger = logging.getLogger(__name__)
 
+# values of FetchCSV.fetch_status, keyed by dataset label (e.g. "closed tax lots")
+FETCH_COMPLETE = "complete"
+FETCH_PARTIAL = "partial"
+FETCH_FAILED = "failed"
+
+# Only the fields that end up in the exported columns are requested, the
+# selection set and the extraction of each column from a page of nodes are derived from the columns.
+TAX_LOTS_DATASET = GraphQLDataset(
+    "AccountTaxLots",
+    """query AccountTaxLots($id: ID!, $lotType: LotTypeEnum!, $first: Int, $after: String) {
+  node(id: $id) {
+    ... on Account {
+      taxLots(lotType: $lotType, first: $first, after: $after) {
+        pageInfo {
+          hasNextPage
+          endCursor
+        }
+        edges {
+          node {
+            {selection}
+          }
+        }
+      }
+    }
+  }
+}""",
+    [
+        Column("symbol", "symbol", CATEGORY),
+        Column("cusip", "cusip", CATEGORY),
+        Column("acquisitionDate", "acquisitionDate", DATETIME),
+        Column("quantity", "quantity", FLOAT),
+        Column("costBasis", "costBasis", FLOAT),
+        Column("shortLongTermHolding", "shortLongTermHolding", CATEGORY),
+        Column("unrealizedGainLoss", "unrealizedGainLoss", FLOAT),
+        Column("closeDate", "closeDate", DATETIME),
+        Column("shortTermRealizedGainLoss", "shortTermRealizedGainLoss", FLOAT),
+        Column("longTermRealizedGainLoss", "longTermRealizedGainLoss", FLOAT),
+        Column("washSaleIndicator", "washSaleIndicator", BOOLEAN),
+        Column("id", "id"),
+    ],
+    "node.taxLots",
+)
+
+HOLDINGS_DATASET = GraphQLDataset(
+    "InvestmentsTablePagination",
+    """query InvestmentsTablePagination($accountId: ID!, $first: Int!, $after: String, $positionsSort: [PositionSortOptionInput!]!) {
+  account: node(id: $accountId) {
+    ... on Account {
+      balance {
+        investments {
+          positions(first: $first, after: $after, sort: $positionsSort) {
+            pageInfo {
+              hasNextPage
+              endCursor
+            }
+            edges {
+              node {
+                {selection}
+              }
+            }
+          }
+        }
+      }
+    }
+  }
+}""",
+    [
+        Column("symbol", "positionSecurity.symbol", CATEGORY),
+        Column("descriptor", "positionSecurity.descriptor"),
+        Column("quantity", "quantity", FLOAT),
+        Column("average_share_price", "cost.averageSharePrice", FLOAT),
+        Column("total_cost", "cost.cost", FLOAT),
+        Column("current_value", "value.value", FLOAT),
+        Column("unrealized_gain", "unrealizedGain.gain", FLOAT),
+        Column("unrealized_gain_percent", "unrealizedGain.gainPercent", FLOAT),
+        Column("maintenance_margin_percent", "marginability.maintenanceEquityRequirementPercent", FLOAT),
+    ],
+    "account.balance.investments.positions",
+)
+
+# columns of each exported dataset by output file stem
+DATASET_COLUMNS = {
+    "open_tax_lots": TAX_LOTS_DATASET.columns,
+    "closed_tax_lots": TAX_LOTS_DATASET.columns,
+    "holdings": HOLDINGS_DATASET.columns,
+}
+
+
+def consolidate_accounts(frames_by_account: dict):
+    '''
+    Combines per-account frames into one frame with a leading account_id column
+
+    :param frames_by_account: dict of account id mapped to a DataFrame (or None)
+    :return: consolidated DataFrame, or None if no account returned data
+    '''
+    frames = []
+    for account_id, df in frames_by_account.items():
+        if df is None or df.empty:
+            continue
+        frames.append(df.assign(account_id=account_id)[["account_id", *df.columns]])
+    if not frames:
+        return None
+    df = pd.concat(frames, ignore_index=True)
+    # categories differ between accounts, so concat falls back to object columns
+    for column in frames[0].columns:
+        if isinstance(frames[0][column].dtype, pd.CategoricalDtype) and not isinstance(df[column].dtype, pd.CategoricalDtype):
+            df[column] = df[column].astype("category")
+    return df
+
 
 class FetchCSV:
-    def __init__(self, session, segmentID: str, otherAccountID: str):
+    def __init__(self, session, segmentID: str, otherAccountID):
+        '''
+        :param session: the authenticated LensClient returned by Authenticate.login
+        :param otherAccountID: account id, or a list of account ids fetched over the same session
+        '''
         self.session = session
+        # whether each dataset was fetched completely, so callers can decide to publish
+        self.fetch_status = {}
         self.segmentID = segmentID
-        self.otherAccountID = otherAccountID
-
-    def _get_headers(self, operation_name="AccountTaxLots"):
-        current_time_ms = str(int(time.time() * 1000))
-        return {
-            "Host": "lens.m1.com",
-            "Accept": "*/*",
-            "Accept-Language": "en-US,en;q=0.5",
-            "Referer": "https://dashboard.m1.com/",
-            "content-type": "application/json",
-            "x-client-id": "m1-web/10.0.170",
-            "x-client-sentinel": current_time_ms,
-            "x-segment-id": self.segmentID,
-            "x-apollo-operation-name": operation_name,
-            "Origin": "https://dashboard.m1.com",
-            "Connection": "keep-alive",
-            "Sec-Fetch-Dest": "empty",
-            "Sec-Fetch-Mode": "cors",
-            "Sec-Fetch-Site": "same-site",
-            "authorization": f"Bearer {self.session.access_token}",
-        }
+        if isinstance(otherAccountID, str):
+            otherAccountID = [otherAccountID]
+        self.accountIDs = list(otherAccountID)
+        # default account for the single-account methods
+        self.otherAccountID = self.accountIDs[0] if self.accountIDs else ""
+
+    @staticmethod
+    def _label(base: str, account_id=None):
+        # fetch_status keeps one entry per dataset and account
+        return base if account_id is None else f"{base} [{account_id}]"
+
+    def isComplete(self, label: str, account_id=None):
+        '''
+        Docstring for isComplete
+        :param label: "open tax lots", "closed tax lots" or "holdings"
+        :param account_id: account the dataset was fetched for, None for the default account
+        :return: True if the last fetch of that dataset reached its final page
+        '''
+        return self.fetch_status.get(self._label(label, account_id)) == FETCH_COMPLETE
 
     def fetchTaxLotsCSVs(self):
         '''
@@ -45,137 +159,294 @@ class FetchCSV:
         df_closed = self._fetch_lot_type("CLOSED")
         return df_open, df_closed
 
-    def _fetch_lot_type(self, lot_type: str):
-        try:
-            url = "https://lens.m1.com/graphql"
-
-            query_string = """query AccountTaxLots($id: ID!, $lotType: LotTypeEnum!, $first: Int, $after: String) {
-              node(id: $id) {
-                ... on Account {
-                  number
-                  taxLots(lotType: $lotType, first: $first, after: $after) {
-                    pageInfo {
-                      hasNextPage
-                      endCursor
-                      __typename
-                    }
-                    edges {
-                      node {
-                        symbol
-                        cusip
-                        acquisitionDate
-                        quantity
-                        costBasis
-                        shortLongTermHolding
-                        unrealizedGainLoss
-                        closeDate
-                        shortTermRealizedGainLoss
-                        longTermRealizedGainLoss
-                        washSaleIndicator
-                        id
-                        __typename
-                      }
-                      __typename
-                    }
-                    __typename
-                  }
-                  __typename
-                }
-                __typename
-              }
-            }"""
-            headers = self._get_headers("AccountTaxLots")
-            PAYLOAD = {
-                "operationName": "AccountTaxLots",
-                "variables": {
-                    "id": self.otherAccountID,
-                    "lotType": lot_type,
-                    "first": 2000,
-                },
-                "query": query_string,
-            }
-
-            # Initial request
-            response = self.session.post(url, json=PAYLOAD, headers=headers)
-            response.raise_for_status()
+    def fetchAllConcurrently(self, max_workers: int = 3, fetch_closed: bool = True, fetch_open: bool = True):
+        '''
+        Docstring for fetchAllConcurrently
+        sync wrapper around fetchAllAsync for blocking callers
 
-            # Parse JSON
-            json_data = response.json()
-            # Check for GraphQL errors
-            if "errors" in json_data:
-                logger.error("GraphQL errors for %s: %s", lot_type, json_data["errors"])
-                return None
+        :param max_workers: maximum number of datasets fetched at the same time
+        :return: tuple of (open tax lots, closed tax lots, holdings) DataFrames
+        '''
+        return self.session.run(
+            self.fetchAllAsync(max_concurrency=max_workers, fetch_closed=fetch_closed, fetch_open=fetch_open)
+        )
 
-            ### fetch the data and convert to CSV DataFrame ###
-            data_list = []
+    async def fetchAllAsync(self, max_concurrency: int = 3, fetch_closed: bool = True, fetch_open: bool = True):
+        '''
+        Docstring for fetchAllAsync
+        this will fetch open tax lots, closed tax lots and holdings concurrently
+        on one event loop over the shared authenticated client. A failure in one
+        dataset does not cancel the others, the failed dataset is returned as None.
+
+        :param max_concurrency: maximum number of datasets fetched at the same time
+        :param fetch_closed: set to False to skip closed tax lots, which are then returned as None
+        :param fetch_open: set to False to skip open tax lots, which are then returned as None
+        :return: tuple of (open tax lots, closed tax lots, holdings) DataFrames
+        '''
+        semaphore = asyncio.Semaphore(max(1, int(max_concurrency)))
+        return await self._fetch_account_async(None, semaphore, fetch_closed, fetch_open)
 
-            # Check for pagination
-            tax_lots = json_data.get("data", {}).get("node", {}).get("taxLots")
-            if not tax_lots:
-                logger.warning("No %s tax lots data found in response.", lot_type.lower())
-                return pd.DataFrame()  # Return empty DataFrame
+    def fetchAccounts(self, max_workers: int = 3, fetch_closed: bool = True, fetch_open: bool = True):
+        '''
+        Docstring for fetchAccounts
+        sync wrapper around fetchAccountsAsync for blocking callers
+        '''
+        return self.session.run(
+            self.fetchAccountsAsync(max_concurrency=max_workers, fetch_closed=fetch_closed, fetch_open=fetch_open)
+        )
 
-            page_info = tax_lots.get("pageInfo", {})
-            nextPage = page_info.get("hasNextPage", False)
+    async def fetchAccountsAsync(self, max_concurrency: int = 3, fetch_closed: bool = True, fetch_open: bool = True, account_ids=None):
+        '''
+        Docstring for fetchAccountsAsync
+        fetches open tax lots, closed tax lots and holdings of every account
+        over the one authenticated session. All datasets of all accounts share
+        one concurrency limit, so adding accounts does not multiply the number
+        of requests in flight.
+
+        :param max_concurrency: maximum number of datasets fetched at the same time
+        :param fetch_closed: set to False to skip closed tax lots, which are then returned as None
+        :param fetch_open: set to False to skip open tax lots, which are then returned as None
+        :param account_ids: accounts to fetch, defaults to every account given to FetchCSV
+        :return: dict of account id mapped to a tuple of (open tax lots, closed tax lots, holdings)
+        '''
+        account_ids = list(account_ids if account_ids is not None else self.accountIDs)
+        semaphore = asyncio.Semaphore(max(1, int(max_concurrency)))
+        results = await asyncio.gather(
+            *(self._fetch_account_async(account_id, semaphore, fetch_closed, fetch_open) for account_id in account_ids)
+        )
+        return dict(zip(account_ids, results))
+
+    async def _fetch_account_async(self, account_id, semaphore: asyncio.Semaphore, fetch_closed: bool = True, fetch_open: bool = True):
+        async def bounded(coro):
+            async with semaphore:
+                return await coro
+
+        async def skipped():
+            return None
 
-            if not nextPage:
-                edges = tax_lots.get("edges", [])
-                data_list.extend(edges)
+        names = ["open tax lots", "closed tax lots", "holdings"]
+        results = await asyncio.gather(
+            bounded(self._fetch_lot_type_async("OPEN", account_id)) if fetch_open else skipped(),
+            bounded(self._fetch_lot_type_async("CLOSED", account_id)) if fetch_closed else skipped(),
+            bounded(self.fetchHoldingsAsync(account_id)),
+            return_exceptions=True,
+        )
+        frames = []
+        for name, result in zip(names, results):
+            if isinstance(result, BaseException):
+                logger.error("Concurrent fetch failed for %s.", self._label(name, account_id), exc_info=result)
+                frames.append(None)
             else:
-                while nextPage:
-                    edges = tax_lots.get("edges", [])
-                    data_list.extend(edges)
-                    endCursor = page_info.get("endCursor")
-                    if not endCursor:
-                        break
-                    PAYLOAD["variables"]["after"] = endCursor
-                    try:
-                        response = self.session.post(url, json=PAYLOAD, headers=headers)
-                        response.raise_for_status()
-                        json_data = response.json()
-                        if "errors" in json_data:
-                            logger.error("GraphQL errors in %s pagination: %s", lot_type, json_data["errors"])
-                            break
-                        tax_lots = json_data.get("data", {}).get("node", {}).get("taxLots")
-                        if not tax_lots:
-                            break
-                        page_info = tax_lots.get("pageInfo", {})
-                        nextPage = page_info.get("hasNextPage", False)
-                    except requests.exceptions.RequestException:
-                        logger.exception("Request failed during %s pagination.", lot_type)
-                        break
-                    except ValueError:
-                        logger.exception("Failed to parse JSON during %s pagination.", lot_type)
-                        break
+                frames.append(result)
+        return tuple(frames)
+
+    def _tax_lot_variables(self, lot_type: str, first: int = 2000, account_id=None):
+        return {
+            "id": account_id or self.otherAccountID,
+            "lotType": lot_type,
+            "first": first,
+        }
+
+    def _holdings_variables(self, account_id=None):
+        return {
+            "accountId": account_id or self.otherAccountID,
+            "first": 100,
+            "positionsSort": [{"direction": "DESC", "type": "VALUE"}]
+        }
+
+    async def _iter_pages_async(self, dataset: GraphQLDataset, variables: dict, label: str, prefetch: bool = True):
+        '''
+        Docstring for _iter_pages_async
+        async generator that pages through a GraphQL connection and yields the
+        nodes of one page at a time, turned into columns by the caller. The request for the next page
+        is already in flight while the caller handles the current one.
+
+        Errors on the first page are raised, errors while paginating are logged
+        and end the iteration. The outcome is recorded in self.fetch_status[label].
+
+        :param dataset: GraphQLDataset describing the query and columns
+        :param variables: query variables for the first page
+        :param label: dataset name used in log messages
+        :param prefetch: request the next page before the current one is handled
+        '''
+        async def fetch_page(after=None):
+            page_variables = dict(variables)
+            if after:
+                page_variables["after"] = after
+            json_data = await self.session.graphql(
+                dataset.operation_name, dataset.query, page_variables, decoder=dataset.decoder
+            )
+            if "errors" in json_data:
+                raise GraphQLResponseError(dataset.operation_name, json_data["errors"])
+            return json_data
+
+        self.fetch_status[label] = FETCH_FAILED
+        json_data = await fetch_page()
+        self.fetch_status[label] = FETCH_PARTIAL
+        connection = dataset.get_connection(json_data)
+        if not connection:
+            logger.warning("No %s data found in response.", label)
+            self.fetch_status[label] = FETCH_COMPLETE
+            return
+
+        while connection:
+            page_info = connection.get("pageInfo") or {}
+            end_cursor = page_info.get("endCursor")
+            has_next_page = bool(page_info.get("hasNextPage") and end_cursor)
+            next_page = None
+            if has_next_page and prefetch:
+                next_page = asyncio.ensure_future(fetch_page(end_cursor))
+            try:
+                yield [edge["node"] for edge in connection.get("edges") or [] if edge.get("node")]
+                if not has_next_page:
+                    self.fetch_status[label] = FETCH_COMPLETE
+                    return
+                if next_page is None:
+                    next_page = asyncio.ensure_future(fetch_page(end_cursor))
+                try:
+                    json_data = await next_page
+                except GraphQLResponseError as e:
+                    logger.error("GraphQL errors in %s pagination, %s data is partial: %s", label, label, e.errors)
+                    return
+                except httpx.HTTPError:
+                    logger.exception("Request failed during %s pagination, %s data is partial.", label, label)
+                    return
+                except ValueError:
+                    logger.exception("Failed to parse JSON during %s pagination, %s data is partial.", label, label)
+                    return
+                connection = dataset.get_connection(json_data)
+                if not connection:
+                    logger.error("Missing %s page in response, %s data is partial.", label, label)
+            finally:
+                if next_page is not None and not next_page.done():
+                    next_page.cancel()
+
+    async def _collect_async(self, dataset: GraphQLDataset, variables: dict, label: str):
+        try:
+            # pages are appended column by column, no per-row records are built
+            builder = dataset.builder()
+            async for page in self._iter_pages_async(dataset, variables, label):
+                builder.extend(page)
 
             # Convert to DataFrame
-            if not data_list:
-                logger.warning("No %s data to convert to DataFrame.", lot_type.lower())
+            if not len(builder):
+                logger.warning("No %s data to convert to DataFrame.", label)
                 return pd.DataFrame()
 
-            records = []
-            for edge in data_list:
-                node = edge.get("node")
-                if node:
-                    records.append(node)
-
-            df = pd.DataFrame.from_records(records)
-            logger.info("Successfully fetched %s tax lots data.", lot_type.lower())
+            df = builder.to_frame()
+            if self.fetch_status.get(label) == FETCH_COMPLETE:
+                logger.info("Successfully fetched %s data.", label)
+            else:
+                logger.warning("Fetched %s rows of partial %s data.", len(df), label)
             return df
 
-        except requests.exceptions.RequestException:
-            logger.exception("Request failed for %s.", lot_type)
+        except GraphQLResponseError as e:
+            logger.error("GraphQL errors for %s: %s", label, e.errors)
+            return None
+        except httpx.HTTPError:
+            logger.exception("Request failed for %s.", label)
             return None
         except ValueError:
-            logger.exception("Failed to parse JSON response for %s.", lot_type)
+            logger.exception("Failed to parse JSON response for %s.", label)
             return None
         except KeyError:
-            logger.exception("Missing expected key in %s response.", lot_type)
+            logger.exception("Missing expected key in %s response.", label)
             return None
         except Exception:
-            logger.exception("An unexpected error occurred for %s.", lot_type)
+            logger.exception("An unexpected error occurred for %s.", label)
             return None
-        
+
+    def _fetch_lot_type(self, lot_type: str, account_id=None):
+        return self.session.run(self._fetch_lot_type_async(lot_type, account_id))
+
+    async def _fetch_lot_type_async(self, lot_type: str, account_id=None):
+        return await self._collect_async(
+            TAX_LOTS_DATASET,
+            self._tax_lot_variables(lot_type, account_id=account_id),
+            self._label(f"{lot_type.lower()} tax lots", account_id),
+        )
+
+    def fetchNewClosedLots(self, store, page_size: int = 200, account_id=None):
+        '''
+        Docstring for fetchNewClosedLots
+        sync wrapper around fetchNewClosedLotsAsync for blocking callers
+        '''
+        return self.session.run(self.fetchNewClosedLotsAsync(store, page_size, account_id))
+
+    async def fetchNewClosedLotsAsync(self, store, page_size: int = 200, account_id=None):
+        '''
+        Docstring for fetchNewClosedLotsAsync
+        this will fetch only the closed tax lots that are not in the local store.
+        When the history is ordered newest first, pagination stops after the
+        first page whose oldest closeDate is strictly before the account's
+        watermark in the store, so a steady-state run costs one or two pages regardless of
+        how long the history is.
+
+        This relies on M1 returning closed lots ordered by closeDate descending
+        (checked when the store is seeded). The order of lots sharing a closeDate
+        is not specified, so a known id is not a stopping point: lots closed on
+        the watermark date may still follow it, possibly on the next page.
+        Known ids are only filtered out.
+
+        :param store: ClosedLotStore holding the ids of exported lots
+        :param page_size: number of lots requested per page
+        :param account_id: account to sync, None for the default account
+        :return: DataFrame of new closed lots, or None if the fetch failed.
+            isComplete("closed tax lots", account_id) tells whether every new lot was reached.
+        '''
+        label = self._label("closed tax lots", account_id)
+        stop_early = store.newest_first(account_id)
+        pages = self._iter_pages_async(
+            TAX_LOTS_DATASET,
+            self._tax_lot_variables("CLOSED", first=page_size, account_id=account_id),
+            label,
+            prefetch=not stop_early,
+        )
+        watermark = store.watermark(account_id)
+        if watermark:
+            # stores written before dates were truncated may hold a time of day
+            watermark = watermark[:10]
+        try:
+            builder = TAX_LOTS_DATASET.builder()
+            lot_ids = TAX_LOTS_DATASET.extractors["id"]
+            close_dates = TAX_LOTS_DATASET.extractors["closeDate"]
+            page_count = 0
+            reached_watermark = False
+            async for page in pages:
+                page_count += 1
+                ids = lot_ids(page)
+                known = store.known_ids(ids)
+                builder.extend([node for node, lot_id in zip(page, ids) if lot_id not in known])
+                if stop_early and watermark:
+                    # "YYYY-MM-DD" text compares in date order, a time of day is dropped on both sides
+                    dates = [str(d)[:10] for d in close_dates(page) if d]
+                    if dates and min(dates) < watermark:
+                        reached_watermark = True
+                        break
+            if reached_watermark:
+                self.fetch_status[label] = FETCH_COMPLETE
+
+            logger.info(
+                "Found %s new closed tax lots in %s page(s) (last export watermark %s).",
+                len(builder), page_count, watermark,
+            )
+            return builder.to_frame()
+
+        except GraphQLResponseError as e:
+            logger.error("GraphQL errors for %s: %s", label, e.errors)
+            return None
+        except httpx.HTTPError:
+            logger.exception("Request failed for %s.", label)
+            return None
+        except ValueError:
+            logger.exception("Failed to parse JSON response for %s.", label)
+            return None
+        except Exception:
+            logger.exception("An unexpected error occurred for %s.", label)
+            return None
+        finally:
+            await pages.aclose()
+
     def fetchHoldingsCSV(self):
         '''
         Docstring for fetchHoldingsCSV
@@ -184,364 +455,125 @@ class FetchCSV:
         
         :param self: Description
         '''
-        try:
-            url = "https://lens.m1.com/graphql"
-
-            query_string = """query InvestmentsTablePagination($accountId: ID!, $first: Int!, $after: String, $positionsSort: [PositionSortOptionInput!]!) {
-              account: node(id: $accountId) {
-                ... on Account {
-                  __typename
-                  id
-                  originator
-                  ...BorrowAccount
-                  balance {
-                    investments {
-                      hasPositions
-                      ...Investments
-                      __typename
-                    }
-                    __typename
-                  }
-                }
-                __typename
-              }
-            }
-
-            fragment BorrowAccount on Account {
-              borrowAccount {
-                hasCreditBorrowed
-                creditBorrowed
-                status {
-                  excessMarginEquity
-                  requiredMarginEquity
-                  marginEquity
-                  __typename
-                }
-                __typename
-              }
-              __typename
-            }
-
-            fragment Investments on Investments {
-              positions(first: $first, after: $after, sort: $positionsSort) {
-                pageInfo {
-                  hasNextPage
-                  endCursor
-                  __typename
-                }
-                total
-                edges {
-                  cursor
-                  node {
-                    ...Investment
-                    __typename
-                  }
-                  __typename
-                }
-                __typename
-              }
-              totalValue {
-                isPartial
-                value
-                __typename
-              }
-              totalUnrealizedGain {
-                gain
-                gainPercent
-                tooltip {
-                  ...AppTooltip
-                  __typename
-                }
-                __typename
-              }
-              totalCost {
-                cost
-                isPartial
-                tooltip {
-                  ...AppTooltip
-                  __typename
-                }
-                __typename
-              }
-              __typename
-            }
-
-            fragment Investment on Position {
-              id
-              cost {
-                averageSharePrice
-                cost
-                __typename
-              }
-              marginability {
-                maintenanceEquityRequirementPercent
-                __typename
-              }
-              positionSecurity {
-                descriptor
-                security {
-                  __typename
-                  id
-                  profile {
-                    logoUrl
-                    __typename
-                  }
-                  type
-                  ... on Security {
-                    symbol
-                    __typename
-                  }
-                  ...SliceableCell
-                }
-                symbol
-                __typename
-              }
-              quantity
-              unrealizedGain {
-                gain
-                gainPercent
-                __typename
-              }
-              value {
-                value
-                __typename
-              }
-              __typename
-            }
+        return self.session.run(self.fetchHoldingsAsync())
 
-            fragment SliceableCell on Sliceable {
-              __typename
-              id
-              isActive
-              name
-              ... on Security {
-                symbol
-                status
-                __typename
-              }
-              ... on SystemPie {
-                systemPieStatus: status
-                __typename
-              }
-              ...SliceableLogo
-            }
-
-            fragment SliceableLogo on Sliceable {
-              __typename
-              name
-              ... on Security {
-                symbol
-                profile {
-                  logoUrl
-                  __typename
-                }
-                __typename
-              }
-              ... on SystemPie {
-                key
-                logoUrl
-                categorizationDetails {
-                  logoUrl
-                  name
-                  key
-                  __typename
-                }
-                __typename
-              }
-              ... on UserPie {
-                portfolioLinks {
-                  id
-                  isRootSlice
-                  __typename
-                }
-                __typename
-              }
-            }
-
-            fragment AppTooltip on AppTooltip {
-              header
-              body
-              link {
-                ...AppLink
-                __typename
-              }
-              icon {
-                ...AppImage
-                __typename
-              }
-              __typename
-            }
-
-            fragment AppLink on AppLink {
-              articleId
-              internalPath
-              title
-              url
-              analyticsEvent {
-                ...AnalyticsEvent
-                __typename
-              }
-              kind
-              size
-              underline
-              font
-              fontWeight
-              __typename
-            }
-
-            fragment AnalyticsEvent on AppAnalyticsEvent {
-              name
-              valueParameter
-              customParameters {
-                name
-                value
-                __typename
-              }
-              customBoolParameters {
-                name
-                value
-                __typename
-              }
-              customNumberParameters {
-                name
-                value
-                __typename
-              }
-              __typename
-            }
+    async def fetchHoldingsAsync(self, account_id=None):
+        return await self._collect_async(
+            HOLDINGS_DATASET, self._holdings_variables(account_id), self._label("holdings", account_id)
+        )
 
-            fragment AppImage on AppImage {
-              type
-              names
-              color
-              lightTheme {
-                scale1xUrl
-                scale2xUrl
-                scale3xUrl
-                __typename
-              }
-              darkTheme {
-                scale1xUrl
-                scale2xUrl
-                scale3xUrl
-                __typename
-              }
-              __typename
-            }"""
-
-            headers = self._get_headers("InvestmentsTablePagination")
-            PAYLOAD = {
-                "operationName": "InvestmentsTablePagination",
-                "variables": {
-                    "accountId": self.otherAccountID,
-                    "first": 100,
-                    "positionsSort": [{"direction": "DESC", "type": "VALUE"}]
-                },
-                "query": query_string
-            }
+    def iterTaxLotPages(self, lot_type: str, account_id=None):
+        '''
+        Docstring for iterTaxLotPages
+        async generator yielding one DataFrame per page of tax lots
 
-            # Initial request
-            response = self.session.post(url, json=PAYLOAD, headers=headers)
-            response.raise_for_status()
+        :param lot_type: "OPEN" or "CLOSED"
+        :param account_id: account to fetch, None for the default account
+        '''
+        return self._iter_frames_async(
+            TAX_LOTS_DATASET,
+            self._tax_lot_variables(lot_type, account_id=account_id),
+            self._label(f"{lot_type.lower()} tax lots", account_id),
+        )
 
-            # Parse JSON
-            json_data = response.json()
-            # Check for GraphQL errors
-            if "errors" in json_data:
-                logger.error("GraphQL errors for holdings: %s", json_data["errors"])
-                return None
+    def iterHoldingsPages(self, account_id=None):
+        '''
+        Docstring for iterHoldingsPages
+        async generator yielding one DataFrame per page of holdings
+        '''
+        return self._iter_frames_async(
+            HOLDINGS_DATASET, self._holdings_variables(account_id), self._label("holdings", account_id)
+        )
 
-            ### fetch the data and convert to CSV DataFrame ###
-            data_list = []
+    async def _iter_frames_async(self, dataset: GraphQLDataset, variables: dict, label: str):
+        async for page in self._iter_pages_async(dataset, variables, label):
+            if page:
+                yield dataset.frame(page)
 
-            # Check for pagination
-            investments = json_data.get("data", {}).get("account", {}).get("balance", {}).get("investments")
-            if not investments:
-                logger.warning("No holdings data found in response.")
-                return pd.DataFrame()  # Return empty DataFrame
+    async def _stream_async(self, pages, sink, label: str, publish_partial: bool = False):
+        '''
+        Writes every page to the sink as it arrives. Sink writes run in a worker
+        thread so the next page keeps downloading while the current one is written.
+        The sink only keeps the output if the dataset was fetched completely,
+        unless publish_partial is set.
 
-            positions = investments.get("positions")
-            if not positions:
-                logger.warning("No positions data found in response.")
-                return pd.DataFrame()
+        :return: True if every page was fetched and written, False otherwise
+        '''
+        success = False
+        rows = 0
+        try:
+            async for frame in pages:
+                await asyncio.to_thread(sink.write, frame)
+                rows += len(frame)
+            success = publish_partial or self.isComplete(label)
+            if success:
+                logger.info("Streamed %s %s rows to %s.", rows, label, sink)
+        except GraphQLResponseError as e:
+            logger.error("GraphQL errors for %s: %s", label, e.errors)
+        except httpx.HTTPError:
+            logger.exception("Request failed for %s.", label)
+        except Exception:
+            logger.exception("An unexpected error occurred while streaming %s.", label)
+        finally:
+            await pages.aclose()
+            await asyncio.to_thread(sink.close, success)
+        return success
 
-            page_info = positions.get("pageInfo", {})
-            nextPage = page_info.get("hasNextPage", False)
+    def streamToSinks(self, sinks: dict, max_workers: int = 3, publish_partial: bool = False):
+        '''
+        Docstring for streamToSinks
+        sync wrapper around streamToSinksAsync for blocking callers
+        '''
+        return self.session.run(self.streamToSinksAsync(sinks, max_concurrency=max_workers, publish_partial=publish_partial))
 
-            if not nextPage:
-                edges = positions.get("edges", [])
-                data_list.extend(edges)
-            else:
-                while nextPage:
-                    edges = positions.get("edges", [])
-                    data_list.extend(edges)
-                    endCursor = page_info.get("endCursor")
-                    if not endCursor:
-                        break
-                    PAYLOAD["variables"]["after"] = endCursor
-                    try:
-                        response = self.session.post(url, json=PAYLOAD, headers=headers)
-                        response.raise_for_status()
-                        json_data = response.json()
-                        if "errors" in json_data:
-                            logger.error("GraphQL errors in holdings pagination: %s", json_data["errors"])
-                            break
-                        investments = json_data.get("data", {}).get("account", {}).get("balance", {}).get("investments")
-                        if not investments:
-                            break
-                        positions = investments.get("positions")
-                        if not positions:
-                            break
-                        page_info = positions.get("pageInfo", {})
-                        nextPage = page_info.get("hasNextPage", False)
-                    except requests.exceptions.RequestException:
-                        logger.exception("Request failed during holdings pagination.")
-                        break
-                    except ValueError:
-                        logger.exception("Failed to parse JSON during holdings pagination.")
-                        break
+    def streamAccountsToSinks(self, sinks_by_account: dict, max_workers: int = 3, publish_partial: bool = False):
+        '''
+        Docstring for streamAccountsToSinks
+        streams every account into its own sinks, sharing one concurrency limit
 
-            # Convert to DataFrame
-            if not data_list:
-                logger.warning("No holdings data to convert to DataFrame.")
-                return pd.DataFrame()
+        :param sinks_by_account: dict of account id mapped to a sinks dict as taken by streamToSinksAsync
+        :return: dict of account id mapped to the per-dataset results
+        '''
+        async def stream_all():
+            semaphore = asyncio.Semaphore(max(1, int(max_workers)))
+            account_ids = list(sinks_by_account)
+            results = await asyncio.gather(*(
+                self.streamToSinksAsync(
+                    sinks_by_account[account_id], publish_partial=publish_partial,
+                    account_id=account_id, semaphore=semaphore,
+                )
+                for account_id in account_ids
+            ))
+            return dict(zip(account_ids, results))
+
+        return self.session.run(stream_all())
+
+    async def streamToSinksAsync(self, sinks: dict, max_concurrency: int = 3, publish_partial: bool = False, account_id=None, semaphore=None):
+        '''
+        Docstring for streamToSinksAsync
+        streams each dataset page by page into its sink so that peak memory is
+        bounded by the page size instead of the total number of rows.
+
+        :param sinks: dict with any of the keys "open", "closed" and "holdings" mapped to a sink
+        :param max_concurrency: maximum number of datasets streamed at the same time
+        :param publish_partial: keep the output of datasets whose pagination failed part way
+        :param account_id: account to stream, None for the default account
+        :param semaphore: shared concurrency limit, overrides max_concurrency
+        :return: dict of the same keys mapped to True if the dataset was written
+        '''
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(max(1, int(max_concurrency)))
+        sources = {
+            "open": (lambda: self.iterTaxLotPages("OPEN", account_id), self._label("open tax lots", account_id)),
+            "closed": (lambda: self.iterTaxLotPages("CLOSED", account_id), self._label("closed tax lots", account_id)),
+            "holdings": (lambda: self.iterHoldingsPages(account_id), self._label("holdings", account_id)),
+        }
 
-            records = []
-            for edge in data_list:
-                node = edge.get("node")
-                if node:
-                    # Flatten the nested structure for CSV
-                    positionSecurity = node.get("positionSecurity") or {}
-                    cost = node.get("cost") or {}
-                    value = node.get("value") or {}
-                    unrealizedGain = node.get("unrealizedGain") or {}
-                    marginability = node.get("marginability") or {}
-                    record = {
-                        "symbol": positionSecurity.get("symbol"),
-                        "descriptor": positionSecurity.get("descriptor"),
-                        "quantity": node.get("quantity"),
-                        "average_share_price": cost.get("averageSharePrice"),
-                        "total_cost": cost.get("cost"),
-                        "current_value": value.get("value"),
-                        "unrealized_gain": unrealizedGain.get("gain"),
-                        "unrealized_gain_percent": unrealizedGain.get("gainPercent"),
-                        "maintenance_margin_percent": marginability.get("maintenanceEquityRequirementPercent")
-                    }
-                    records.append(record)
-
-            df = pd.DataFrame.from_records(records)
-            logger.info("Successfully fetched holdings data.")
-            return df
+        async def bounded(key, sink):
+            pages, label = sources[key]
+            async with semaphore:
+                return await self._stream_async(pages(), sink, label, publish_partial)
 
-        except requests.exceptions.RequestException:
-            logger.exception("Request failed for holdings.")
-            return None
-        except ValueError:
-            logger.exception("Failed to parse JSON response for holdings.")
-            return None
-        except KeyError:
-            logger.exception("Missing expected key in holdings response.")
-            return None
-        except Exception:
-            logger.exception("An unexpected error occurred for holdings.")
-            return None
+        keys = [key for key in sources if key in sinks]
+        results = await asyncio.gather(*(bounded(key, sinks[key]) for key in keys))
+        return dict(zip(keys, results))
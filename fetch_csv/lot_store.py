@@ -0,0 +1,156 @@
+"""
+Local store of closed tax lots that have already been exported.
+
+Closed lots never change once closed, so the incremental sync only needs to
+know which lot ids it has written before. The store is a small SQLite file
+holding each lot id with its closeDate and account, plus whether M1 returned
+each account's history newest first (which is what allows pagination to stop
+early). Watermarks and ordering are kept per account, since every account is
+paged separately. The default account is stored with a NULL account_id.
+"""
+
+import os
+import sqlite3
+import logging
+import pandas as pd
+from fetch_csv.query_builder import iso_dates
+
+logger = logging.getLogger(__name__)
+
+
+class ClosedLotStore:
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self.conn = sqlite3.connect(db_path)
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(closed_lots)")]
+        if columns and "account_id" not in columns:
+            # lots were not recorded per account, start over with a full download
+            logger.info("Closed lot store predates per account watermarks. Resetting it.")
+            with self.conn:
+                self.conn.execute("DROP TABLE closed_lots")
+                self.conn.execute("DROP TABLE IF EXISTS meta")
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS closed_lots (id TEXT PRIMARY KEY, close_date TEXT, account_id TEXT)"
+            )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)"
+            )
+
+    def count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM closed_lots").fetchone()[0]
+
+    def watermark(self, account_id=None):
+        """
+        :param account_id: account to look up, None for the default account
+        :return: latest closeDate seen for the account as "YYYY-MM-DD", or None when it has no lots
+        """
+        return self.conn.execute(
+            "SELECT MAX(close_date) FROM closed_lots WHERE account_id IS ?",
+            (None if account_id is None else str(account_id),),
+        ).fetchone()[0]
+
+    def newest_first(self, account_id=None):
+        """
+        :param account_id: account to look up, None for the default account
+        :return: True if the account's seeded history was ordered by closeDate descending
+        """
+        row = self.conn.execute(
+            "SELECT value FROM meta WHERE key = ?", (self._newest_first_key(account_id),)
+        ).fetchone()
+        return bool(row) and row[0] == "1"
+
+    @staticmethod
+    def _newest_first_key(account_id):
+        return "newest_first" if account_id is None else f"newest_first:{account_id}"
+
+    def known_ids(self, ids):
+        """
+        :param ids: lot ids to look up
+        :return: set of the given ids that are already stored
+        """
+        ids = [lot_id for lot_id in ids if lot_id is not None]
+        known = set()
+        # stay under SQLite's bound parameter limit
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            placeholders = ", ".join("?" for _ in chunk)
+            rows = self.conn.execute(
+                f"SELECT id FROM closed_lots WHERE id IN ({placeholders})", chunk
+            ).fetchall()
+            known.update(row[0] for row in rows)
+        return known
+
+    def add(self, df, account_id=None):
+        """
+        Records lots as exported
+
+        :param df: DataFrame with "id" and "closeDate" columns, and an "account_id"
+            column when it consolidates several accounts
+        :param account_id: account of every lot when df has no "account_id" column
+        """
+        close_dates = df["closeDate"]
+        if pd.api.types.is_datetime64_any_dtype(close_dates.dtype):
+            close_dates = iso_dates(close_dates)
+        # stored as "YYYY-MM-DD" text, a time of day would sort after every lot of its date
+        accounts = df["account_id"] if "account_id" in df.columns else [account_id] * len(df)
+        rows = [
+            (
+                str(lot_id),
+                None if close_date is None or close_date != close_date else str(close_date)[:10],
+                None if account is None or account != account else str(account),
+            )
+            for lot_id, close_date, account in zip(df["id"], close_dates, accounts)
+            if lot_id is not None
+        ]
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO closed_lots (id, close_date, account_id) VALUES (?, ?, ?)", rows
+            )
+
+    def seed(self, df, account_ids=None):
+        """
+        Replaces the store with a full closed lot history and records each account's ordering
+
+        :param df: DataFrame holding the complete closed lot history in M1's order,
+            with an "account_id" column when it consolidates several accounts
+        :param account_ids: accounts the history was downloaded for, None for the default account
+        """
+        if account_ids:
+            groups = dict(list(df.groupby("account_id", sort=False, observed=True))) if len(df) else {}
+            ordering = {
+                account_id: self._is_newest_first(groups[account_id]["closeDate"]) if account_id in groups else True
+                for account_id in map(str, account_ids)
+            }
+        else:
+            ordering = {None: self._is_newest_first(df["closeDate"])}
+        self.reset()
+        self.add(df)
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                [(self._newest_first_key(account_id), "1" if newest_first else "0")
+                 for account_id, newest_first in ordering.items()],
+            )
+        for account_id, newest_first in ordering.items():
+            if not newest_first:
+                logger.info(
+                    "Closed lot history%s is not ordered newest first. Incremental sync will page the full history.",
+                    "" if account_id is None else f" of account {account_id}",
+                )
+
+    @staticmethod
+    def _is_newest_first(close_dates):
+        if pd.api.types.is_datetime64_any_dtype(close_dates.dtype):
+            close_dates = iso_dates(close_dates)
+        close_dates = [str(d) for d in close_dates if d is not None and d == d]
+        return all(a >= b for a, b in zip(close_dates, close_dates[1:]))
+
+    def reset(self):
+        with self.conn:
+            self.conn.execute("DELETE FROM closed_lots")
+            self.conn.execute("DELETE FROM meta")
+
+    def close(self):
+        self.conn.close()
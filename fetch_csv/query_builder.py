@@ -0,0 +1,419 @@
+"""
+Small GraphQL query builder for the datasets FetchCSV exports.
+
+Each dataset declares the flat output columns it keeps and the path of the
+GraphQL field each column comes from. The selection set sent to the server
+and the functions that pull each column out of a page of nodes are both
+derived from that one declaration, so the server is only asked for fields we
+keep.
+Columns also declare their pandas dtype, applied once when the frame is
+built so every consumer gets typed data instead of object columns.
+"""
+
+from itertools import repeat
+from operator import attrgetter
+from typing import Any, Optional
+import numpy as np
+import pandas as pd
+
+try:
+    import msgspec
+except ImportError:  # optional, responses are decoded into plain dicts instead
+    msgspec = None
+
+# dtypes a Column can declare
+CATEGORY = "category"
+FLOAT = "float64"
+DATETIME = "datetime64"
+BOOLEAN = "boolean"
+STRING = "object"
+
+
+class Column:
+    def __init__(self, name: str, path: str, dtype: str = STRING):
+        """
+        :param name: output column name
+        :param path: dotted path of the GraphQL field inside the node, e.g. "cost.averageSharePrice"
+        :param dtype: CATEGORY for repeated labels, FLOAT for amounts, DATETIME for
+            dates, BOOLEAN for flags, STRING (the default) leaves values as sent
+        """
+        self.name = name
+        self.path = tuple(path.split("."))
+        self.dtype = dtype
+
+    def __repr__(self):
+        return f"<Column(name={self.name}, path={'.'.join(self.path)}, dtype={self.dtype})>"
+
+
+def _to_boolean(values):
+    try:
+        # True, False and None / NaN convert directly
+        return pd.array(values, dtype=BOOLEAN)
+    except (TypeError, ValueError):
+        pass
+    # CSV exports read back as strings when the column holds blanks
+    values = [value if value is None or isinstance(value, bool) or value != value or value == ""
+              else str(value).strip().lower() in ("true", "1") for value in values]
+    return pd.array(values, dtype=BOOLEAN)
+
+
+def _category_text(value):
+    # a column with blanks reads back as floats, 12345678.0 is kept as "12345678"
+    return str(int(value)) if isinstance(value, float) and value.is_integer() else str(value)
+
+
+def _to_category(values):
+    categorical = pd.Categorical(values)
+    if categorical.categories.inferred_type in ("string", "empty") and categorical.categories.dtype == object:
+        return categorical
+    # an all missing page would get float64 categories and numbers read back
+    # from a CSV integer ones, the Arrow schemas declare string dictionaries
+    values = pd.Series(values, dtype=object)
+    present = values.notna()
+    values = values[present].map(_category_text).reindex(values.index)
+    values = values.where(present, None)
+    return pd.Categorical(values, categories=pd.Index(sorted(values.dropna().unique()), dtype=object))
+
+
+def convert_values(values, dtype: str):
+    """
+    :param values: list or Series of raw values
+    :param dtype: Column dtype
+    :return: array of the values in that dtype, values that do not parse become missing
+    """
+    if dtype == CATEGORY:
+        return _to_category(values)
+    if dtype == FLOAT:
+        return pd.to_numeric(pd.Series(values, dtype=object) if isinstance(values, list) else values,
+                             errors="coerce").astype(FLOAT)
+    if dtype == DATETIME:
+        return pd.to_datetime(values, errors="coerce", format="ISO8601")
+    if dtype == BOOLEAN:
+        return _to_boolean(values)
+    if isinstance(values, list):
+        array = np.empty(len(values), dtype=object)
+        array[:] = values
+        return array
+    return values
+
+
+def apply_dtypes(df, columns):
+    """
+    Converts the declared columns of a frame to their dtypes. Values that do
+    not parse become missing (NaN, NaT or <NA>).
+
+    :param df: DataFrame holding some or all of the columns
+    :param columns: list of Column
+    :return: the same DataFrame, converted in place
+    """
+    for column in columns:
+        if column.name not in df.columns or column.dtype == STRING:
+            continue
+        dtype = df[column.name].dtype
+        if (
+            (column.dtype == CATEGORY and isinstance(dtype, pd.CategoricalDtype))
+            or (column.dtype == FLOAT and dtype == FLOAT)
+            or (column.dtype == DATETIME and pd.api.types.is_datetime64_any_dtype(dtype))
+            or (column.dtype == BOOLEAN and dtype == BOOLEAN)
+        ):
+            continue
+        df[column.name] = convert_values(df[column.name], column.dtype)
+    return df
+
+
+def iso_dates(series):
+    """
+    :param series: datetime64 Series
+    :return: object Series of "YYYY-MM-DD" strings (with the time when there
+        is one) and None for missing dates
+    """
+    present = series.dropna()
+    has_time = (present != present.dt.normalize()).any()
+    formatted = series.dt.strftime("%Y-%m-%dT%H:%M:%S" if has_time else "%Y-%m-%d").astype(object)
+    return formatted.where(series.notna(), None)
+
+
+def format_dates(df):
+    """
+    :return: copy of df with every datetime64 column turned into ISO strings,
+        for outputs that take plain values (Sheets, SQLite)
+    """
+    date_columns = [name for name, dtype in df.dtypes.items() if pd.api.types.is_datetime64_any_dtype(dtype)]
+    if not date_columns:
+        return df
+    df = df.copy()
+    for name in date_columns:
+        df[name] = iso_dates(df[name])
+    return df
+
+
+def build_selection(columns, indent: str = ""):
+    """
+    Builds the smallest selection set that covers every column path
+
+    :param columns: list of Column
+    :param indent: indentation prefixed to every line of the selection
+    :return: selection set text (without the enclosing braces)
+    """
+    tree = {}
+    for column in columns:
+        level = tree
+        for key in column.path:
+            level = level.setdefault(key, {})
+
+    lines = []
+
+    def render(level, depth):
+        pad = indent + "  " * depth
+        for key, children in level.items():
+            if children:
+                lines.append(f"{pad}{key} {{")
+                render(children, depth + 1)
+                lines.append(f"{pad}}}")
+            else:
+                lines.append(f"{pad}{key}")
+
+    render(tree, 0)
+    return "\n".join(lines)
+
+
+class _Missing:
+    """Stands in for an absent parent object of a typed node, every field is None."""
+
+    def __getattr__(self, name):
+        return None
+
+
+MISSING = _Missing()
+
+
+def build_extractor(column):
+    """
+    Builds a function that returns one column's values for a whole page of
+    nodes, walking the path level by level over the page instead of node by node
+
+    :param column: Column
+    :return: callable taking a list of nodes (dicts, or typed structs from a
+        response decoder) and returning a list of values
+    """
+    parents, leaf = column.path[:-1], column.path[-1]
+    get_leaf = attrgetter(leaf)
+
+    def extract(nodes):
+        if nodes and not isinstance(nodes[0], dict):
+            for key in parents:
+                nodes = [getattr(node, key) or MISSING for node in nodes]
+            return list(map(get_leaf, nodes))
+        for key in parents:
+            nodes = [node.get(key) or {} for node in nodes]
+        # map over dict.get keeps the loop in C
+        return list(map(dict.get, nodes, repeat(leaf, len(nodes))))
+
+    return extract
+
+
+if msgspec is not None:
+    class GraphQLStruct(msgspec.Struct):
+        """
+        Base of the typed response structs. Absent fields are None, and the
+        dict-style accessors let code written for decoded dicts read them too.
+        """
+
+        def get(self, key, default=None):
+            value = getattr(self, key, None)
+            return default if value is None else value
+
+        def __getitem__(self, key):
+            return getattr(self, key)
+
+        def __contains__(self, key):
+            return getattr(self, key, None) is not None
+
+
+def _struct_type(name: str, tree: dict):
+    """
+    :param tree: nested dict of field names, leaves are {}
+    :return: struct type declaring exactly those fields, all optional
+    """
+    fields = []
+    for key, children in tree.items():
+        field_type = _struct_type(f"{name}_{key}", children) if children else Any
+        fields.append((key, Optional[field_type], None))
+    return msgspec.defstruct(name, fields, bases=(GraphQLStruct,))
+
+
+def build_response_decoder(name: str, connection_path, columns):
+    """
+    Builds a decoder for one paginated query that decodes straight into typed
+    structs holding only the connection's pageInfo, the declared node fields
+    and any errors. Every other field in the response is skipped while parsing.
+
+    :param name: prefix of the generated struct names
+    :param connection_path: path of keys from "data" to the connection
+    :param columns: list of Column read from each node
+    :return: callable taking the response bytes, or None when msgspec is not installed
+    """
+    if msgspec is None:
+        return None
+    node_tree = {}
+    for column in columns:
+        level = node_tree
+        for key in column.path:
+            level = level.setdefault(key, {})
+    node_type = _struct_type(f"{name}Node", node_tree)
+    edge_type = msgspec.defstruct(f"{name}Edge", [("node", Optional[node_type], None)], bases=(GraphQLStruct,))
+    page_info_type = msgspec.defstruct(
+        f"{name}PageInfo",
+        [("hasNextPage", Optional[bool], None), ("endCursor", Optional[str], None)],
+        bases=(GraphQLStruct,),
+    )
+    level_type = msgspec.defstruct(
+        f"{name}Connection",
+        [("pageInfo", Optional[page_info_type], None), ("edges", Optional[list[edge_type]], None)],
+        bases=(GraphQLStruct,),
+    )
+    for depth, key in reversed(list(enumerate(connection_path))):
+        level_type = msgspec.defstruct(f"{name}Level{depth}", [(key, Optional[level_type], None)], bases=(GraphQLStruct,))
+    response_type = msgspec.defstruct(
+        f"{name}Response",
+        [("data", Optional[level_type], None), ("errors", Optional[list[Any]], None)],
+        bases=(GraphQLStruct,),
+    )
+    decoder = msgspec.json.Decoder(response_type)
+
+    def decode(content: bytes):
+        try:
+            return decoder.decode(content)
+        except msgspec.DecodeError as e:
+            # callers treat malformed bodies like any other JSON error
+            raise ValueError(str(e)) from e
+
+    return decode
+
+
+def _as_float_array(values):
+    try:
+        # None becomes NaN, numeric strings are parsed
+        return np.array(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        return pd.to_numeric(pd.Series(values, dtype=object), errors="coerce").to_numpy(dtype=np.float64)
+
+
+class FloatBuffer:
+    """Growable float64 array that doubles its capacity when full."""
+
+    def __init__(self, capacity: int = 1024):
+        self.data = np.empty(capacity, dtype=np.float64)
+        self.size = 0
+
+    def extend(self, values):
+        count = len(values)
+        if self.size + count > len(self.data):
+            capacity = max(len(self.data) * 2, self.size + count)
+            grown = np.empty(capacity, dtype=np.float64)
+            grown[:self.size] = self.data[:self.size]
+            self.data = grown
+        self.data[self.size:self.size + count] = _as_float_array(values)
+        self.size += count
+
+    def view(self):
+        return self.data[:self.size]
+
+
+class ColumnarBuilder:
+    def __init__(self, columns, extractors=None):
+        """
+        Collects pages of GraphQL nodes column by column. Float columns go
+        into FloatBuffers, the others into plain lists, so no per-row record
+        dict is ever built and pandas receives ready-made columns.
+
+        :param columns: list of Column
+        :param extractors: dict of column name mapped to its extractor, built when omitted
+        """
+        self.columns = list(columns)
+        self.extractors = extractors or {column.name: build_extractor(column) for column in self.columns}
+        self.values = {
+            column.name: FloatBuffer() if column.dtype == FLOAT else []
+            for column in self.columns
+        }
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def extend(self, nodes):
+        """
+        :param nodes: list of GraphQL node dicts of one page
+        """
+        if not nodes:
+            return
+        for column in self.columns:
+            self.values[column.name].extend(self.extractors[column.name](nodes))
+        self.size += len(nodes)
+
+    def to_frame(self):
+        """
+        :return: DataFrame of the declared columns with their dtypes applied.
+            Float columns are views of the buffers, not copies.
+        """
+        # each column is converted once from its list, pandas never infers types row by row
+        data = {
+            column.name: self.values[column.name].view() if column.dtype == FLOAT
+            else convert_values(self.values[column.name], column.dtype)
+            for column in self.columns
+        }
+        return pd.DataFrame(data, columns=list(data), copy=False)
+
+
+class GraphQLDataset:
+    def __init__(self, operation_name: str, query_template: str, columns, connection_path: str):
+        """
+        :param operation_name: GraphQL operation name
+        :param query_template: query text with a "{selection}" line where the node fields go
+        :param columns: list of Column declaring the output columns
+        :param connection_path: dotted path from "data" to the paginated connection
+        """
+        self.operation_name = operation_name
+        self.connection_path = tuple(connection_path.split("."))
+        self.columns = list(columns)
+        self.column_names = [column.name for column in self.columns]
+
+        lines = query_template.splitlines()
+        for index, line in enumerate(lines):
+            if line.strip() == "{selection}":
+                indent = line[: len(line) - len(line.lstrip())]
+                lines[index] = build_selection(self.columns, indent)
+                break
+        else:
+            raise ValueError(f"Query template for {operation_name} has no {{selection}} line.")
+        self.query = "\n".join(lines)
+        self.extractors = {column.name: build_extractor(column) for column in self.columns}
+        # typed decoding of this query's responses, None without msgspec
+        self.decoder = build_response_decoder(operation_name, self.connection_path, self.columns)
+
+    def builder(self):
+        """
+        :return: empty ColumnarBuilder for this dataset
+        """
+        return ColumnarBuilder(self.columns, self.extractors)
+
+    def frame(self, nodes):
+        """
+        :param nodes: GraphQL node dicts
+        :return: DataFrame of the declared columns with their dtypes applied
+        """
+        builder = self.builder()
+        builder.extend(nodes)
+        return builder.to_frame()
+
+    def get_connection(self, json_data):
+        """
+        Returns the paginated connection (pageInfo and edges) from a response
+
+        :param json_data: decoded GraphQL response
+        :return: connection dict or None when it is missing
+        """
+        level = json_data.get("data") or {}
+        for key in self.connection_path:
+            level = level.get(key) or {}
+        return level or None
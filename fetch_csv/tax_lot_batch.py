@@ -0,0 +1,355 @@
+"""
+Compact array-backed container for large tax lot sets.
+
+A TaxLotBatch keeps every tax lot field in its own NumPy array: amounts as
+float64 (NaN when missing), dates as datetime64[s] (NaT when missing), the
+wash sale flag as int8 (-1 when missing), the repeated text fields (account,
+symbol, CUSIP, term) as int32 codes into a string table (-1 when missing)
+and the unique lot ids as fixed-width bytes. A lot costs 73 bytes plus the
+length of the longest id instead of a row of Python objects, and the arrays
+convert to pandas and Arrow without copying the numbers.
+
+On disk a batch is a folder of one .npy file per field, memory mapped on
+load, plus the small string tables of the repeated text fields.
+"""
+
+import os
+import json
+import numpy as np
+import pandas as pd
+from fetch_csv.query_builder import convert_values, CATEGORY, FLOAT, DATETIME, BOOLEAN, STRING
+from fetch_csv.fetch_csv import TAX_LOTS_DATASET
+
+# string tables of a batch saved to disk, next to one .npy file per field
+STRINGS_FILE = "strings.json"
+MISSING_CODE = -1
+
+CODE_DTYPE = np.dtype(np.int32)
+# the unique text fields (lot ids) are as wide as the longest value appended so far
+BYTES_DTYPE = np.dtype("S1")
+
+# numpy dtype stored for each Column dtype, categories hold string table codes
+FIELD_DTYPES = {
+    CATEGORY: CODE_DTYPE,
+    FLOAT: np.dtype(np.float64),
+    DATETIME: np.dtype("datetime64[s]"),
+    BOOLEAN: np.dtype(np.int8),
+    STRING: BYTES_DTYPE,
+}
+
+# account_id leads like in the consolidated multi-account frames
+FIELDS = [("account_id", CODE_DTYPE)] + [
+    (column.name, FIELD_DTYPES[column.dtype]) for column in TAX_LOTS_DATASET.columns
+]
+# layout of one lot, TaxLotBatch.records() uses the current id width
+TAX_LOT_DTYPE = np.dtype(FIELDS)
+COLUMN_DTYPES = {"account_id": CATEGORY, **{column.name: column.dtype for column in TAX_LOTS_DATASET.columns}}
+CODED_FIELDS = [name for name, dtype in FIELDS if COLUMN_DTYPES[name] == CATEGORY]
+
+
+class StringTable:
+    """Interns strings to int32 codes, each distinct string is stored once."""
+
+    def __init__(self, values=()):
+        self.values = []
+        self.index = {}
+        self._array = None
+        for value in values:
+            self.code(value)
+
+    def __len__(self):
+        return len(self.values)
+
+    def code(self, value):
+        """
+        :return: code of the value, added to the table when new, MISSING_CODE for None or NaN
+        """
+        if value is None or value != value:
+            return MISSING_CODE
+        if not isinstance(value, str):
+            value = str(value)
+        code = self.index.get(value)
+        if code is None:
+            code = self.index[value] = len(self.values)
+            self.values.append(value)
+            self._array = None
+        return code
+
+    def encode(self, values):
+        """
+        :param values: iterable of strings, None or NaN for missing
+        :return: int32 array of codes
+        """
+        values = list(values)
+        return np.fromiter(map(self.code, values), dtype=CODE_DTYPE, count=len(values))
+
+    def decode(self, codes):
+        """
+        :param codes: int array of codes
+        :return: object array of the strings, None for MISSING_CODE
+        """
+        if self._array is None:
+            # the trailing None is what MISSING_CODE (-1) indexes
+            self._array = np.array(self.values + [None], dtype=object)
+        return self._array[codes]
+
+
+def _encode_bytes(values):
+    """
+    :return: fixed-width bytes array of the values, b"" for None or NaN
+    """
+    return np.array(
+        [b"" if value is None or value != value else str(value).encode("utf-8") for value in values],
+        dtype=bytes,
+    )
+
+
+def _decode_bytes(array):
+    """
+    :return: object array of the strings, None for b""
+    """
+    strings = np.char.decode(array, "utf-8").astype(object)
+    strings[array == b""] = None
+    return strings
+
+
+def _grow(array, size: int, needed: int, dtype=None):
+    # a column only widened or made writable keeps its capacity
+    capacity = len(array) if needed <= len(array) else max(len(array) * 2, needed)
+    grown = np.empty(capacity, dtype=dtype or array.dtype)
+    grown[:size] = array[:size]
+    return grown
+
+
+class TaxLotBatch:
+    def __init__(self, capacity: int = 1024, tables: dict = None):
+        """
+        :param capacity: number of lots the arrays hold before they grow
+        :param tables: dict of text field name mapped to its StringTable, to
+            share codes with another batch; new tables when omitted
+        """
+        self.tables = tables or {name: StringTable() for name in CODED_FIELDS}
+        self.arrays = {name: np.empty(capacity, dtype=dtype) for name, dtype in FIELDS}
+        self.size = 0
+
+    @classmethod
+    def _from_arrays(cls, arrays: dict, tables: dict):
+        batch = cls(0, tables)
+        batch.arrays = arrays
+        batch.size = len(arrays["id"])
+        return batch
+
+    @classmethod
+    def from_frame(cls, df, account_id: str = ""):
+        """
+        :param df: tax lot frame as produced by FetchCSV
+        :param account_id: account used when the frame has no account_id column
+        :return: TaxLotBatch holding the frame's lots
+        """
+        batch = cls(len(df))
+        batch.extend_frame(df, account_id)
+        return batch
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, key):
+        """
+        :param key: int for one lot as a dict, slice for a batch viewing the
+            same arrays without copying, or an index / boolean array for a
+            batch holding a copy of the selected lots
+        """
+        if isinstance(key, (int, np.integer)):
+            return self._lot(key)
+        return TaxLotBatch._from_arrays({name: array[key] for name, array in self._columns().items()}, self.tables)
+
+    def _columns(self):
+        return {name: array[:self.size] for name, array in self.arrays.items()}
+
+    def _lot(self, index: int):
+        lot = {}
+        for name, array in self._columns().items():
+            value = array[index]
+            if name in self.tables:
+                value = self.tables[name].decode(value)
+            elif COLUMN_DTYPES[name] == STRING:
+                value = value.decode("utf-8") or None
+            elif COLUMN_DTYPES[name] == BOOLEAN:
+                value = None if value == MISSING_CODE else bool(value)
+            elif COLUMN_DTYPES[name] == DATETIME:
+                value = None if np.isnat(value) else pd.Timestamp(value)
+            else:
+                value = None if np.isnan(value) else float(value)
+            lot[name] = value
+        return lot
+
+    def _append_columns(self, columns: dict, count: int):
+        """
+        :param columns: dict of field name mapped to an array of count encoded values
+        """
+        needed = self.size + count
+        for name, array in self.arrays.items():
+            dtype = array.dtype
+            if dtype.kind == "S" and columns[name].dtype.itemsize > dtype.itemsize:
+                # a longer id than any before widens the whole column once
+                dtype = columns[name].dtype
+            if needed > len(array) or not array.flags.writeable or dtype != array.dtype:
+                # grown by doubling, so appending stays amortized O(1) per lot
+                array = self.arrays[name] = _grow(array, self.size, needed, dtype)
+            array[self.size:needed] = columns[name]
+        self.size = needed
+
+    def _encode(self, name: str, values):
+        dtype = COLUMN_DTYPES[name]
+        if name in self.tables:
+            return self.tables[name].encode(values)
+        if dtype == STRING:
+            return _encode_bytes(values)
+        if dtype == FLOAT:
+            return np.asarray(convert_values(values, FLOAT), dtype=np.float64)
+        if dtype == DATETIME:
+            dates = pd.DatetimeIndex(convert_values(values, DATETIME))
+            if dates.tz is not None:
+                dates = dates.tz_convert(None)
+            return np.asarray(dates, dtype="datetime64[s]")
+        return convert_values(values, BOOLEAN).to_numpy(dtype=np.int8, na_value=MISSING_CODE)
+
+    def extend(self, nodes, account_id: str = ""):
+        """
+        Appends a page of AccountTaxLots nodes
+
+        :param nodes: list of GraphQL node dicts or typed nodes
+        :param account_id: account the lots belong to
+        """
+        if not nodes:
+            return
+        columns = {"account_id": self.tables["account_id"].encode([account_id] * len(nodes))}
+        for column in TAX_LOTS_DATASET.columns:
+            columns[column.name] = self._encode(column.name, TAX_LOTS_DATASET.extractors[column.name](nodes))
+        self._append_columns(columns, len(nodes))
+
+    def append(self, lot: dict, account_id: str = ""):
+        """
+        :param lot: one tax lot node, or a dict of the output column names
+        """
+        self.extend([lot], lot.get("account_id") or account_id)
+
+    def extend_frame(self, df, account_id: str = ""):
+        """
+        Appends the lots of a FetchCSV tax lot frame, typed or read back from CSV
+
+        :param account_id: account used when the frame has no account_id column
+        """
+        if df is None or df.empty:
+            return
+        columns = {}
+        for name, dtype in FIELDS:
+            if name in df.columns:
+                values = df[name]
+            elif name == "account_id":
+                values = pd.Series(account_id, index=df.index)
+            else:
+                values = pd.Series(None, index=df.index, dtype=object)
+            if isinstance(values.dtype, pd.CategoricalDtype) and name in self.tables:
+                # only the categories are looked up, the rows are remapped as integers
+                codes = np.append(self.tables[name].encode(values.cat.categories), MISSING_CODE)
+                columns[name] = codes[values.cat.codes.to_numpy()]
+            elif COLUMN_DTYPES[name] == DATETIME and pd.api.types.is_datetime64_dtype(values.dtype):
+                columns[name] = np.asarray(values, dtype="datetime64[s]")
+            else:
+                columns[name] = self._encode(name, values)
+        self._append_columns(columns, len(df))
+
+    def extend_batch(self, other):
+        """
+        Appends the lots of another batch, re-coding its text fields when it
+        does not share this batch's string tables
+        """
+        columns = other._columns()
+        for name, table in self.tables.items():
+            if other.tables[name] is not table:
+                codes = np.append(table.encode(other.tables[name].values), MISSING_CODE)
+                columns[name] = codes[columns[name]]
+        self._append_columns(columns, len(other))
+
+    def records(self):
+        """
+        :return: structured array in the TAX_LOT_DTYPE layout holding a copy of the lots
+        """
+        columns = self._columns()
+        records = np.empty(self.size, dtype=[(name, array.dtype) for name, array in columns.items()])
+        for name, array in columns.items():
+            records[name] = array
+        return records
+
+    def to_frame(self):
+        """
+        :return: DataFrame with the columns and dtypes of the FetchCSV tax lot
+            frames, led by account_id. Amount and date columns are views of
+            the batch arrays, repeated text fields become categoricals built
+            from the codes and ids become strings.
+        """
+        data = {}
+        for name, array in self._columns().items():
+            dtype = COLUMN_DTYPES[name]
+            if dtype == CATEGORY:
+                data[name] = pd.Categorical.from_codes(array, categories=self.tables[name].values, validate=False)
+            elif dtype == STRING:
+                data[name] = _decode_bytes(array)
+            elif dtype == BOOLEAN:
+                data[name] = pd.arrays.BooleanArray(array == 1, array == MISSING_CODE)
+            else:
+                # wrapped first, the frame constructor would copy datetime64[s] otherwise
+                data[name] = pd.Series(array, copy=False)
+        return pd.DataFrame(data, copy=False)
+
+    def to_arrow(self):
+        """
+        :return: pyarrow Table of the lots. Amounts and dates reuse the batch
+            arrays as Arrow buffers, repeated text fields are dictionary arrays
+            over the string tables, dates are timestamp[s].
+        """
+        import pyarrow as pa
+
+        arrays = {}
+        for name, array in self._columns().items():
+            dtype = COLUMN_DTYPES[name]
+            if dtype == CATEGORY:
+                indices = pa.array(array, mask=array == MISSING_CODE)
+                arrays[name] = pa.DictionaryArray.from_arrays(indices, pa.array(self.tables[name].values, pa.string()))
+            elif dtype == STRING:
+                arrays[name] = pa.array(_decode_bytes(array), pa.string())
+            elif dtype == BOOLEAN:
+                arrays[name] = pa.array(array == 1, mask=array == MISSING_CODE)
+            else:
+                arrays[name] = pa.array(array, from_pandas=True)
+        return pa.table(arrays)
+
+    def save(self, path: str):
+        """
+        Writes the batch as a folder of one .npy file per field plus the
+        string tables, readable with TaxLotBatch.load
+
+        :param path: folder to write, created when missing
+        """
+        os.makedirs(path, exist_ok=True)
+        for name, array in self._columns().items():
+            np.save(os.path.join(path, f"{name}.npy"), array)
+        with open(os.path.join(path, STRINGS_FILE), "w", encoding="utf-8") as f:
+            json.dump({name: table.values for name, table in self.tables.items()}, f)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True):
+        """
+        :param path: folder written by TaxLotBatch.save
+        :param mmap: memory map the arrays (ids included) read only instead of
+            reading them, appending to the batch copies them into memory first
+        :return: TaxLotBatch
+        """
+        with open(os.path.join(path, STRINGS_FILE), encoding="utf-8") as f:
+            tables = {name: StringTable(values) for name, values in json.load(f).items()}
+        arrays = {
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r" if mmap else None)
+            for name, dtype in FIELDS
+        }
+        return cls._from_arrays(arrays, tables)
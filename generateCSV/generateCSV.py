@@ -1,29 +1,181 @@
 import pandas as pd
 import os
 import logging
+from fetch_csv.fetch_csv import DATASET_COLUMNS
+from fetch_csv.query_builder import CATEGORY, FLOAT, DATETIME, BOOLEAN
 
 logger = logging.getLogger(__name__)
 
 CSV_DIR = os.path.join(os.getcwd(), "CSV")
 
+# file extension of each supported output format
+OUTPUT_FORMATS = {
+    "csv": ".csv",
+    "parquet": ".parquet",
+    "feather": ".feather",
+}
+
+# arrow types of the exported columns, so Parquet and Feather files have the
+# same schema on every run instead of one inferred from the values. They are
+# derived from the dtypes the fetched datasets declare.
+STRING, DOUBLE, BOOL, DATE, DICTIONARY = "string", "double", "bool", "date32", "dictionary"
+ARROW_TYPES = {
+    CATEGORY: DICTIONARY,
+    FLOAT: DOUBLE,
+    DATETIME: DATE,
+    BOOLEAN: BOOL,
+}
+
+
+def dataset_arrow_types(columns):
+    """
+    :param columns: list of fetch_csv Column
+    :return: dict of column name mapped to an arrow type name, with the
+        account_id column of consolidated multi-account exports first
+    """
+    return {"account_id": STRING, **{column.name: ARROW_TYPES.get(column.dtype, STRING) for column in columns}}
+
+
+DATASET_SCHEMAS = {name: dataset_arrow_types(columns) for name, columns in DATASET_COLUMNS.items()}
+TAX_LOTS_SCHEMA = DATASET_SCHEMAS["open_tax_lots"]
+
+
+def arrow_schema(df, column_types=None):
+    """
+    Builds an explicit pyarrow schema for a DataFrame
+
+    :param column_types: dict of column name mapped to an arrow type name,
+        columns missing from it are inferred (all-null columns become strings)
+    :return: pyarrow.Schema
+    """
+    import pyarrow as pa
+
+    column_types = column_types or {}
+    inferred = pa.Schema.from_pandas(df, preserve_index=False)
+    fields = []
+    for field in inferred:
+        type_name = column_types.get(field.name)
+        if type_name == DICTIONARY:
+            # int32 indices so every file and page shares one type whatever the category count
+            fields.append(pa.field(field.name, pa.dictionary(pa.int32(), pa.string())))
+        elif type_name is not None:
+            fields.append(pa.field(field.name, pa.type_for_alias(type_name)))
+        elif pa.types.is_null(field.type):
+            fields.append(pa.field(field.name, pa.string()))
+        else:
+            fields.append(field)
+    return pa.schema(fields)
+
+
+def output_path(name: str, output_format: str = "csv", directory: str = CSV_DIR):
+    """
+    :param name: dataset name without extension, may include a subdirectory
+    :return: full path of the dataset in the given format
+    """
+    return os.path.join(directory, name + OUTPUT_FORMATS[output_format])
+
+
+def read_output(path: str):
+    """
+    Reads a dataset written by GenerateCSV. Parquet and Feather files are
+    memory-mapped instead of being read into a buffer first.
+
+    :param path: .csv, .parquet or .feather file
+    :return: DataFrame
+    """
+    if path.endswith(OUTPUT_FORMATS["parquet"]):
+        import pyarrow.parquet as pq
+        return pq.read_table(path, memory_map=True).to_pandas()
+    if path.endswith(OUTPUT_FORMATS["feather"]):
+        import pyarrow.feather as feather
+        return feather.read_table(path, memory_map=True).to_pandas()
+    return pd.read_csv(path)
+
+
+def find_output(name: str, directory: str = CSV_DIR):
+    """
+    :param name: dataset name without extension
+    :return: path of the most recently written format of the dataset, or None
+    """
+    paths = [output_path(name, output_format, directory) for output_format in OUTPUT_FORMATS]
+    paths = [path for path in paths if os.path.exists(path)]
+    return max(paths, key=os.path.getmtime) if paths else None
+
+
 class GenerateCSV:
     def __init__(self, df):
         self.df = df
 
-    def save_to_csv(self, filename: str):
+    def save(self, name: str, output_format: str = "csv", compression: str = "zstd", schema: dict = None):
+        """
+        Saves the DataFrame in the chosen format
+
+        :param name: dataset name without extension, e.g. "holdings"
+        :param output_format: "csv", "parquet" or "feather"
+        :param compression: codec for Parquet and Feather ("zstd", "lz4", "snappy" (Parquet only) or None)
+        :param schema: arrow type names by column, defaults to the dataset's entry in DATASET_SCHEMAS
+        :return: True if saved, False otherwise
+        """
+        output_format = (output_format or "csv").lower()
+        if output_format not in OUTPUT_FORMATS:
+            logger.error("Unknown output format %s. Expected one of %s.", output_format, ", ".join(OUTPUT_FORMATS))
+            return False
+        filename = name + OUTPUT_FORMATS[output_format]
+        if output_format == "csv":
+            return self.save_to_csv(filename)
+        if schema is None:
+            schema = DATASET_SCHEMAS.get(os.path.basename(name))
+        return self.save_to_arrow(filename, output_format, compression, schema)
+
+    def save_to_arrow(self, filename: str, output_format: str = "parquet", compression: str = "zstd", schema: dict = None):
+        """
+        Writes a Parquet or Feather (Arrow IPC) file with an explicit schema.
+        The file is written next to the target and renamed into place, so
+        readers never see a half written file.
+        """
         if self.df is None or self.df.empty:
             logger.error("No data to save. DataFrame is None or empty.")
             return False
-        
-        # Ensure the CSV directory exists
         try:
-            os.makedirs(CSV_DIR, exist_ok=True)
-        except OSError:
-            logger.exception("Error creating directory %s.", CSV_DIR)
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            import pyarrow.feather as feather
+        except ImportError:
+            logger.error("Saving %s files requires the pyarrow package.", output_format)
+            return False
+
+        full_path = os.path.join(CSV_DIR, filename)
+        tmp_path = full_path + ".partial"
+        try:
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            table = pa.Table.from_pandas(self.df, schema=arrow_schema(self.df, schema), preserve_index=False)
+            if output_format == "parquet":
+                pq.write_table(table, tmp_path, compression=compression or "none")
+            else:
+                feather.write_feather(table, tmp_path, compression=compression or "uncompressed")
+            os.replace(tmp_path, full_path)
+            logger.info("%s file saved to %s", output_format.capitalize(), full_path)
+            return True
+        except Exception:
+            logger.exception("Error saving %s file to %s.", output_format, full_path)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return False
+
+    def save_to_csv(self, filename: str):
+        if self.df is None or self.df.empty:
+            logger.error("No data to save. DataFrame is None or empty.")
             return False
         
         # Construct full path in CSV folder
         full_path = os.path.join(CSV_DIR, filename)
+
+        # Ensure the CSV directory (and any subdirectory in filename) exists
+        try:
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        except OSError:
+            logger.exception("Error creating directory %s.", os.path.dirname(full_path))
+            return False
         
         try:
             self.df.to_csv(full_path, index=False)
@@ -32,3 +184,29 @@ class GenerateCSV:
         except Exception:
             logger.exception("Error saving CSV file to %s.", full_path)
             return False
+
+    def append_to_csv(self, filename: str):
+        """
+        Appends the rows to an existing CSV file, writing the header only
+        when the file does not exist yet
+        """
+        if self.df is None or self.df.empty:
+            logger.error("No data to append. DataFrame is None or empty.")
+            return False
+
+        full_path = os.path.join(CSV_DIR, filename)
+
+        try:
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        except OSError:
+            logger.exception("Error creating directory %s.", os.path.dirname(full_path))
+            return False
+
+        try:
+            write_header = not os.path.exists(full_path)
+            self.df.to_csv(full_path, index=False, mode="a", header=write_header)
+            logger.info("Appended %s rows to %s", len(self.df), full_path)
+            return True
+        except Exception:
+            logger.exception("Error appending to CSV file %s.", full_path)
+            return False
@@ -0,0 +1,286 @@
+"""
+Output sinks for streaming exports.
+
+A sink receives one DataFrame per fetched page and writes it out right away,
+so an export never has to be held in memory as a whole. Each sink writes to a
+temporary file or table and only replaces the previous output once the stream
+completed, so a failed run never leaves a truncated export behind. A stream
+that completed without any rows removes the previous output, the dataset is
+empty now and its old rows must not be published again.
+"""
+
+import os
+import sqlite3
+import logging
+import threading
+import pandas as pd
+from abc import ABC, abstractmethod
+from generateCSV.generateCSV import CSV_DIR, DATASET_SCHEMAS, arrow_schema
+from fetch_csv.query_builder import format_dates
+
+logger = logging.getLogger(__name__)
+
+
+def _remove_stale_output(path: str):
+    if os.path.exists(path):
+        os.remove(path)
+        logger.info("No rows streamed, removed the previous output %s.", path)
+
+
+class Sink(ABC):
+    @abstractmethod
+    def write(self, df: pd.DataFrame):
+        """
+        :param df: one page of rows, written out right away
+        """
+
+    @abstractmethod
+    def close(self, success: bool = True):
+        """
+        :param success: replace the previous output when True, discard what was written otherwise
+        """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(success=exc_type is None)
+        return False
+
+
+class CSVSink(Sink):
+    def __init__(self, filename: str, directory: str = CSV_DIR):
+        self.path = os.path.join(directory, filename)
+        self.partial_path = self.path + ".partial"
+        self.rows = 0
+        self._started = False
+
+    def __str__(self):
+        return self.path
+
+    def write(self, df: pd.DataFrame):
+        if df is None or df.empty:
+            return
+        if not self._started:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            df.to_csv(self.partial_path, index=False, mode="w")
+            self._started = True
+        else:
+            df.to_csv(self.partial_path, index=False, mode="a", header=False)
+        self.rows += len(df)
+
+    def close(self, success: bool = True):
+        if not self._started:
+            if success:
+                _remove_stale_output(self.path)
+            return
+        self._started = False
+        if success:
+            os.replace(self.partial_path, self.path)
+            logger.info("CSV file saved to %s", self.path)
+        else:
+            os.remove(self.partial_path)
+            logger.warning("Discarded incomplete CSV output for %s.", self.path)
+
+
+class ParquetSink(Sink):
+    def __init__(self, filename: str, directory: str = CSV_DIR, compression: str = "snappy", schema=None, column_types: dict = None):
+        """
+        :param schema: optional pyarrow.Schema, built from the first page when omitted
+        :param column_types: arrow type names by column used to build the schema,
+            the other columns are inferred from the first page
+        """
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError as e:
+            raise ImportError("ParquetSink requires the pyarrow package.") from e
+        self.path = os.path.join(directory, filename)
+        self.partial_path = self.path + ".partial"
+        self.compression = compression
+        self.schema = schema
+        self.column_types = column_types
+        self.rows = 0
+        self._writer = None
+
+    def __str__(self):
+        return self.path
+
+    def write(self, df: pd.DataFrame):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if df is None or df.empty:
+            return
+        if self.schema is None:
+            # columns that are all null on the first page are stored as strings
+            self.schema = arrow_schema(df, self.column_types).remove_metadata()
+        table = pa.Table.from_pandas(df, schema=self.schema, preserve_index=False)
+        if self._writer is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._writer = pq.ParquetWriter(self.partial_path, self.schema, compression=self.compression)
+        # one row group per page
+        self._writer.write_table(table)
+        self.rows += len(df)
+
+    def close(self, success: bool = True):
+        if self._writer is None:
+            if success:
+                _remove_stale_output(self.path)
+            return
+        self._writer.close()
+        self._writer = None
+        if success:
+            os.replace(self.partial_path, self.path)
+            logger.info("Parquet file saved to %s", self.path)
+        else:
+            os.remove(self.partial_path)
+            logger.warning("Discarded incomplete Parquet output for %s.", self.path)
+
+
+class SQLiteSink(Sink):
+    def __init__(self, table: str, db_path: str = os.path.join(CSV_DIR, "m1_data.db")):
+        self.table = table
+        self.partial_table = f"{table}__partial"
+        self.db_path = db_path
+        self.rows = 0
+        self._conn = None
+        self._insert_sql = None
+
+    def __str__(self):
+        return f"{self.db_path}:{self.table}"
+
+    @staticmethod
+    def _column_type(dtype):
+        if pd.api.types.is_bool_dtype(dtype) or pd.api.types.is_integer_dtype(dtype):
+            return "INTEGER"
+        if pd.api.types.is_float_dtype(dtype):
+            return "REAL"
+        return "TEXT"
+
+    def write(self, df: pd.DataFrame):
+        if df is None or df.empty:
+            return
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            # pages are written from worker threads, one at a time
+            self._conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+            columns = ", ".join(f'"{col}" {self._column_type(dtype)}' for col, dtype in df.dtypes.items())
+            with self._conn:
+                self._conn.execute(f'DROP TABLE IF EXISTS "{self.partial_table}"')
+                self._conn.execute(f'CREATE TABLE "{self.partial_table}" ({columns})')
+            placeholders = ", ".join("?" for _ in df.columns)
+            self._insert_sql = f'INSERT INTO "{self.partial_table}" VALUES ({placeholders})'
+
+        # object dtype turns numpy scalars into Python ones sqlite3 can bind, dates are stored as ISO text
+        df = format_dates(df)
+        values = df.astype(object).where(df.notna(), None)
+        with self._conn:
+            self._conn.executemany(self._insert_sql, values.itertuples(index=False, name=None))
+        self.rows += len(df)
+
+    def close(self, success: bool = True):
+        if self._conn is None:
+            if success and os.path.exists(self.db_path):
+                conn = sqlite3.connect(self.db_path, timeout=30)
+                try:
+                    with conn:
+                        conn.execute(f'DROP TABLE IF EXISTS "{self.table}"')
+                finally:
+                    conn.close()
+                logger.info("No %s rows streamed, dropped the previous table.", self.table)
+            return
+        try:
+            with self._conn:
+                if success:
+                    self._conn.execute(f'DROP TABLE IF EXISTS "{self.table}"')
+                    self._conn.execute(f'ALTER TABLE "{self.partial_table}" RENAME TO "{self.table}"')
+                else:
+                    self._conn.execute(f'DROP TABLE IF EXISTS "{self.partial_table}"')
+        finally:
+            self._conn.close()
+            self._conn = None
+        if success:
+            logger.info("SQLite table %s saved to %s", self.table, self.db_path)
+        else:
+            logger.warning("Discarded incomplete SQLite output for %s.", self.table)
+
+
+class SharedSink:
+    def __init__(self, sink: Sink, streams: int):
+        """
+        One output written by several streams at once, such as the consolidated
+        export every account streams into. Pages are written one at a time and
+        the output is only kept when every stream completed.
+
+        :param sink: sink of the consolidated output
+        :param streams: number of streams writing to it
+        """
+        self.sink = sink
+        self.remaining = streams
+        self.success = True
+        self._lock = threading.Lock()
+
+    def __str__(self):
+        return str(self.sink)
+
+    def write(self, df: pd.DataFrame):
+        with self._lock:
+            self.sink.write(df)
+
+    def release(self, success: bool = True):
+        """
+        Called once by every stream when it is done, the last one closes the output
+        """
+        with self._lock:
+            self.success = self.success and success
+            self.remaining -= 1
+            if self.remaining == 0:
+                self.sink.close(self.success)
+
+
+class AccountSink(Sink):
+    def __init__(self, sink: Sink, shared: SharedSink, account_id: str):
+        """
+        Writes one account's pages to its own sink and, with a leading
+        account_id column, to the consolidated SharedSink
+
+        :param sink: sink of the account's own output
+        :param shared: consolidated output of every account
+        """
+        self.sink = sink
+        self.shared = shared
+        self.account_id = account_id
+
+    def __str__(self):
+        return f"{self.sink} and {self.shared}"
+
+    def write(self, df: pd.DataFrame):
+        if df is None or df.empty:
+            return
+        self.sink.write(df)
+        self.shared.write(df.assign(account_id=self.account_id)[["account_id", *df.columns]])
+
+    def close(self, success: bool = True):
+        try:
+            self.sink.close(success)
+        finally:
+            self.shared.release(success)
+
+
+def create_sink(kind: str, name: str, directory: str = CSV_DIR):
+    """
+    Creates a sink for one dataset
+
+    :param kind: "csv", "parquet" or "sqlite"
+    :param name: dataset name, used as file stem or table name
+    :param directory: output directory
+    :return: Sink instance
+    """
+    kind = (kind or "csv").lower()
+    if kind == "csv":
+        return CSVSink(f"{name}.csv", directory)
+    if kind == "parquet":
+        return ParquetSink(f"{name}.parquet", directory, column_types=DATASET_SCHEMAS.get(name))
+    if kind == "sqlite":
+        return SQLiteSink(name, os.path.join(directory, "m1_data.db"))
+    raise ValueError(f"Unknown sink type: {kind}")
@@ -0,0 +1,284 @@
+"""
+Async GraphQL transport for lens.m1.com.
+
+Wraps a pooled httpx.AsyncClient (keep-alive reuse, optional HTTP/2) so that
+several requests can be in flight on one event loop. Blocking callers use the
+sync facade (run / close), which drives coroutines on a loop owned by the
+client so the connection pool survives between calls.
+"""
+
+import asyncio
+import hashlib
+import time
+import logging
+import json
+import httpx
+from lens_client.request_policy import RequestPolicy
+
+try:
+    import orjson
+except ImportError:  # optional, the stdlib decoder is used instead
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+LENS_URL = "https://lens.m1.com/graphql"
+
+BASE_HEADERS = {
+    "Accept": "*/*",
+    "Accept-Language": "en-US,en;q=0.5",
+    "Referer": "https://dashboard.m1.com/",
+    "content-type": "application/json",
+    "Origin": "https://dashboard.m1.com",
+    "Sec-Fetch-Dest": "empty",
+    "Sec-Fetch-Mode": "cors",
+    "Sec-Fetch-Site": "same-site",
+}
+
+
+class GraphQLResponseError(Exception):
+    def __init__(self, operation_name: str, errors):
+        self.operation_name = operation_name
+        self.errors = errors
+        super().__init__(f"GraphQL errors for {operation_name}: {errors}")
+
+
+def decode_json(content: bytes):
+    """
+    :param content: raw response body
+    :return: decoded JSON, with orjson when it is installed
+    """
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+PERSISTED_QUERY_NOT_FOUND = "PERSISTED_QUERY_NOT_FOUND"
+PERSISTED_QUERY_NOT_SUPPORTED = "PERSISTED_QUERY_NOT_SUPPORTED"
+
+
+def _persisted_query_error(data):
+    """
+    Returns the automatic persisted query error code reported in a GraphQL
+    response, or None when the response is not an APQ error
+    """
+    for error in (data or {}).get("errors") or []:
+        code = (error.get("extensions") or {}).get("code")
+        message = error.get("message")
+        if code == PERSISTED_QUERY_NOT_FOUND or message == "PersistedQueryNotFound":
+            return PERSISTED_QUERY_NOT_FOUND
+        if code == PERSISTED_QUERY_NOT_SUPPORTED or message == "PersistedQueryNotSupported":
+            return PERSISTED_QUERY_NOT_SUPPORTED
+    return None
+
+
+def _is_unauthenticated(data):
+    for error in (data or {}).get("errors") or []:
+        if (error.get("extensions") or {}).get("code") == "UNAUTHENTICATED":
+            return True
+    return False
+
+
+class LensClient:
+    def __init__(
+        self,
+        segmentID: str = "",
+        max_connections: int = 10,
+        max_keepalive_connections: int = 10,
+        keepalive_expiry: float = 30.0,
+        timeout: float = 30.0,
+        http2: bool = False,
+        persisted_queries: bool = False,
+        policy: RequestPolicy = None,
+    ):
+        self.segmentID = segmentID
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.timeout = timeout
+        self.http2 = http2
+        self.persisted_queries = persisted_queries
+        # retries, backoff and circuit breaking applied to every request
+        self.policy = policy if policy is not None else RequestPolicy()
+        # sha256 hashes the server has accepted, and hashes it would not register
+        self.accepted_query_hashes = set()
+        self.rejected_query_hashes = set()
+        self.access_token = ""
+        self.refresh_token = ""
+        # async callable returning True once new tokens are set, installed by Authenticate
+        self.reauthenticate = None
+        self._reauth_lock = None
+        self._client = None
+        self._loop = None
+
+    @property
+    def client(self):
+        """
+        Lazily builds the pooled httpx.AsyncClient
+
+        :return: httpx.AsyncClient shared by every request of this LensClient
+        """
+        if self._client is None:
+            http2 = self.http2
+            if http2:
+                try:
+                    import h2  # noqa: F401
+                except ImportError:
+                    logger.warning("HTTP/2 requested but the h2 package is not installed. Falling back to HTTP/1.1.")
+                    http2 = False
+            self._client = httpx.AsyncClient(
+                http2=http2,
+                headers=BASE_HEADERS,
+                timeout=httpx.Timeout(self.timeout),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive_connections,
+                    keepalive_expiry=self.keepalive_expiry,
+                ),
+            )
+        return self._client
+
+    def get_headers(self, operation_name: str, authenticated: bool = True, extra_headers=None):
+        headers = {
+            "x-client-sentinel": str(int(time.time() * 1000)),
+            "x-segment-id": self.segmentID,
+            "x-apollo-operation-name": operation_name,
+        }
+        if authenticated:
+            headers["x-client-id"] = "m1-web/10.0.170"
+            headers["authorization"] = f"Bearer {self.access_token}"
+        if extra_headers:
+            headers.update(extra_headers)
+        return headers
+
+    async def _post(self, operation_name: str, payload: dict, authenticated: bool, extra_headers=None, allow_error_status: bool = False, decoder=None):
+        response = await self.client.post(
+            LENS_URL,
+            json=payload,
+            headers=self.get_headers(operation_name, authenticated, extra_headers),
+        )
+        decode = decoder or decode_json
+        if allow_error_status and response.status_code == 400:
+            # APQ misses may come back as 400 with a GraphQL error body
+            try:
+                data = decode(response.content)
+            except ValueError:
+                data = None
+            if _persisted_query_error(data):
+                return data
+        response.raise_for_status()
+        return decode(response.content)
+
+    async def graphql(self, operation_name: str, query: str, variables: dict, authenticated: bool = True, extra_headers=None, persisted=None, decoder=None):
+        """
+        Sends one GraphQL operation and returns the decoded JSON body. Transient
+        failures are retried according to the client's RequestPolicy, and when
+        the server rejects the access token the request is retried once after
+        re-authenticating.
+
+        :param operation_name: GraphQL operation name
+        :param query: GraphQL document
+        :param variables: operation variables
+        :param authenticated: send the bearer token with the request
+        :param persisted: override the client's persisted-query setting
+        :param decoder: callable decoding the response body, e.g. a typed
+            decoder skipping unused fields, stdlib-compatible JSON by default.
+            It must raise ValueError on malformed bodies.
+        :return: decoded response (GraphQL errors are left in "errors")
+        """
+        def send():
+            return self.policy.execute(
+                lambda: self._graphql(operation_name, query, variables, authenticated, extra_headers, persisted, decoder),
+                operation_name,
+            )
+
+        token = self.access_token
+        try:
+            data = await send()
+        except httpx.HTTPStatusError as e:
+            if not (authenticated and e.response.status_code == 401 and await self._reauthenticate(token)):
+                raise
+            return await send()
+        if authenticated and _is_unauthenticated(data) and await self._reauthenticate(token):
+            return await send()
+        return data
+
+    async def _reauthenticate(self, rejected_token: str):
+        if self.reauthenticate is None:
+            return False
+        if self._reauth_lock is None:
+            self._reauth_lock = asyncio.Lock()
+        async with self._reauth_lock:
+            # another request already replaced the rejected token
+            if self.access_token and self.access_token != rejected_token:
+                return True
+            return await self.reauthenticate()
+
+    async def _graphql(self, operation_name: str, query: str, variables: dict, authenticated: bool = True, extra_headers=None, persisted=None, decoder=None):
+        """
+        In persisted-query mode only the sha256 hash of the document is sent.
+        When the server reports the hash as unknown the full text is sent once
+        alongside the hash so the server can register it.
+        """
+        use_persisted = self.persisted_queries if persisted is None else persisted
+        payload = {
+            "operationName": operation_name,
+            "variables": variables,
+        }
+        query_hash = hashlib.sha256(query.encode("utf-8")).hexdigest() if use_persisted else None
+        if not use_persisted or query_hash in self.rejected_query_hashes:
+            payload["query"] = query
+            return await self._post(operation_name, payload, authenticated, extra_headers, decoder=decoder)
+
+        payload["extensions"] = {"persistedQuery": {"version": 1, "sha256Hash": query_hash}}
+        data = await self._post(operation_name, payload, authenticated, extra_headers, allow_error_status=True, decoder=decoder)
+        error_code = _persisted_query_error(data)
+        if error_code is None:
+            self.accepted_query_hashes.add(query_hash)
+            return data
+
+        if error_code == PERSISTED_QUERY_NOT_SUPPORTED:
+            logger.info("Persisted queries not supported for %s. Sending full query text.", operation_name)
+            self.rejected_query_hashes.add(query_hash)
+            del payload["extensions"]
+        elif query_hash in self.accepted_query_hashes:
+            logger.info("Persisted query for %s was evicted by the server. Registering it again.", operation_name)
+        payload["query"] = query
+        data = await self._post(operation_name, payload, authenticated, extra_headers, allow_error_status=True, decoder=decoder)
+        if _persisted_query_error(data):
+            # the server will not register the document, stop sending the hash
+            self.rejected_query_hashes.add(query_hash)
+            self.accepted_query_hashes.discard(query_hash)
+            payload.pop("extensions", None)
+            data = await self._post(operation_name, payload, authenticated, extra_headers, decoder=decoder)
+        elif "errors" not in data and error_code == PERSISTED_QUERY_NOT_FOUND:
+            self.accepted_query_hashes.add(query_hash)
+        return data
+
+    def run(self, coro):
+        """
+        Runs a coroutine to completion on the client's own event loop so
+        blocking callers keep reusing the same connection pool
+
+        :param coro: coroutine to run
+        :return: the coroutine's result
+        """
+        if self._loop is None or self._loop.is_closed():
+            self._loop = asyncio.new_event_loop()
+        return self._loop.run_until_complete(coro)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def close(self):
+        try:
+            if self._client is not None:
+                self.run(self.aclose())
+        except Exception:
+            logger.exception("Error closing lens.m1.com client.")
+        finally:
+            if self._loop is not None and not self._loop.is_closed():
+                self._loop.close()
+            self._loop = None
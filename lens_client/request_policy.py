@@ -0,0 +1,176 @@
+"""
+Retry, backoff and circuit breaking shared by every lens.m1.com request.
+
+Transient failures (connection errors, timeouts, 429/5xx responses and
+GraphQL errors flagged as transient) are retried with jittered exponential
+backoff, honouring Retry-After. Anything else is treated as fatal and
+surfaces immediately. A circuit breaker stops sending requests for a while
+once the endpoint keeps failing, so a run fails fast instead of retrying
+every page against a server that is down.
+"""
+
+import time
+import random
+import asyncio
+import logging
+import email.utils
+import httpx
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+RETRYABLE_GRAPHQL_CODES = {
+    "INTERNAL_SERVER_ERROR",
+    "SERVICE_UNAVAILABLE",
+    "TIMEOUT",
+    "RATE_LIMITED",
+    "TOO_MANY_REQUESTS",
+    "DOWNSTREAM_SERVICE_ERROR",
+}
+# never wait longer than this for a single Retry-After
+MAX_RETRY_AFTER_SECONDS = 300
+
+
+class CircuitOpenError(httpx.HTTPError):
+    """Raised without sending a request while the circuit breaker is open."""
+
+    def __init__(self, retry_in: float):
+        self.retry_in = retry_in
+        super().__init__(f"lens.m1.com circuit breaker is open, retrying in {retry_in:.0f}s.")
+
+
+def parse_retry_after(value):
+    """
+    :param value: Retry-After header value, either seconds or an HTTP date
+    :return: delay in seconds, or None if the header is missing or invalid
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+        return max(0.0, retry_at.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable_graphql_error(data):
+    """
+    :param data: decoded GraphQL response
+    :return: True if every error in the response is a transient server error
+    """
+    errors = (data or {}).get("errors") or []
+    if not errors:
+        return False
+    return all((error.get("extensions") or {}).get("code") in RETRYABLE_GRAPHQL_CODES for error in errors)
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 60.0):
+        """
+        :param failure_threshold: consecutive transient failures that open the circuit
+        :param reset_timeout: seconds the circuit stays open before one trial request is let through
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def before_request(self):
+        if self.opened_at is None:
+            return
+        remaining = self.opened_at + self.reset_timeout - time.monotonic()
+        if remaining > 0:
+            raise CircuitOpenError(remaining)
+        # half-open: let this request through as a trial, the next failure re-opens
+        self.opened_at = None
+        self.failures = self.failure_threshold - 1
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.failures >= self.failure_threshold and self.opened_at is None:
+            self.opened_at = time.monotonic()
+            logger.error(
+                "lens.m1.com failed %s times in a row. Failing fast for %ss.",
+                self.failures, self.reset_timeout,
+            )
+
+
+class RequestPolicy:
+    def __init__(
+        self,
+        max_attempts: int = 4,
+        base_delay: float = 0.5,
+        max_delay: float = 30.0,
+        circuit_breaker: CircuitBreaker = None,
+    ):
+        self.max_attempts = max(1, int(max_attempts))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.circuit_breaker = circuit_breaker if circuit_breaker is not None else CircuitBreaker()
+
+    def backoff(self, attempt: int, retry_after=None):
+        """
+        :param attempt: number of attempts made so far (1 after the first failure)
+        :param retry_after: delay requested by the server, if any
+        :return: seconds to wait before the next attempt
+        """
+        if retry_after is not None:
+            return min(retry_after, MAX_RETRY_AFTER_SECONDS)
+        # full jitter keeps concurrent pagination loops from retrying in lockstep
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    async def execute(self, send, description: str = "request"):
+        """
+        Runs send() until it succeeds, fails fatally or runs out of attempts
+
+        :param send: coroutine function performing one request and returning the decoded body
+        :param description: name used in log messages
+        :return: decoded body of the last attempt (it may still hold GraphQL errors)
+        """
+        attempt = 0
+        while True:
+            self.circuit_breaker.before_request()
+            attempt += 1
+            retry_after = None
+            try:
+                data = await send()
+            except httpx.HTTPStatusError as e:
+                if e.response.status_code not in RETRYABLE_STATUS_CODES:
+                    raise
+                self.circuit_breaker.record_failure()
+                if attempt >= self.max_attempts:
+                    raise
+                retry_after = parse_retry_after(e.response.headers.get("Retry-After"))
+                reason = f"HTTP {e.response.status_code}"
+            except httpx.TransportError as e:
+                self.circuit_breaker.record_failure()
+                if attempt >= self.max_attempts:
+                    raise
+                reason = type(e).__name__
+            else:
+                if not is_retryable_graphql_error(data):
+                    self.circuit_breaker.record_success()
+                    return data
+                self.circuit_breaker.record_failure()
+                if attempt >= self.max_attempts:
+                    return data
+                reason = "transient GraphQL error"
+
+            delay = self.backoff(attempt, retry_after)
+            logger.warning(
+                "%s failed (%s), attempt %s of %s. Retrying in %.1fs.",
+                description, reason, attempt, self.max_attempts, delay,
+            )
+            await asyncio.sleep(delay)
@@ -1,19 +1,30 @@
 from dotenv import load_dotenv
 from auth.authenticate import Authenticate
-from fetch_csv.fetch_csv import FetchCSV
+from auth.token_cache import TokenCache
+from lens_client.lens_client import LensClient
+from lens_client.request_policy import RequestPolicy, CircuitBreaker
+from fetch_csv.fetch_csv import FetchCSV, TAX_LOTS_DATASET, consolidate_accounts
+from fetch_csv.lot_store import ClosedLotStore
+import pandas as pd
 import os
-from generateCSV.generateCSV import GenerateCSV
+import re
+from generateCSV.generateCSV import GenerateCSV, CSV_DIR
+from generateCSV.sinks import create_sink, SharedSink, AccountSink
 import json
-from checkForState import check_for_state_file
+import argparse
+from checkForState import check_for_state_file, update_state_file
 from spreadsheets.spreadsheetManager import spreadsheetManager
 from logger.logger import setup_logging
 import logging
-# from database.database_setup import Asset coming soon
 
 CONFIG_DIR = os.getenv("CONFIG_DIR", os.path.join(os.getcwd(), "config"))
 STATE_FILE = os.path.join(CONFIG_DIR, "state.json")
 ENV_FILE = os.path.join(CONFIG_DIR, ".env")
 SERVICE_ACCOUNT_FILE = os.path.join(CONFIG_DIR, "serviceAccount.json")
+CLOSED_LOTS_STORE_FILE = os.path.join(CONFIG_DIR, "closed_lots.db")
+TOKEN_CACHE_FILE = os.path.join(CONFIG_DIR, "tokens.json")
+SHEET_SNAPSHOT_FILE = os.path.join(CONFIG_DIR, "sheet_snapshots.db")
+SECURITY_METADATA_FILE = os.path.join(CONFIG_DIR, "security_metadata.db")
 
 ENV_TEMPLATE = [
     "EMAIL=",
@@ -86,21 +97,230 @@ MFAAUDIENCE = os.getenv("MFA_AUDIENCE", "false").lower() == "true"
 SEGMENTID = os.getenv("SEGMENT_ID", "")
 ACCOUNTID = os.getenv("ACCOUNT_ID", "")
 OTHERACCOUNTID = os.getenv("OTHER_ACCOUNT_ID", "")
+# OTHER_ACCOUNT_ID may list several accounts under the same login, separated by commas
+ACCOUNT_IDS = [account_id.strip() for account_id in OTHERACCOUNTID.split(",") if account_id.strip()]
+MULTI_ACCOUNT = len(ACCOUNT_IDS) > 1
 ENABLE_GOOGLE_SHEETS_INTEGRATION = state_data.get("ENABLE_GOOGLE_SHEETS_INTEGRATION", False)
 CREDENTIALS_PATH = os.path.join(CONFIG_DIR, "serviceAccount.json")
 CREATE_NEW_SPREADSHEET = state_data.get("CREATE_NEW_SPREADSHEET", False)
 CREATE_CSV_FILES = state_data.get("CREATE_CSV_FILES", False)
+OUTPUT_FORMAT = state_data.get("OUTPUT_FORMAT", "csv")
+OUTPUT_COMPRESSION = state_data.get("OUTPUT_COMPRESSION", "zstd")
 GENERATE_TAX_LOTS_SHEETS = state_data.get("GENERATE_TAX_LOTS_SHEETS", False)
 SPREADSHEET_NAME = state_data.get("SPREADSHEET_NAME", "M1 Finance Management")
+# filled in after the first successful lookup by name
+SPREADSHEET_ID = state_data.get("SPREADSHEET_ID", "")
 USE_DATABASE = state_data.get("USE_DATABASE", False)
+CONCURRENT_FETCH = state_data.get("CONCURRENT_FETCH", False)
+FETCH_MAX_WORKERS = state_data.get("FETCH_MAX_WORKERS", 3)
+HTTP_MAX_CONNECTIONS = state_data.get("HTTP_MAX_CONNECTIONS", 10)
+HTTP_KEEPALIVE_CONNECTIONS = state_data.get("HTTP_KEEPALIVE_CONNECTIONS", 10)
+HTTP_TIMEOUT_SECONDS = state_data.get("HTTP_TIMEOUT_SECONDS", 30)
+USE_HTTP2 = state_data.get("USE_HTTP2", False)
+USE_PERSISTED_QUERIES = state_data.get("USE_PERSISTED_QUERIES", False)
+STREAM_OUTPUTS = state_data.get("STREAM_OUTPUTS", False)
+STREAM_SINK = state_data.get("STREAM_SINK", "csv")
+# Sheets reads streamed exports back from the CSV folder, which only the csv sink writes to
+SHEETS_CAN_READ_STREAMS = str(STREAM_SINK).lower() == "csv"
+INCREMENTAL_CLOSED_LOTS = state_data.get("INCREMENTAL_CLOSED_LOTS", False)
+INCREMENTAL_PAGE_SIZE = state_data.get("INCREMENTAL_PAGE_SIZE", 200)
+CACHE_AUTH_TOKENS = state_data.get("CACHE_AUTH_TOKENS", True)
+RETRY_MAX_ATTEMPTS = state_data.get("RETRY_MAX_ATTEMPTS", 4)
+RETRY_BASE_DELAY_SECONDS = state_data.get("RETRY_BASE_DELAY_SECONDS", 0.5)
+RETRY_MAX_DELAY_SECONDS = state_data.get("RETRY_MAX_DELAY_SECONDS", 30)
+CIRCUIT_BREAKER_THRESHOLD = state_data.get("CIRCUIT_BREAKER_THRESHOLD", 5)
+CIRCUIT_BREAKER_RESET_SECONDS = state_data.get("CIRCUIT_BREAKER_RESET_SECONDS", 60)
+PUBLISH_PARTIAL_DATA = state_data.get("PUBLISH_PARTIAL_DATA", False)
+DELTA_SHEET_UPDATES = state_data.get("DELTA_SHEET_UPDATES", False)
+CACHE_SECURITY_METADATA = state_data.get("CACHE_SECURITY_METADATA", True)
+DAEMON_INTERVAL_MINUTES = state_data.get("DAEMON_INTERVAL_MINUTES", 15)
+DAEMON_MARKET_HOURS_ONLY = state_data.get("DAEMON_MARKET_HOURS_ONLY", True)
+DAEMON_TAX_LOTS_TIME = state_data.get("DAEMON_TAX_LOTS_TIME", "02:00")
 
-def fetchM1Data():
+# dataset label, output file stem and key of the frames handed to spreadsheetManager
+DATASET_FILES = [
+    ("open tax lots", "open_tax_lots", "open"),
+    ("closed tax lots", "closed_tax_lots", "closed"),
+    ("holdings", "holdings", "holdings"),
+]
+
+def account_dir(account_id):
+    """
+    :return: output subdirectory of one account, relative to the CSV folder
+    """
+    return os.path.join("accounts", re.sub(r"[^A-Za-z0-9_-]", "_", account_id))
+
+def drop_partial(fetcher, label, df, account_id=None):
+    """
+    Keeps a dataset only if it was fetched completely, unless publishing
+    partial data is enabled. Dropped datasets leave the previous export in place.
+    """
+    if df is None or PUBLISH_PARTIAL_DATA or fetcher.isComplete(label, account_id):
+        return df
+    logger.error(
+        "%s data is partial. Keeping the previous export instead of publishing it.",
+        fetcher._label(label, account_id).capitalize(),
+    )
+    return None
+
+def save_dataset(df, name, label):
+    """
+    Saves a dataset in OUTPUT_FORMAT when file output is enabled
+
+    :param name: file name without extension, may include a subdirectory
+    """
+    if df is None:
+        return
+    try:
+        GenerateCSV_instance = GenerateCSV(df)
+        if CREATE_CSV_FILES:
+            GenerateCSV_instance.save(name, OUTPUT_FORMAT, compression=OUTPUT_COMPRESSION)
+        else:
+            logger.info("Skipping CSV generation for %s as per configuration.", label)
+    except Exception:
+        logger.exception("Error saving %s output.", label)
+
+def save_account_datasets(fetcher, results, skip=()):
+    """
+    Writes each account's datasets to its own folder, plus one consolidated
+    file per dataset with an account_id column. The consolidated file is only
+    replaced when every account's part could be published.
+
+    :param results: dict of account id mapped to (open tax lots, closed tax lots, holdings)
+    :param skip: labels of datasets that were not fetched this run
+    :return: dict of the consolidated frames keyed by "open", "closed" and "holdings"
+    """
+    consolidated = {}
+    for index, (label, name, key) in enumerate(DATASET_FILES):
+        if label in skip:
+            continue
+        frames = {}
+        for account_id, datasets in results.items():
+            df = drop_partial(fetcher, label, datasets[index], account_id)
+            if df is None:
+                continue
+            save_dataset(df, os.path.join(account_dir(account_id), name), fetcher._label(label, account_id))
+            frames[account_id] = df
+        if len(frames) < len(results):
+            logger.error("Not every account returned %s. Keeping the previous consolidated export.", label)
+            continue
+        consolidated[key] = consolidate_accounts(frames)
+        if consolidated[key] is None and key != "holdings":
+            # no account holds lots, still publish that so stale lots are removed
+            consolidated[key] = pd.DataFrame(columns=["account_id", *TAX_LOTS_DATASET.column_names])
+        save_dataset(consolidated[key], name, label)
+    return consolidated
+
+def sync_closed_tax_lots(fetcher, account_ids=None):
+    """
+    Appends closed tax lots that were not exported before to closed_tax_lots.csv.
+    Falls back to a full download when there is no usable previous export.
+
+    :param account_ids: sync several accounts into one closed_tax_lots.csv with an account_id column
+    :return: DataFrame of the lots written this run, or None if the sync failed
+    """
+    columns = TAX_LOTS_DATASET.column_names
+    if account_ids:
+        columns = ["account_id", *columns]
+
+    def collect(fetch):
+        # returns the (consolidated) lots and whether every account completed
+        if not account_ids:
+            df = fetch(None)
+            return df, df is not None and fetcher.isComplete("closed tax lots")
+        frames = {account_id: fetch(account_id) for account_id in account_ids}
+        complete = all(
+            df is not None and fetcher.isComplete("closed tax lots", account_id)
+            for account_id, df in frames.items()
+        )
+        df = consolidate_accounts(frames)
+        return (df if df is not None else pd.DataFrame(columns=columns)), complete
+
+    store = ClosedLotStore(CLOSED_LOTS_STORE_FILE)
+    try:
+        csv_path = os.path.join(CSV_DIR, "closed_tax_lots.csv")
+        full_sync = not os.path.exists(csv_path) or store.count() == 0
+        if not full_sync:
+            try:
+                full_sync = pd.read_csv(csv_path, nrows=0).columns.tolist() != columns
+            except Exception:
+                logger.exception("Could not read %s header.", csv_path)
+                full_sync = True
+
+        if full_sync:
+            logger.info("No usable closed tax lots export found. Running a full closed tax lots download.")
+            closedTaxLots, complete = collect(lambda account_id: fetcher._fetch_lot_type("CLOSED", account_id))
+            # a partial history would leave gaps the incremental sync never revisits
+            if not complete:
+                logger.error("Closed tax lots download did not complete. Not seeding the incremental store.")
+                return None
+            if GenerateCSV(closedTaxLots).save_to_csv("closed_tax_lots.csv"):
+                store.seed(closedTaxLots, account_ids)
+            return closedTaxLots
+
+        newClosedTaxLots, complete = collect(
+            lambda account_id: fetcher.fetchNewClosedLots(store, page_size=INCREMENTAL_PAGE_SIZE, account_id=account_id)
+        )
+        if not complete:
+            logger.error("Closed tax lots sync did not reach every new lot. Nothing appended, retrying next run.")
+            return None
+        if newClosedTaxLots.empty:
+            return newClosedTaxLots
+        # only mark lots as exported once they are on disk
+        if GenerateCSV(newClosedTaxLots).append_to_csv("closed_tax_lots.csv"):
+            store.add(newClosedTaxLots)
+        return newClosedTaxLots
+    finally:
+        store.close()
+
+def create_lens_client():
+    return LensClient(
+        SEGMENTID,
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_KEEPALIVE_CONNECTIONS,
+        timeout=HTTP_TIMEOUT_SECONDS,
+        http2=USE_HTTP2,
+        persisted_queries=USE_PERSISTED_QUERIES,
+        policy=RequestPolicy(
+            max_attempts=RETRY_MAX_ATTEMPTS,
+            base_delay=RETRY_BASE_DELAY_SECONDS,
+            max_delay=RETRY_MAX_DELAY_SECONDS,
+            circuit_breaker=CircuitBreaker(CIRCUIT_BREAKER_THRESHOLD, CIRCUIT_BREAKER_RESET_SECONDS),
+        ),
+    )
+
+def create_authenticator(lens_client):
+    token_cache = TokenCache(TOKEN_CACHE_FILE) if CACHE_AUTH_TOKENS else None
+    return Authenticate(EMAIL, PASSWORD, MFAAUDIENCE, SEGMENTID, client=lens_client, token_cache=token_cache)
+
+def fetchM1Data(lens_client=None, auth=None, include_tax_lots=True):
+    """
+    Logs into M1, fetches the configured datasets and writes the outputs
+
+    :param lens_client: client kept open between daemon cycles. When omitted a
+        new one is created and closed again before returning.
+    :param auth: Authenticate bound to lens_client, kept between daemon cycles
+    :param include_tax_lots: set to False to only fetch holdings
+    :return: tuple of (Google credentials when Sheets integration is enabled, otherwise None,
+        dict of the complete DataFrames fetched this run keyed by "open", "closed" and "holdings",
+        plus "new closed" with the lots appended by the incremental closed lots sync)
+    """
+    owns_client = lens_client is None
+    if owns_client:
+        lens_client = create_lens_client()
     try:
-        auth = Authenticate(EMAIL, PASSWORD, MFAAUDIENCE, SEGMENTID)
-        auth_session = auth.login()
+        if auth is None:
+            auth = create_authenticator(lens_client)
+        # a warm client only renews its token when it is about to expire
+        auth_session = auth.ensure_fresh() if lens_client.access_token else auth.login()
         creds = None
+        if ENABLE_GOOGLE_SHEETS_INTEGRATION and STREAM_OUTPUTS and not SHEETS_CAN_READ_STREAMS:
+            logger.error(
+                "Google Sheets can only publish streamed outputs written with STREAM_SINK=csv, not %s. Skipping Sheets this run.",
+                STREAM_SINK,
+            )
         # generate Google Sheets credentials 
-        if ENABLE_GOOGLE_SHEETS_INTEGRATION:
+        elif ENABLE_GOOGLE_SHEETS_INTEGRATION:
             try:
                 creds = auth.auth_google_sheets(credentials_path=CREDENTIALS_PATH)
                 if creds:
@@ -112,70 +332,218 @@ def fetchM1Data():
                 creds = None
         if auth_session:
             try:
-                fetcher = FetchCSV(auth_session, SEGMENTID, OTHERACCOUNTID)
-                openTaxLots, closedTaxLots = fetcher.fetchTaxLotsCSVs()
-                #save openTaxLots to CSV
-                if openTaxLots is not None:
-                    try:
-                        GenerateCSV_instance = GenerateCSV(openTaxLots)
-                        if CREATE_CSV_FILES:
-                            GenerateCSV_instance.save_to_csv("open_tax_lots.csv")
-                        else:
-                            logger.info("Skipping CSV generation for open tax lots as per configuration.")
-                    except Exception:
-                        logger.exception("Error saving open tax lots CSV.")
-                #save closedTaxLots to CSV
-                if closedTaxLots is not None:
-                    try:
-                        GenerateCSV_instance = GenerateCSV(closedTaxLots)
-                        if CREATE_CSV_FILES:
-                            GenerateCSV_instance.save_to_csv("closed_tax_lots.csv")
-                        else:
-                            logger.info("Skipping CSV generation for closed tax lots as per configuration.")
-                    except Exception:
-                        logger.exception("Error saving closed tax lots CSV.")
-                #fetch holdings
-                holdings = fetcher.fetchHoldingsCSV()
-                #save holdings to CSV
-                if holdings is not None:
-                    try:
-                        GenerateCSV_instance = GenerateCSV(holdings)
-                        if CREATE_CSV_FILES:
-                            GenerateCSV_instance.save_to_csv("holdings.csv")
-                        else:
-                            logger.info("Skipping CSV generation for holdings as per configuration.")
-                    except Exception:
-                        logger.exception("Error saving holdings CSV.")
-                return creds
+                fetcher = FetchCSV(auth_session, SEGMENTID, ACCOUNT_IDS)
+                max_workers = FETCH_MAX_WORKERS if CONCURRENT_FETCH else 1
+                sync_closed = include_tax_lots and INCREMENTAL_CLOSED_LOTS
+                fetch_closed = include_tax_lots and not INCREMENTAL_CLOSED_LOTS
+                if MULTI_ACCOUNT and STREAM_OUTPUTS:
+                    # every account streams to its own folder and to the consolidated
+                    # output, which is only replaced when every account completed
+                    names = {"holdings": "holdings"}
+                    if include_tax_lots:
+                        names["open"] = "open_tax_lots"
+                    if fetch_closed:
+                        names["closed"] = "closed_tax_lots"
+                    shared = {key: SharedSink(create_sink(STREAM_SINK, name), len(set(ACCOUNT_IDS))) for key, name in names.items()}
+                    sinks_by_account = {}
+                    for account_id in ACCOUNT_IDS:
+                        directory = os.path.join(CSV_DIR, account_dir(account_id))
+                        sinks_by_account[account_id] = {
+                            key: AccountSink(create_sink(STREAM_SINK, name, directory), shared[key], account_id)
+                            for key, name in names.items()
+                        }
+                    if sync_closed:
+                        sync_closed_tax_lots(fetcher, ACCOUNT_IDS)
+                    results = fetcher.streamAccountsToSinks(
+                        sinks_by_account, max_workers=max_workers, publish_partial=PUBLISH_PARTIAL_DATA
+                    )
+                    for account_id, account_results in results.items():
+                        for name, success in account_results.items():
+                            if not success:
+                                logger.error("Streaming export for %s of account %s did not complete.", name, account_id)
+                    # streamed data is only on disk
+                    return creds, {}
+                if MULTI_ACCOUNT:
+                    # every account is fetched over the one authenticated session
+                    results = fetcher.fetchAccounts(
+                        max_workers=max_workers, fetch_closed=fetch_closed, fetch_open=include_tax_lots
+                    )
+                    newClosedTaxLots = sync_closed_tax_lots(fetcher, ACCOUNT_IDS) if sync_closed else None
+                    skip = {"closed tax lots"} if not fetch_closed else set()
+                    if not include_tax_lots:
+                        skip.add("open tax lots")
+                    frames = save_account_datasets(fetcher, results, skip=skip)
+                    frames["new closed"] = newClosedTaxLots
+                    return creds, {key: df for key, df in frames.items() if df is not None}
+                if STREAM_OUTPUTS:
+                    # pages are written to the sinks as they arrive, nothing is kept in memory
+                    sinks = {"holdings": create_sink(STREAM_SINK, "holdings")}
+                    if include_tax_lots:
+                        sinks["open"] = create_sink(STREAM_SINK, "open_tax_lots")
+                    if fetch_closed:
+                        sinks["closed"] = create_sink(STREAM_SINK, "closed_tax_lots")
+                    if sync_closed:
+                        sync_closed_tax_lots(fetcher)
+                    results = fetcher.streamToSinks(
+                        sinks,
+                        max_workers=max_workers,
+                        publish_partial=PUBLISH_PARTIAL_DATA,
+                    )
+                    for name, success in results.items():
+                        if not success:
+                            logger.error("Streaming export for %s did not complete.", name)
+                    return creds, {}
+                if CONCURRENT_FETCH:
+                    openTaxLots, closedTaxLots, holdings = fetcher.fetchAllConcurrently(
+                        max_workers=FETCH_MAX_WORKERS, fetch_closed=fetch_closed, fetch_open=include_tax_lots
+                    )
+                elif not include_tax_lots:
+                    openTaxLots, closedTaxLots = None, None
+                    holdings = fetcher.fetchHoldingsCSV()
+                elif INCREMENTAL_CLOSED_LOTS:
+                    openTaxLots, closedTaxLots = fetcher._fetch_lot_type("OPEN"), None
+                    holdings = fetcher.fetchHoldingsCSV()
+                else:
+                    openTaxLots, closedTaxLots = fetcher.fetchTaxLotsCSVs()
+                    holdings = fetcher.fetchHoldingsCSV()
+                # written to closed_tax_lots.csv by the sync itself
+                newClosedTaxLots = sync_closed_tax_lots(fetcher) if sync_closed else None
+                openTaxLots = drop_partial(fetcher, "open tax lots", openTaxLots)
+                closedTaxLots = drop_partial(fetcher, "closed tax lots", closedTaxLots)
+                holdings = drop_partial(fetcher, "holdings", holdings)
+                #save openTaxLots, closedTaxLots and holdings to CSV
+                save_dataset(openTaxLots, "open_tax_lots", "open tax lots")
+                save_dataset(closedTaxLots, "closed_tax_lots", "closed tax lots")
+                save_dataset(holdings, "holdings", "holdings")
+                # handed to spreadsheetManager so it does not read the CSVs back
+                frames = {"open": openTaxLots, "closed": closedTaxLots, "holdings": holdings, "new closed": newClosedTaxLots}
+                return creds, {key: df for key, df in frames.items() if df is not None}
             except Exception:
                 logger.exception("Error during data fetching.")
-                return None
+                return None, {}
         else:
             logger.error("Authentication failed.")
-            return None
+            return None, {}
     except Exception:
         logger.exception("Unexpected error in fetchM1Data.")
-        return None
-        
+        return None, {}
+    finally:
+        if owns_client:
+            lens_client.close()
+
+def create_sheet_manager():
+    return spreadsheetManager(spreadsheetName=SPREADSHEET_NAME,
+                              credentialsPath = CREDENTIALS_PATH,
+                              CSVFolderPath="CSV",
+                              createNewSpreadSheet=CREATE_NEW_SPREADSHEET,
+                              generateTaxLotsSheets=GENERATE_TAX_LOTS_SHEETS,
+                              snapshotPath=SHEET_SNAPSHOT_FILE if DELTA_SHEET_UPDATES else None,
+                              metadataCachePath=SECURITY_METADATA_FILE if CACHE_SECURITY_METADATA else None,
+                              spreadsheetID=SPREADSHEET_ID or None)
+
+def remember_spreadsheet_id(sheet_manager):
+    """
+    Persists the resolved spreadsheet ID so later runs open it directly
+    instead of searching Drive by name
+    """
+    global SPREADSHEET_ID
+    if sheet_manager.SpreadSheetID and sheet_manager.SpreadSheetID != SPREADSHEET_ID:
+        SPREADSHEET_ID = sheet_manager.SpreadSheetID
+        update_state_file(STATE_FILE, {"SPREADSHEET_ID": SPREADSHEET_ID})
+
+def record_database(frames):
+    """
+    Stores this run's data in the local database when USE_DATABASE is on:
+    holdings are upserted into the assets table and appended to the time
+    series, and fetched tax lots are loaded into the tax lot tables
+    """
+    if not frames:
+        logger.info("No in-memory data to store in the database this run.")
+        return
+    account_id = ACCOUNT_IDS[0] if ACCOUNT_IDS else ""
+    try:
+        # imported here so runs without the database never load SQLAlchemy
+        from database.database_setup import Asset
+        from database.holding_snapshots import insert_holding_snapshots
+        from database.tax_lots import load_tax_lots
+
+        Asset.init_db()
+        holdings = frames.get("holdings")
+        if holdings is not None and not holdings.empty:
+            Asset.upsert_assets(holdings)
+            insert_holding_snapshots(holdings, account_id=account_id)
+        if "open" in frames:
+            # the open frame covers every account, so accounts without lots are purged too
+            load_tax_lots(frames["open"], "OPEN", account_id=account_id, account_ids=ACCOUNT_IDS or None)
+        for key in ("closed", "new closed"):
+            if key in frames:
+                load_tax_lots(frames[key], "CLOSED", account_id=account_id)
+    except Exception:
+        logger.exception("Error storing data in the database.")
+
+def run_daemon():
+    """
+    Keeps the process alive and runs the fetch and publish pipeline on a
+    schedule: holdings every DAEMON_INTERVAL_MINUTES (during market hours when
+    DAEMON_MARKET_HOURS_ONLY is set) and tax lots once a day at
+    DAEMON_TAX_LOTS_TIME (US Eastern). The M1 client, its tokens and the
+    gspread client stay warm between cycles, and cycles never overlap.
+    """
+    # imported here so one-shot runs do not pay for it
+    from scheduler.scheduler import Scheduler, Job
+
+    lens_client = create_lens_client()
+    auth = create_authenticator(lens_client)
+    sheet_manager = None
+
+    def cycle(include_tax_lots):
+        nonlocal sheet_manager
+        creds, frames = fetchM1Data(lens_client, auth, include_tax_lots=include_tax_lots)
+        if USE_DATABASE and frames:
+            record_database(frames)
+        if creds and ENABLE_GOOGLE_SHEETS_INTEGRATION:
+            try:
+                if sheet_manager is None:
+                    sheet_manager = create_sheet_manager()
+                sheet_manager.run(include_tax_lots=include_tax_lots, frames=frames)
+                remember_spreadsheet_id(sheet_manager)
+            except Exception:
+                logger.exception("Error in spreadsheet management.")
+
+    scheduler = Scheduler([
+        Job("holdings cycle", lambda: cycle(False),
+            interval_minutes=DAEMON_INTERVAL_MINUTES, market_hours_only=DAEMON_MARKET_HOURS_ONLY),
+        Job("tax lots cycle", lambda: cycle(True), daily_at=DAEMON_TAX_LOTS_TIME),
+    ], run_immediately=False)
+    scheduler.install_signal_handlers()
+    try:
+        # one full cycle on start so every output exists before the schedule takes over
+        cycle(True)
+        scheduler.run_forever()
+    finally:
+        lens_client.close()
+
+
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fetch M1 Finance data and publish it to CSV and Google Sheets.")
+    parser.add_argument("--daemon", action="store_true", help="keep running and fetch on the configured schedule")
+    args = parser.parse_args()
     logger.info("Application started.")
+    if args.daemon:
+        logger.info("Running in daemon mode.")
+        run_daemon()
+        raise SystemExit(0)
     try:
-        creds = fetchM1Data()
-        #check and initialize database coming soon
-        # if USE_DATABASE:
-        #     Asset.init_db()
-        #     #insert assets from generated CSVs into database
-        #     Asset.insert_asset()
+        creds, frames = fetchM1Data()
+        if USE_DATABASE and frames:
+            record_database(frames)
         if creds and ENABLE_GOOGLE_SHEETS_INTEGRATION:
             logger.info("Starting spreadsheet management.")
             try:
-                sheet_manager = spreadsheetManager(spreadsheetName=SPREADSHEET_NAME,
-                                                   credentialsPath = CREDENTIALS_PATH, 
-                                                   CSVFolderPath="CSV", 
-                                                   createNewSpreadSheet=CREATE_NEW_SPREADSHEET, 
-                                                   generateTaxLotsSheets=GENERATE_TAX_LOTS_SHEETS)
-                sheet_manager.run()
+                sheet_manager = create_sheet_manager()
+                sheet_manager.run(frames=frames)
+                remember_spreadsheet_id(sheet_manager)
             except Exception:
                 logger.exception("Error in spreadsheet management.")
     except Exception:
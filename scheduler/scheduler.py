@@ -0,0 +1,152 @@
+"""
+In-process scheduler for the long-running daemon mode.
+
+Jobs run one at a time on the calling thread, so a cycle can never overlap
+with the previous one. When a job runs longer than its interval the missed
+runs are skipped instead of queued, and the next run is planned from the
+moment the job finished.
+"""
+
+import signal
+import logging
+import threading
+from datetime import datetime, time, timedelta
+from zoneinfo import ZoneInfo
+
+logger = logging.getLogger(__name__)
+
+MARKET_TIMEZONE = ZoneInfo("America/New_York")
+MARKET_OPEN = time(9, 30)
+MARKET_CLOSE = time(16, 0)
+
+
+def parse_time_of_day(value: str):
+    """
+    :param value: time of day as "HH:MM"
+    :return: datetime.time
+    """
+    hours, minutes = value.strip().split(":")
+    return time(int(hours), int(minutes))
+
+
+def is_market_open(now: datetime):
+    """
+    :param now: timezone-aware datetime
+    :return: True during regular US market hours (holidays are not accounted for)
+    """
+    local = now.astimezone(MARKET_TIMEZONE)
+    return local.weekday() < 5 and MARKET_OPEN <= local.time() < MARKET_CLOSE
+
+
+def next_market_open(now: datetime):
+    """
+    :param now: timezone-aware datetime
+    :return: start of the next regular market session after now
+    """
+    local = now.astimezone(MARKET_TIMEZONE)
+    candidate = local.replace(hour=MARKET_OPEN.hour, minute=MARKET_OPEN.minute, second=0, microsecond=0)
+    if candidate <= local:
+        candidate += timedelta(days=1)
+    while candidate.weekday() >= 5:
+        candidate += timedelta(days=1)
+    return candidate
+
+
+class Job:
+    def __init__(self, name: str, func, interval_minutes: float = None, daily_at: str = None,
+                 market_hours_only: bool = False, timezone=MARKET_TIMEZONE):
+        """
+        :param name: name used in log messages
+        :param func: callable run without arguments
+        :param interval_minutes: run every N minutes
+        :param daily_at: run once a day at "HH:MM" in the given timezone, used when no interval is set
+        :param market_hours_only: only run interval jobs during regular market hours
+        :param timezone: timezone of daily_at
+        """
+        if interval_minutes is None and daily_at is None:
+            raise ValueError(f"Job {name} needs an interval or a daily time.")
+        self.name = name
+        self.func = func
+        self.interval = timedelta(minutes=interval_minutes) if interval_minutes is not None else None
+        self.daily_at = parse_time_of_day(daily_at) if daily_at is not None else None
+        self.market_hours_only = market_hours_only
+        self.timezone = timezone
+        self.next_run = None
+
+    def schedule_after(self, now: datetime):
+        """
+        Plans the next run after now
+
+        :param now: timezone-aware datetime
+        :return: planned run time
+        """
+        if self.interval is not None:
+            next_run = now + self.interval
+            if self.market_hours_only and not is_market_open(next_run):
+                next_run = next_market_open(next_run)
+        else:
+            local = now.astimezone(self.timezone)
+            next_run = local.replace(hour=self.daily_at.hour, minute=self.daily_at.minute, second=0, microsecond=0)
+            if next_run <= local:
+                next_run += timedelta(days=1)
+        self.next_run = next_run
+        return next_run
+
+    def schedule_first(self, now: datetime, run_immediately: bool = True):
+        if run_immediately and (not self.market_hours_only or is_market_open(now)):
+            self.next_run = now
+        elif self.market_hours_only and not is_market_open(now):
+            self.next_run = next_market_open(now)
+        else:
+            self.schedule_after(now)
+        return self.next_run
+
+
+class Scheduler:
+    def __init__(self, jobs, run_immediately: bool = True):
+        """
+        :param jobs: list of Job
+        :param run_immediately: run interval jobs right away instead of after one interval
+        """
+        self.jobs = list(jobs)
+        self.run_immediately = run_immediately
+        self._stop = threading.Event()
+
+    @staticmethod
+    def now():
+        return datetime.now(MARKET_TIMEZONE)
+
+    def stop(self, *_):
+        logger.info("Scheduler stop requested. Finishing the current cycle.")
+        self._stop.set()
+
+    def install_signal_handlers(self):
+        # docker stop sends SIGTERM, let the running cycle finish before exiting
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+    def run_forever(self):
+        now = self.now()
+        for job in self.jobs:
+            job.schedule_first(now, self.run_immediately and job.interval is not None)
+            logger.info("Scheduled %s for %s.", job.name, job.next_run.isoformat(timespec="minutes"))
+
+        while not self._stop.is_set():
+            job = min(self.jobs, key=lambda j: j.next_run)
+            wait = (job.next_run - self.now()).total_seconds()
+            if wait > 0 and self._stop.wait(wait):
+                break
+
+            logger.info("Starting %s.", job.name)
+            started = self.now()
+            try:
+                job.func()
+            except Exception:
+                logger.exception("%s failed.", job.name)
+            finished = self.now()
+            next_run = job.schedule_after(finished)
+            logger.info(
+                "Finished %s in %.1fs. Next run at %s.",
+                job.name, (finished - started).total_seconds(), next_run.isoformat(timespec="minutes"),
+            )
+        logger.info("Scheduler stopped.")
@@ -0,0 +1,122 @@
+"""
+On-disk cache of security profile data looked up on Yahoo Finance.
+
+yfinance's Ticker.info is slow and the fields we read from it (quoteType,
+names, exchange) practically never change, so each field is kept in a small
+SQLite file with its own time to live. Symbols Yahoo cannot resolve are
+remembered for a while as well, so a delisted or mistyped ticker is not
+looked up again on every run.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import logging
+
+logger = logging.getLogger(__name__)
+
+DAY_SECONDS = 24 * 60 * 60
+# fields stored from every successful lookup, with how long each stays valid
+FIELD_TTL_SECONDS = {
+    "quoteType": 90 * DAY_SECONDS,
+    "shortName": 30 * DAY_SECONDS,
+    "longName": 30 * DAY_SECONDS,
+    "exchange": 30 * DAY_SECONDS,
+    "currency": 90 * DAY_SECONDS,
+    "sector": 30 * DAY_SECONDS,
+    "industry": 30 * DAY_SECONDS,
+}
+# how long a symbol that failed to resolve is not looked up again
+NEGATIVE_TTL_SECONDS = DAY_SECONDS
+
+
+class SecurityMetadataCache:
+    def __init__(self, db_path: str, field_ttls: dict = None, negative_ttl: float = NEGATIVE_TTL_SECONDS):
+        self.db_path = db_path
+        self.field_ttls = dict(FIELD_TTL_SECONDS if field_ttls is None else field_ttls)
+        self.negative_ttl = negative_ttl
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self.conn = sqlite3.connect(db_path)
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS security_fields ("
+                "symbol TEXT, field TEXT, value TEXT, fetched_at REAL, PRIMARY KEY (symbol, field))"
+            )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS security_failures (symbol TEXT PRIMARY KEY, failed_at REAL, reason TEXT)"
+            )
+
+    def get(self, symbol: str, field: str):
+        """
+        :return: cached value of the field, or None when it is missing or expired
+        """
+        row = self.conn.execute(
+            "SELECT value, fetched_at FROM security_fields WHERE symbol = ? AND field = ?", (symbol, field)
+        ).fetchone()
+        if row is None or row[1] + self.field_ttls.get(field, DAY_SECONDS) <= time.time():
+            return None
+        return json.loads(row[0])
+
+    def recently_failed(self, symbol: str):
+        row = self.conn.execute("SELECT failed_at FROM security_failures WHERE symbol = ?", (symbol,)).fetchone()
+        return row is not None and row[0] + self.negative_ttl > time.time()
+
+    def store(self, symbol: str, info: dict):
+        """
+        Stores every known profile field present in a Ticker.info dict
+        """
+        now = time.time()
+        rows = [
+            (symbol, field, json.dumps(info[field]), now)
+            for field in self.field_ttls
+            if info.get(field) is not None
+        ]
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO security_fields (symbol, field, value, fetched_at) VALUES (?, ?, ?, ?)", rows
+            )
+            self.conn.execute("DELETE FROM security_failures WHERE symbol = ?", (symbol,))
+
+    def store_failure(self, symbol: str, reason: str):
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO security_failures (symbol, failed_at, reason) VALUES (?, ?, ?)",
+                (symbol, time.time(), reason),
+            )
+
+    def lookup(self, symbols, field: str, fetch_info, default=None):
+        """
+        Returns one field for many symbols, only calling fetch_info for cache misses
+
+        :param symbols: symbols to resolve
+        :param field: profile field to return, e.g. "quoteType"
+        :param fetch_info: callable taking a symbol and returning its info dict
+        :param default: value returned for symbols that could not be resolved
+        :return: dict of symbol mapped to the field value
+        """
+        values = {}
+        misses = 0
+        for symbol in dict.fromkeys(symbols):
+            value = self.get(symbol, field)
+            if value is None and not self.recently_failed(symbol):
+                misses += 1
+                try:
+                    info = fetch_info(symbol) or {}
+                except Exception as e:
+                    logger.exception("Error fetching data for symbol %s.", symbol)
+                    self.store_failure(symbol, type(e).__name__)
+                    info = {}
+                else:
+                    if info.get(field) is None:
+                        logger.warning("No %s found for symbol %s.", field, symbol)
+                        self.store_failure(symbol, f"missing {field}")
+                    else:
+                        self.store(symbol, info)
+                value = info.get(field)
+            values[symbol] = default if value is None else value
+        logger.info("Resolved %s for %s symbols, %s looked up on Yahoo Finance.", field, len(values), misses)
+        return values
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,124 @@
+"""
+Local snapshot of what was last written to each worksheet.
+
+For every worksheet the store keeps the header and, per data row in sheet
+order, the row key (lot id or symbol) and a hash of the row's values. The
+next publish compares the new rows against it and only sends the rows that
+changed, were added or disappeared, instead of clearing and rewriting the
+whole sheet.
+"""
+
+import os
+import json
+import sqlite3
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+# above this share of touched rows a full rewrite is cheaper than a delta
+MAX_DELTA_FRACTION = 0.5
+
+
+def row_hash(row):
+    """
+    :param row: list of cell values as sent to the Sheets API
+    :return: short hex digest of the values
+    """
+    encoded = json.dumps(row, default=str, separators=(",", ":")).encode("utf-8")
+    return hashlib.blake2b(encoded, digest_size=16).hexdigest()
+
+
+def plan_delta(old_keys, old_hashes, new_keys, new_hashes):
+    """
+    Works out how to turn the previously written rows into the new ones while
+    leaving unchanged rows where they are. Rows that are still present keep
+    their position, rows that disappeared are deleted and new rows are
+    appended at the bottom.
+
+    :return: tuple of (sheet positions to delete, final key order, positions
+        in the final order whose values have to be written), or None when a
+        full rewrite is the better option
+    """
+    new_index = {key: position for position, key in enumerate(new_keys)}
+    deleted = [position for position, key in enumerate(old_keys) if key not in new_index]
+    old_hash_by_key = dict(zip(old_keys, old_hashes))
+    kept = [key for key in old_keys if key in new_index]
+    kept_set = set(kept)
+    final_keys = kept + [key for key in new_keys if key not in kept_set]
+    changed = [
+        position for position, key in enumerate(final_keys)
+        if old_hash_by_key.get(key) != new_hashes[new_index[key]]
+    ]
+    if len(deleted) + len(changed) > MAX_DELTA_FRACTION * max(len(final_keys), 1):
+        return None
+    return deleted, final_keys, changed
+
+
+def contiguous_runs(positions):
+    """
+    :param positions: sorted positions
+    :return: list of (start, end) pairs with end exclusive
+    """
+    runs = []
+    for position in positions:
+        if runs and runs[-1][1] == position:
+            runs[-1][1] = position + 1
+        else:
+            runs.append([position, position + 1])
+    return [tuple(run) for run in runs]
+
+
+class SheetSnapshotStore:
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self.conn = sqlite3.connect(db_path)
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS sheets ("
+                "spreadsheet_id TEXT, title TEXT, header TEXT, PRIMARY KEY (spreadsheet_id, title))"
+            )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS sheet_rows ("
+                "spreadsheet_id TEXT, title TEXT, position INTEGER, row_key TEXT, row_hash TEXT, "
+                "PRIMARY KEY (spreadsheet_id, title, position))"
+            )
+
+    def load(self, spreadsheet_id: str, title: str):
+        """
+        :return: tuple of (header, row keys, row hashes) in sheet order, or None
+        """
+        row = self.conn.execute(
+            "SELECT header FROM sheets WHERE spreadsheet_id = ? AND title = ?", (spreadsheet_id, title)
+        ).fetchone()
+        if row is None:
+            return None
+        rows = self.conn.execute(
+            "SELECT row_key, row_hash FROM sheet_rows WHERE spreadsheet_id = ? AND title = ? ORDER BY position",
+            (spreadsheet_id, title),
+        ).fetchall()
+        return json.loads(row[0]), [r[0] for r in rows], [r[1] for r in rows]
+
+    def save(self, spreadsheet_id: str, title: str, header, keys, hashes):
+        with self.conn:
+            self._delete(spreadsheet_id, title)
+            self.conn.execute(
+                "INSERT INTO sheets (spreadsheet_id, title, header) VALUES (?, ?, ?)",
+                (spreadsheet_id, title, json.dumps(header, default=str)),
+            )
+            self.conn.executemany(
+                "INSERT INTO sheet_rows (spreadsheet_id, title, position, row_key, row_hash) VALUES (?, ?, ?, ?, ?)",
+                ((spreadsheet_id, title, position, key, digest) for position, (key, digest) in enumerate(zip(keys, hashes))),
+            )
+
+    def clear(self, spreadsheet_id: str, title: str):
+        with self.conn:
+            self._delete(spreadsheet_id, title)
+
+    def _delete(self, spreadsheet_id: str, title: str):
+        self.conn.execute("DELETE FROM sheets WHERE spreadsheet_id = ? AND title = ?", (spreadsheet_id, title))
+        self.conn.execute("DELETE FROM sheet_rows WHERE spreadsheet_id = ? AND title = ?", (spreadsheet_id, title))
+
+    def close(self):
+        self.conn.close()
@@ -8,13 +8,103 @@ import logging
 import gspread
 import json
 import pandas as pd
-import numpy as np
 import requests
 import yfinance as yf
 from gspread.exceptions import SpreadsheetNotFound, WorksheetNotFound, APIError
+from gspread.utils import rowcol_to_a1
+from gspread.spreadsheet import Spreadsheet
+from gspread.worksheet import Worksheet
+from spreadsheets.sheet_snapshot import SheetSnapshotStore, row_hash, plan_delta, contiguous_runs
+from spreadsheets.security_metadata import SecurityMetadataCache
+from generateCSV.generateCSV import find_output, read_output
+from fetch_csv.fetch_csv import DATASET_COLUMNS
+from fetch_csv.query_builder import apply_dtypes, format_dates
 
 logger = logging.getLogger(__name__)
 
+CURRENCY_FORMAT = {"type": "CURRENCY", "pattern": "$#,##0.00"}
+PERCENT_FORMAT = {"type": "PERCENT", "pattern": "0.00%"}
+
+# number format of each formatted column, per worksheet
+HOLDINGS_COLUMN_FORMATS = {
+    "average_share_price": CURRENCY_FORMAT,
+    "total_cost": CURRENCY_FORMAT,
+    "current_value": CURRENCY_FORMAT,
+    "unrealized_gain": CURRENCY_FORMAT,
+    "unrealized_gain_percent": PERCENT_FORMAT,
+    "maintenance_margin_percent": PERCENT_FORMAT,
+}
+TAX_LOTS_COLUMN_FORMATS = {
+    "costBasis": CURRENCY_FORMAT,
+    "unrealizedGainLoss": CURRENCY_FORMAT,
+    "shortTermRealizedGainLoss": CURRENCY_FORMAT,
+    "longTermRealizedGainLoss": CURRENCY_FORMAT,
+}
+
+
+def number_format_requests(sheet_id, columns, row_count, column_formats):
+    """
+    Builds repeatCell requests applying number formats to whole data columns.
+    Ranges are GridRanges (0-based column indexes), so any column count works,
+    and adjacent columns sharing a format are merged into one range.
+
+    :param sheet_id: worksheet id
+    :param columns: column names in sheet order
+    :param row_count: number of data rows below the header
+    :param column_formats: dict of column name mapped to a numberFormat
+    :return: list of batchUpdate requests
+    """
+    requests = []
+    if row_count <= 0:
+        return requests
+    for index, column in enumerate(columns):
+        number_format = column_formats.get(column)
+        if number_format is None:
+            continue
+        if requests and requests[-1]["repeatCell"]["range"]["endColumnIndex"] == index \
+                and requests[-1]["repeatCell"]["cell"]["userEnteredFormat"]["numberFormat"] == number_format:
+            requests[-1]["repeatCell"]["range"]["endColumnIndex"] = index + 1
+            continue
+        requests.append({
+            "repeatCell": {
+                "range": {
+                    "sheetId": sheet_id,
+                    "startRowIndex": 1,  # below the header
+                    "endRowIndex": row_count + 1,
+                    "startColumnIndex": index,
+                    "endColumnIndex": index + 1,
+                },
+                "cell": {"userEnteredFormat": {"numberFormat": number_format}},
+                "fields": "userEnteredFormat.numberFormat",
+            }
+        })
+    return requests
+
+
+def sheet_values(df, missing=None):
+    """
+    Turns a typed frame into values the Sheets API accepts: dates become ISO
+    strings, numpy scalars become Python ones and NaN, NaT and <NA> become `missing`
+
+    :param df: DataFrame with the dataset's dtypes
+    :param missing: value written for missing cells
+    :return: object DataFrame
+    """
+    df = format_dates(df).astype(object)
+    return df.where(df.notna(), missing)
+
+
+def row_keys(df, key_columns):
+    """
+    :param df: DataFrame about to be written
+    :param key_columns: columns identifying a row, the ones missing from df are ignored
+    :return: list of string keys, or None when df has none of the key columns
+    """
+    key_columns = [column for column in key_columns if column in df.columns]
+    if not key_columns:
+        return None
+    return ["|".join(str(value) for value in values) for values in df[key_columns].itertuples(index=False, name=None)]
+
 
 class spreadsheetManager:
     def __init__(
@@ -24,6 +114,9 @@ class spreadsheetManager:
         CSVFolderPath="CSV",
         createNewSpreadSheet=False,
         generateTaxLotsSheets=False,
+        snapshotPath=None,
+        metadataCachePath=None,
+        spreadsheetID=None,
     ):
         try:
             self.spreadsheetName = spreadsheetName
@@ -31,8 +124,20 @@ class spreadsheetManager:
             self.CSVFolderPath = CSVFolderPath
             self.createNewSpreadSheet = createNewSpreadSheet
             self.generateTaxLotsSheets = generateTaxLotsSheets
-            self.SpreadSheetID = None
+            # a known ID (persisted from an earlier run) skips the Drive search by name
+            self.SpreadSheetID = spreadsheetID
             self.gc = None
+            # spreadsheet handle and worksheets by title, resolved once and reused
+            self.spreadsheet = None
+            self.worksheets = {}
+            # number format requests of every worksheet, sent in one batchUpdate by apply_formats
+            self.pending_format_requests = []
+            # snapshot of the last written rows, enables delta updates when set
+            self.snapshots = SheetSnapshotStore(snapshotPath) if snapshotPath else None
+            # Yahoo Finance profile data kept between runs, looked up on every run when not set
+            self.metadata_cache = SecurityMetadataCache(metadataCachePath) if metadataCachePath else None
+            # typed holdings of the current run, Securities Info is derived from them
+            self.holdings_data = None
 
             # Validate credentials file exists
             if not os.path.exists(self.credentialsPath):
@@ -67,15 +172,62 @@ class spreadsheetManager:
             logger.exception("Google Sheets authentication error.")
             return None
 
+    def open_spreadsheet(self, key):
+        """
+        Opens a spreadsheet and maps its worksheets with one metadata request.
+        gspread's Spreadsheet constructor fetches the same metadata but only
+        keeps the spreadsheet properties, so listing the worksheets afterwards
+        would request it a second time.
+
+        :param key: spreadsheet ID
+        :return: tuple of (gspread Spreadsheet, dict of title mapped to Worksheet)
+        """
+        try:
+            metadata = self.gc.http_client.fetch_sheet_metadata(key)
+        except APIError as e:
+            if e.response.status_code == 404:
+                raise SpreadsheetNotFound(e.response) from e
+            raise
+        # same state Spreadsheet.__init__ sets up after its own metadata request
+        sh = Spreadsheet.__new__(Spreadsheet)
+        sh.client = self.gc.http_client
+        sh._properties = {"id": key, **metadata["properties"]}
+        worksheets = {
+            sheet["properties"]["title"]: Worksheet(sh, sheet["properties"], sh.id, sh.client)
+            for sheet in metadata.get("sheets", [])
+        }
+        return sh, worksheets
+
     def fetch_spreadsheet(self):
         """
         Docstring for fetch_spreadsheet
+        opens the spreadsheet once and keeps the handle along with its
+        worksheets. A known spreadsheet ID is opened directly, the Drive search
+        by name only runs when there is no ID or it points to a spreadsheet
+        with another name.
 
-        :param self: Description
+        :return: gspread Spreadsheet or None if failed
         """
+        if self.spreadsheet is not None:
+            return self.spreadsheet
         try:
-            sh = self.gc.open(self.spreadsheetName)
+            sh = None
+            if self.SpreadSheetID:
+                try:
+                    sh, worksheets = self.open_spreadsheet(self.SpreadSheetID)
+                    if self.spreadsheetName and sh.title != self.spreadsheetName:
+                        logger.info("Spreadsheet %s is not named '%s'. Searching by name.", self.SpreadSheetID, self.spreadsheetName)
+                        sh = None
+                except SpreadsheetNotFound:
+                    logger.warning("Spreadsheet with ID %s not found. Searching by name.", self.SpreadSheetID)
+            if sh is None:
+                files = [f for f in self.gc.list_spreadsheet_files(self.spreadsheetName) if f["name"] == self.spreadsheetName]
+                if not files:
+                    raise SpreadsheetNotFound(self.spreadsheetName)
+                sh, worksheets = self.open_spreadsheet(files[0]["id"])
             self.SpreadSheetID = sh.id
+            self.spreadsheet = sh
+            self.worksheets = worksheets
             return sh
         except SpreadsheetNotFound:
             logger.warning("Spreadsheet named '%s' not found.", self.spreadsheetName)
@@ -84,6 +236,42 @@ class spreadsheetManager:
             logger.exception("Error fetching spreadsheet.")
             return None
 
+    def resolve_worksheets(self, titles):
+        """
+        Looks up the worksheets read along with the spreadsheet metadata and
+        creates the missing ones in one batchUpdate
+
+        :param titles: worksheet titles needed by this run
+        :return: dict of title mapped to gspread Worksheet
+        """
+        sh = self.fetch_spreadsheet()
+        if sh is None:
+            raise SpreadsheetNotFound(self.spreadsheetName)
+        missing = [title for title in dict.fromkeys(titles) if title not in self.worksheets]
+        if missing:
+            response = sh.batch_update({"requests": [
+                {"addSheet": {"properties": {"title": title, "gridProperties": {"rowCount": 100, "columnCount": 20}}}}
+                for title in missing
+            ]})
+            for reply in response["replies"]:
+                properties = reply["addSheet"]["properties"]
+                self.worksheets[properties["title"]] = Worksheet(sh, properties, sh.id, sh.client)
+            logger.info("Created new worksheets: %s.", ", ".join(missing))
+        return self.worksheets
+
+    def get_worksheet(self, title):
+        """
+        :return: cached gspread Worksheet, created when it does not exist yet
+        """
+        if title not in self.worksheets:
+            self.resolve_worksheets([title])
+        return self.worksheets[title]
+
+    def reset_spreadsheet_cache(self):
+        # resolved again on the next run, e.g. after a tab was deleted by hand
+        self.spreadsheet = None
+        self.worksheets = {}
+
     # def create_spreadsheet(self, title="M1 Finance Data"):
     #     '''
     #     Creates a new Google Spreadsheet or returns existing spreadsheet ID
@@ -127,10 +315,96 @@ class spreadsheetManager:
     #     except Exception as e:
     #         print(f"Unexpected error creating spreadsheet: {e}")
     #         return None
-    def create_holdings_sheet(self):
+    def read_local_dataset(self, name):
         """
-        Creates a holdings worksheet and uploads holdings data from CSV
+        Reads a dataset exported by an earlier step from the CSV folder, in
+        whichever output format (CSV, Parquet or Feather) was written last
 
+        :param name: file name inside the CSV folder without extension
+        :return: DataFrame or None if the file is missing
+        """
+        if not os.path.exists(self.CSVFolderPath):
+            logger.error("CSV folder not found at %s", self.CSVFolderPath)
+            return None
+        path = find_output(name, self.CSVFolderPath)
+        if path is None:
+            logger.error("No %s output found in %s", name, self.CSVFolderPath)
+            return None
+        # exports read back as strings, or dates as objects, get the fetch dtypes again
+        return apply_dtypes(read_output(path), DATASET_COLUMNS.get(name, []))
+
+    def write_worksheet(self, worksheet, df, keys=None):
+        """
+        Writes a DataFrame to a worksheet. With a snapshot store and row keys
+        only the rows that changed since the last write are sent: changed rows
+        are updated in place, new rows are appended and rows that disappeared
+        are deleted. Otherwise, or when most rows changed, the sheet is cleared
+        and rewritten.
+
+        :param worksheet: gspread Worksheet
+        :param df: DataFrame with JSON compatible values
+        :param keys: one unique key per row (lot id or symbol)
+        """
+        header = df.columns.values.tolist()
+        rows = df.values.tolist()
+        if self.snapshots is None or keys is None or len(set(keys)) != len(keys):
+            worksheet.clear()  # Clear existing data
+            worksheet.update([header] + rows)
+            if self.snapshots is not None:
+                self.snapshots.clear(self.SpreadSheetID, worksheet.title)
+            return
+
+        hashes = [row_hash(row) for row in rows]
+        previous = self.snapshots.load(self.SpreadSheetID, worksheet.title)
+        plan = None
+        if previous is not None and previous[0] == header:
+            plan = plan_delta(previous[1], previous[2], keys, hashes)
+        if plan is None:
+            worksheet.clear()  # Clear existing data
+            worksheet.update([header] + rows)
+            self.snapshots.save(self.SpreadSheetID, worksheet.title, header, keys, hashes)
+            return
+
+        deleted, final_keys, changed = plan
+        row_by_key = dict(zip(keys, rows))
+        hash_by_key = dict(zip(keys, hashes))
+        try:
+            if deleted:
+                # bottom up so earlier deletions do not shift the later ones, row 0 is the header
+                requests = [
+                    {"deleteDimension": {"range": {
+                        "sheetId": worksheet.id, "dimension": "ROWS", "startIndex": start + 1, "endIndex": end + 1,
+                    }}}
+                    for start, end in reversed(contiguous_runs(deleted))
+                ]
+                worksheet.spreadsheet.batch_update({"requests": requests})
+            if changed:
+                last_column = len(header)
+                data = [
+                    {
+                        "range": f"{rowcol_to_a1(start + 2, 1)}:{rowcol_to_a1(end + 1, last_column)}",
+                        "values": [row_by_key[key] for key in final_keys[start:end]],
+                    }
+                    for start, end in contiguous_runs(changed)
+                ]
+                worksheet.batch_update(data)
+        except Exception:
+            # the sheet no longer matches the snapshot, rewrite it fully next time
+            self.snapshots.clear(self.SpreadSheetID, worksheet.title)
+            raise
+        self.snapshots.save(
+            self.SpreadSheetID, worksheet.title, header, final_keys, [hash_by_key[key] for key in final_keys]
+        )
+        logger.info(
+            "%s: %s rows updated or added, %s rows deleted, %s unchanged.",
+            worksheet.title, len(changed), len(deleted), len(final_keys) - len(changed),
+        )
+
+    def create_holdings_sheet(self, df=None):
+        """
+        Creates a holdings worksheet and uploads holdings data
+
+        :param df: holdings DataFrame from this run, read from holdings.csv when omitted
         :return: True if successful, False otherwise
         """
         try:
@@ -138,56 +412,28 @@ class spreadsheetManager:
                 logger.error("Spreadsheet ID is not set. Please create a spreadsheet first.")
                 return False
 
-            # Validate CSV folder exists
-            if not os.path.exists(self.CSVFolderPath):
-                logger.error("CSV folder not found at %s", self.CSVFolderPath)
-                return False
-
-            # Open spreadsheet
-            sh = self.gc.open_by_key(self.SpreadSheetID)
-
-            # Check if holdings sheet already exists
-            try:
-                worksheet = sh.worksheet("Holdings")
-                logger.info("Holdings sheet already exists. Updating data...")
-            except WorksheetNotFound:
-                worksheet = sh.add_worksheet(title="Holdings", rows="100", cols="20")
-                logger.info("Created new Holdings worksheet.")
-
-            # Validate and read CSV file
-            holdings_csv_path = os.path.join(self.CSVFolderPath, "holdings.csv")
-            if not os.path.exists(holdings_csv_path):
-                logger.error("Holdings CSV file not found at %s", holdings_csv_path)
-                return False
+            # Holdings worksheet, created if it does not exist yet
+            worksheet = self.get_worksheet("Holdings")
+            logger.info("Updating Holdings sheet...")
 
             try:
-                df = pd.read_csv(holdings_csv_path)
+                if df is None:
+                    df = self.read_local_dataset("holdings")
+                    if df is None:
+                        return False
+                else:
+                    # the caller's frame is left untouched
+                    df = df.copy()
                 if df.empty:
-                    logger.warning("Holdings CSV file is empty.")
+                    logger.warning("Holdings data is empty.")
                     return False
-                # set columns to respective types and if null or NaN set to None
-                df["quantity"] = pd.to_numeric(df["quantity"], errors="coerce").where(pd.notnull(df["quantity"]), None)
-                # currency columns
-                df["average_share_price"] = pd.to_numeric(
-                    df["average_share_price"], errors="coerce"
-                ).where(pd.notnull(df["average_share_price"]), None)
-                df["total_cost"] = pd.to_numeric(df["total_cost"], errors="coerce").where(pd.notnull(df["total_cost"]), None)
-                df["current_value"] = pd.to_numeric(
-                    df["current_value"], errors="coerce"
-                ).where(pd.notnull(df["current_value"]), None)
-                df["unrealized_gain"] = pd.to_numeric(
-                    df["unrealized_gain"], errors="coerce"
-                ).where(pd.notnull(df["unrealized_gain"]), None)
-                # percentage columns
-                df["unrealized_gain_percent"] = (
-                    pd.to_numeric(df["unrealized_gain_percent"], errors="coerce") / 100
-                ).where(pd.notnull(df["unrealized_gain_percent"]), None)
-                df["maintenance_margin_percent"] = (
-                    pd.to_numeric(df["maintenance_margin_percent"], errors="coerce")
-                    / 100
-                ).where(pd.notnull(df["maintenance_margin_percent"]), None)
+                # percentage columns, M1 sends whole percents
+                df["unrealized_gain_percent"] = df["unrealized_gain_percent"] / 100
+                df["maintenance_margin_percent"] = df["maintenance_margin_percent"] / 100
+                # keep the typed values for Securities Info before blanking NaN
+                self.holdings_data = df[["symbol", "current_value"]].copy()
                 # Replace any remaining NaN with empty string for JSON compatibility
-                df = df.fillna('')
+                df = sheet_values(df, missing='')
             except pd.errors.EmptyDataError:
                 logger.error("Holdings CSV file is empty or invalid.")
                 return False
@@ -196,40 +442,12 @@ class spreadsheetManager:
                 return False
 
             # Upload data to sheet
-            worksheet.clear()  # Clear existing data
-            worksheet.update([df.columns.values.tolist()] + df.values.tolist())
+            self.write_worksheet(worksheet, df, row_keys(df, ["account_id", "symbol"]))
 
-            # format currency columns to USD
-            currency_format = {
-                "numberFormat": {"type": "CURRENCY", "pattern": "$#,##0.00"}
-            }
-            percentage_format = {
-                "numberFormat": {"type": "PERCENT", "pattern": "0.00%"}
-            }
-            currency_columns = [
-                "average_share_price",
-                "total_cost",
-                "current_value",
-                "unrealized_gain",
-            ]
-            percentage_columns = [
-                "unrealized_gain_percent",
-                "maintenance_margin_percent",
-            ]
-            for col in currency_columns:
-                if col in df.columns:
-                    col_index = df.columns.get_loc(col) + 1  # gspread is 1-indexed
-                    worksheet.format(
-                        f"{chr(64 + col_index)}2:{chr(64 + col_index)}{len(df)+1}",
-                        currency_format,
-                    )
-            for col in percentage_columns:
-                if col in df.columns:
-                    col_index = df.columns.get_loc(col) + 1  # gspread is 1-indexed
-                    worksheet.format(
-                        f"{chr(64 + col_index)}2:{chr(64 + col_index)}{len(df)+1}",
-                        percentage_format,
-                    )
+            # format currency columns to USD and percentage columns, sent with the other sheets' formats
+            self.pending_format_requests.extend(
+                number_format_requests(worksheet.id, df.columns, len(df), HOLDINGS_COLUMN_FORMATS)
+            )
             logger.info("Holdings sheet updated with data successfully.")
             return True
 
@@ -246,11 +464,12 @@ class spreadsheetManager:
             logger.exception("Unexpected error creating holdings sheet.")
             return False
 
-    def create_tax_lots_sheet(self, lot_type="open"):
+    def create_tax_lots_sheet(self, lot_type="open", df=None):
         """
-        Creates a tax lots worksheet and uploads tax lots data from CSV
+        Creates a tax lots worksheet and uploads tax lots data
 
         :param lot_type: Type of tax lots ("open" or "closed")
+        :param df: tax lots DataFrame from this run, read from the lot type's CSV when omitted
         :return: True if successful, False otherwise
         """
         try:
@@ -263,60 +482,26 @@ class spreadsheetManager:
                 logger.error("Invalid lot_type: %s. Must be 'open' or 'closed'.", lot_type)
                 return False
 
-            # Validate CSV folder exists
-            if not os.path.exists(self.CSVFolderPath):
-                logger.error("CSV folder not found at %s", self.CSVFolderPath)
-                return False
-
-            # Open spreadsheet
-            sh = self.gc.open_by_key(self.SpreadSheetID)
-
             # Determine sheet title
             sheet_title = "Open Tax Lots" if lot_type == "open" else "Closed Tax Lots"
 
-            # Check if tax lots sheet already exists
-            try:
-                worksheet = sh.worksheet(sheet_title)
-                logger.info("%s sheet already exists. Updating data...", sheet_title)
-            except WorksheetNotFound:
-                worksheet = sh.add_worksheet(title=sheet_title, rows="100", cols="20")
-                logger.info("Created new %s worksheet.", sheet_title)
-
-            # Validate and read CSV file
-            tax_lots_csv_path = os.path.join(
-                self.CSVFolderPath, f"{lot_type}_tax_lots.csv"
-            )
-            if not os.path.exists(tax_lots_csv_path):
-                logger.error(
-                    "%s tax lots CSV file not found at %s",
-                    lot_type.capitalize(),
-                    tax_lots_csv_path,
-                )
-                return False
+            # tax lots worksheet, created if it does not exist yet
+            worksheet = self.get_worksheet(sheet_title)
+            logger.info("Updating %s sheet...", sheet_title)
 
             try:
-                df = pd.read_csv(tax_lots_csv_path)
+                if df is None:
+                    df = self.read_local_dataset(f"{lot_type}_tax_lots")
+                    if df is None:
+                        return False
+                else:
+                    # the caller's frame is left untouched
+                    df = df.copy()
                 if df.empty:
-                    logger.warning("%s tax lots CSV file is empty.", lot_type.capitalize())
+                    logger.warning("%s tax lots data is empty.", lot_type.capitalize())
                     return False
-                # column cleanup and type setting
-                df["symbol"] = df["symbol"].astype(str)
-                df["cusip"] = df["cusip"].astype(str)
-                df["acquisitionDate"] = df["acquisitionDate"].astype(str)
-                df["quantity"] = pd.to_numeric(df["quantity"], errors="coerce")
-                df["costBasis"] = pd.to_numeric(df["costBasis"], errors="coerce")
-                df["shortLongTermHolding"] = df["shortLongTermHolding"].astype(str)
-                df["unrealizedGainLoss"] = pd.to_numeric(
-                    df["unrealizedGainLoss"], errors="coerce"
-                )
-                df["closeDate"] = df["closeDate"].astype(str)
-                df["shortTermRealizedGainLoss"] = pd.to_numeric(
-                    df["shortTermRealizedGainLoss"], errors="coerce"
-                )
-                df["longTermRealizedGainLoss"] = pd.to_numeric(
-                    df["longTermRealizedGainLoss"], errors="coerce"
-                )
-                df["washSaleIndicator"] = df["washSaleIndicator"].astype("boolean")
+                # lot ids identify rows for delta updates but are not shown
+                keys = row_keys(df, ["id"])
 
                 # columns to remove
                 columns_to_remove = ["id", "__typename"]
@@ -326,7 +511,7 @@ class spreadsheetManager:
                 )
 
                 # fill NaN values with null
-                df.replace({pd.NA: None, np.nan: None}, inplace=True)
+                df = sheet_values(df)
 
             except pd.errors.EmptyDataError:
                 logger.error("%s tax lots CSV file is empty or invalid.", lot_type.capitalize())
@@ -336,26 +521,12 @@ class spreadsheetManager:
                 return False
 
             # Upload data to sheet
-            worksheet.clear()  # Clear existing data
-            worksheet.update([df.columns.values.tolist()] + df.values.tolist())
+            self.write_worksheet(worksheet, df, keys)
 
-            # format currency columns to USD
-            currency_format = {
-                "numberFormat": {"type": "CURRENCY", "pattern": "$#,##0.00"}
-            }
-            currency_columns = [
-                "costBasis",
-                "unrealizedGainLoss",
-                "shortTermRealizedGainLoss",
-                "longTermRealizedGainLoss",
-            ]
-            for col in currency_columns:
-                if col in df.columns:
-                    col_index = df.columns.get_loc(col) + 1  # gspread is 1-indexed
-                    worksheet.format(
-                        f"{chr(64 + col_index)}2:{chr(64 + col_index)}{len(df)+1}",
-                        currency_format,
-                    )
+            # format currency columns to USD, sent with the other sheets' formats
+            self.pending_format_requests.extend(
+                number_format_requests(worksheet.id, df.columns, len(df), TAX_LOTS_COLUMN_FORMATS)
+            )
             logger.info("%s sheet updated with data successfully.", sheet_title)
             return True
 
@@ -373,36 +544,42 @@ class spreadsheetManager:
             return False
         
     # method that generates a securities info sheet to track types of securities
-    def create_securities_info_sheet(self):
+    def create_securities_info_sheet(self, holdings_df=None):
         """
         Creates a securities info worksheet and uploads securities data from CSV that places the data in the sheet
         The sheet will need to be manually set up with the graphs.
 
-        :return: True if successful, False otherwise
+        :param holdings_df: holdings of this run, defaults to the data written by create_holdings_sheet.
+            The Holdings worksheet is only read back when neither is available.
+        :return: DataFrame of symbols and current values, or None if failed
         """
         try:
             if not self.SpreadSheetID:
                 logger.error("Spreadsheet ID is not set. Please create a spreadsheet first.")
                 return False
 
-            # fetch the holdings spreadsheet (verify it exists first)
-            sh = self.gc.open_by_key(self.SpreadSheetID)
-            try:
-                sec_worksheet = sh.worksheet("Securities Info")
-                logger.info("Securities Info sheet exists. Updating data...")
-            except WorksheetNotFound:
-                sec_worksheet = sh.add_worksheet(
-                    title="Securities Info", rows="100", cols="20"
-                )
-                logger.info("Created new Securities Info worksheet.")
+            # make sure the Securities Info worksheet exists
+            self.get_worksheet("Securities Info")
             try:
-                holdings_worksheet = sh.worksheet("Holdings")
-                # grab the symbol and current value columns from holdings
-                holdings_data = pd.DataFrame(holdings_worksheet.get_all_records())
+                holdings_data = holdings_df if holdings_df is not None else self.holdings_data
+                if holdings_data is None:
+                    logger.info("No local holdings data. Reading the Holdings sheet instead.")
+                    holdings_worksheet = self.resolve_worksheets([]).get("Holdings")
+                    if holdings_worksheet is None:
+                        raise WorksheetNotFound("Holdings")
+                    # unformatted values so currency cells come back as numbers
+                    holdings_data = pd.DataFrame(
+                        holdings_worksheet.get_all_records(value_render_option="UNFORMATTED_VALUE")
+                    )
                 if holdings_data.empty:
-                    logger.warning("Holdings sheet is empty. Cannot create Securities Info sheet.")
+                    logger.warning("Holdings data is empty. Cannot create Securities Info sheet.")
                     return None
                 securities_info = holdings_data[["symbol", "current_value"]].copy()
+                securities_info["symbol"] = securities_info["symbol"].astype(object)
+                securities_info["current_value"] = pd.to_numeric(securities_info["current_value"], errors="coerce")
+                # one row per symbol when several accounts hold it
+                if securities_info["symbol"].duplicated().any():
+                    securities_info = securities_info.groupby("symbol", sort=False, as_index=False)["current_value"].sum(min_count=1)
                 # remove holdings with zero current value or is null or NaN
                 securities_info = securities_info[
                     (securities_info["current_value"].notnull())
@@ -443,6 +620,15 @@ class spreadsheetManager:
                 logger.warning("Securities info DataFrame is empty. Cannot generate security types.")
                 return securities_info_df
 
+            if self.metadata_cache is not None:
+                # only symbols missing from the cache are looked up
+                security_types = self.metadata_cache.lookup(
+                    securities_info_df["symbol"], "quoteType", lambda symbol: yf.Ticker(symbol).info, default="Unknown"
+                )
+                securities_info_df["security_type"] = securities_info_df["symbol"].map(security_types)
+                logger.info("Security types fetched and added to DataFrame.")
+                return securities_info_df
+
             def fetch_security_type(symbol):
                 try:
                     ticker = yf.Ticker(symbol)
@@ -479,13 +665,10 @@ class spreadsheetManager:
                 logger.warning("Securities info DataFrame is empty. Cannot update sheet.")
                 return False
 
-            # Open spreadsheet
-            sh = self.gc.open_by_key(self.SpreadSheetID)
-            sec_worksheet = sh.worksheet("Securities Info")
+            sec_worksheet = self.get_worksheet("Securities Info")
 
             # Upload data to sheet
-            sec_worksheet.clear()  # Clear existing data
-            sec_worksheet.update([securities_info_df.columns.values.tolist()] + securities_info_df.values.tolist())
+            self.write_worksheet(sec_worksheet, securities_info_df, row_keys(securities_info_df, ["symbol"]))
 
             logger.info("Securities Info sheet updated with %s rows.", len(securities_info_df))
             return True
@@ -503,16 +686,44 @@ class spreadsheetManager:
             logger.exception("Unexpected error updating securities info sheet.")
             return False
 
-    def run(self):
+    def apply_formats(self):
+        """
+        Sends the number formats queued by the create_*_sheet methods for all
+        worksheets in a single spreadsheets.batchUpdate
+
+        :return: True if successful or nothing was queued, False otherwise
+        """
+        if not self.pending_format_requests:
+            return True
+        requests, self.pending_format_requests = self.pending_format_requests, []
+        try:
+            self.fetch_spreadsheet().batch_update({"requests": requests})
+            logger.info("Applied %s column formats in one request.", len(requests))
+            return True
+        except APIError:
+            logger.exception("Google Sheets API error while formatting columns.")
+            return False
+        except Exception:
+            logger.exception("Unexpected error formatting columns.")
+            return False
+
+    def run(self, include_tax_lots=True, frames=None):
         """
         Main execution method that creates spreadsheet and uploads all data
 
+        :param include_tax_lots: set to False to only refresh holdings and securities info
+        :param frames: DataFrames fetched in this run keyed by "holdings", "open" and "closed".
+            Datasets missing from it are read from the CSV folder instead.
         :return: True if successful, False otherwise
         """
+        frames = frames or {}
+        self.pending_format_requests = []
+        self.holdings_data = None
         try:
             logger.info("Starting Google Sheets data upload process...")
-            # Authenticate Google Sheets
-            self.gc = self.authenticate_google_sheets()
+            # Authenticate Google Sheets, a long-running process keeps the client between runs
+            if self.gc is None:
+                self.gc = self.authenticate_google_sheets()
             if not self.gc:
                 logger.error("Google Sheets authentication failed. Aborting.")
                 return False
@@ -521,6 +732,11 @@ class spreadsheetManager:
             if not sh:
                 logger.error("Failed to fetch spreadsheet. Aborting.")
                 return False
+            # every worksheet of this run is looked up, and created if missing, at once
+            titles = ["Holdings", "Securities Info"]
+            if self.generateTaxLotsSheets and include_tax_lots:
+                titles += ["Open Tax Lots", "Closed Tax Lots"]
+            self.resolve_worksheets(titles)
 
             # Create or get spreadsheet
             # spreadsheet_id = self.create_spreadsheet()
@@ -530,20 +746,26 @@ class spreadsheetManager:
 
             # Create holdings sheet
             logger.info("Creating holdings sheet...")
-            holdings_created = self.create_holdings_sheet()
+            results = []
+            holdings_created = self.create_holdings_sheet(frames.get("holdings"))
+            results.append(holdings_created)
             if not holdings_created:
                 logger.warning("Failed to create holdings sheet, but continuing...")
 
             # Create tax lots sheets if requested
-            if self.generateTaxLotsSheets:
+            if self.generateTaxLotsSheets and include_tax_lots:
                 logger.info("Creating tax lots sheets...")
-                open_tax_lots_created = self.create_tax_lots_sheet(lot_type="open")
+                open_tax_lots_created = self.create_tax_lots_sheet(lot_type="open", df=frames.get("open"))
+                results.append(open_tax_lots_created)
                 if not open_tax_lots_created:
                     logger.warning("Failed to create open tax lots sheet, but continuing...")
 
-                closed_tax_lots_created = self.create_tax_lots_sheet(lot_type="closed")
+                closed_tax_lots_created = self.create_tax_lots_sheet(lot_type="closed", df=frames.get("closed"))
+                results.append(closed_tax_lots_created)
                 if not closed_tax_lots_created:
                     logger.warning("Failed to create closed tax lots sheet, but continuing...")
+            elif not include_tax_lots:
+                logger.info("Tax lots sheets not refreshed in this run.")
             else:
                 logger.info("Tax lots sheets creation skipped (generateTaxLotsSheets=False)")
                 
@@ -557,12 +779,20 @@ class spreadsheetManager:
                 securities_info_df = self.generate_securities_type_column(securities_info_created)
                 # combine with sheet
                 combined_success = self.combine_securities_info_with_sheet(securities_info_df)
+                results.append(combined_success)
                 if not combined_success:
                     logger.warning("Failed to update securities info sheet with data, but continuing...")
 
+            if not self.apply_formats():
+                results.append(False)
+                logger.warning("Failed to format columns, but continuing...")
+            if not all(results):
+                self.reset_spreadsheet_cache()
+
             logger.info("Google Sheets data upload process completed.")
             return True
 
         except Exception:
             logger.exception("Critical error in run method.")
+            self.reset_spreadsheet_cache()
             return False